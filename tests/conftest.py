@@ -0,0 +1,87 @@
+import hashlib
+import threading
+
+import numpy as np
+import pytest
+
+
+def make_events(inventory=None, position=(0.0, 64.0, 0.0), elapsed_time=20, biome="plains"):
+    """
+    Events of one env step in the format returned by the mineflayer server,
+    a single final observe event
+    """
+    x, y, z = position
+    return [
+        [
+            "observe",
+            {
+                "status": {
+                    "position": {"x": x, "y": y, "z": z},
+                    "biome": biome,
+                    "timeOfDay": "day",
+                    "health": 20.0,
+                    "food": 20.0,
+                    "equipment": {},
+                    "inventoryUsed": len(inventory or {}),
+                    "entities": {},
+                    "elapsedTime": elapsed_time,
+                },
+                "inventory": dict(inventory or {}),
+                "voxels": [],
+                "nearbyChests": {},
+                "blockRecords": [],
+            },
+        ]
+    ]
+
+
+class FakeEmbeddings:
+    """
+    Deterministic stand-in for OpenAIEmbeddings. While block is cleared,
+    embed_documents waits for it, so tests can hold an ingest mid-embedding.
+    """
+
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.block = threading.Event()
+        self.block.set()
+        self.embedding_started = threading.Event()
+        self.documents = []
+        self.queries = []
+
+    @staticmethod
+    def embed(text):
+        # unrelated texts get nearly orthogonal vectors
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % 2**32
+        return np.random.default_rng(seed).standard_normal(32).tolist()
+
+    def embed_documents(self, texts):
+        self.embedding_started.set()
+        assert self.block.wait(timeout=10)
+        self.documents.append(list(texts))
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.embed(text)
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """
+    Agents with embeddings and skill descriptions that need no api calls
+    """
+    import voyager.agents.curriculum as curriculum
+    import voyager.agents.skill as skill
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(skill, "OpenAIEmbeddings", lambda: embeddings)
+    monkeypatch.setattr(curriculum, "OpenAIEmbeddings", lambda: embeddings)
+    monkeypatch.setattr(
+        skill.SkillManager,
+        "generate_skill_description",
+        lambda self, name, code: f"async function {name}(bot) {{\n    // {name}\n}}",
+    )
+    return embeddings
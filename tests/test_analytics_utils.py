@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from voyager.utils import EventLog, export_event_columns
+import voyager.utils as U
+
+from .conftest import make_events
+
+
+def write_log(ckpt_dir, inventories, start=0):
+    log = EventLog(os.path.join(ckpt_dir, "events"))
+    for i, inventory in enumerate(inventories, start):
+        log.append(f"task {i}", make_events(inventory, position=(float(i), 64.0, 0.0)))
+
+
+def test_columns_from_event_log(tmp_path):
+    ckpt_dir = str(tmp_path)
+    write_log(ckpt_dir, [{"oak_log": 1}, {"oak_log": 2, "wooden_pickaxe": 1}, {}])
+
+    columns = export_event_columns(ckpt_dir)
+
+    assert columns.n_iterations == 3
+    assert len(columns) == 3
+    assert columns.tasks == ["task 0", "task 1", "task 2"]
+    assert columns.iteration.tolist() == [1, 2, 3]
+    assert columns.tick.tolist() == [20, 40, 60]
+    assert columns.x.tolist() == [0.0, 1.0, 2.0]
+    assert columns.first_acquired(["oak_log", "wooden_pickaxe", "stone"]) == {
+        "oak_log": 20,
+        "wooden_pickaxe": 40,
+        "stone": None,
+    }
+    summary = columns.summary()
+    assert summary["ticks"] == 60
+    assert summary["items"] == 2
+    assert summary["tech_tree"]["wooden_tool"] == 40
+    assert summary["tech_tree"]["stone_tool"] is None
+    xs, counts = columns.discovery_curve()
+    assert xs.tolist() == [20, 40]
+    assert counts.tolist() == [1, 2]
+    assert columns.ticks_by_task() == {"task 0": 20, "task 1": 20, "task 2": 20}
+
+
+def test_cache_is_extended_incrementally(tmp_path):
+    ckpt_dir = str(tmp_path)
+    write_log(ckpt_dir, [{"oak_log": 1}, {"dirt": 1}])
+    first = export_event_columns(ckpt_dir)
+    cache_path = os.path.join(ckpt_dir, "events", "columns.npz")
+    assert os.path.exists(cache_path)
+
+    write_log(ckpt_dir, [{"stone": 1}], start=2)
+    extended = export_event_columns(ckpt_dir)
+    rebuilt = export_event_columns(ckpt_dir, use_cache=False)
+
+    assert first.n_iterations == 2
+    assert extended.n_iterations == 3
+    assert extended.items == rebuilt.items == ["oak_log", "dirt", "stone"]
+    assert np.array_equal(extended.inventory, rebuilt.inventory)
+    assert extended.tick.tolist() == rebuilt.tick.tolist()
+    assert extended.elapsed_time == rebuilt.elapsed_time == 60
+
+
+def test_corrupt_cache_is_rebuilt(tmp_path):
+    ckpt_dir = str(tmp_path)
+    write_log(ckpt_dir, [{"oak_log": 1}])
+    export_event_columns(ckpt_dir)
+    U.dump_text("garbage", os.path.join(ckpt_dir, "events", "columns.npz"))
+
+    assert export_event_columns(ckpt_dir).n_iterations == 1
+
+
+def test_legacy_layout_is_read_without_caching(tmp_path):
+    ckpt_dir = str(tmp_path)
+    U.f_mkdir(ckpt_dir, "events")
+    for i in range(2):
+        U.dump_json(
+            make_events({f"item_{i}": 1}),
+            f"{ckpt_dir}/events/task {i}_20230101_00000{i}",
+        )
+
+    columns = export_event_columns(ckpt_dir)
+
+    assert columns.n_iterations == 2
+    assert columns.tasks == ["task 0", "task 1"]
+    assert columns.items == ["item_0", "item_1"]
+    assert not os.path.exists(os.path.join(ckpt_dir, "events", "columns.npz"))
+    assert not os.path.exists(os.path.join(ckpt_dir, "events", "index.jsonl"))
@@ -0,0 +1,203 @@
+import os
+import threading
+
+import pytest
+
+from voyager.utils import checkpoint_utils
+from voyager.utils.checkpoint_utils import (
+    CheckpointManager,
+    atomic_dump_json,
+    atomic_dump_text,
+    text_hash,
+)
+import voyager.utils as U
+
+
+def test_atomic_dump_replaces_file(tmp_path):
+    path = str(tmp_path / "data.json")
+    atomic_dump_json({"a": 1}, path)
+    atomic_dump_json({"a": 2}, path)
+    assert U.load_json(path) == {"a": 2}
+    assert os.listdir(tmp_path) == ["data.json"]
+
+
+def test_atomic_dump_keeps_old_file_on_failure(tmp_path):
+    path = str(tmp_path / "data.txt")
+    atomic_dump_text("old", path)
+    with pytest.raises(TypeError):
+        atomic_dump_text(b"not text", path)
+    assert U.load_text(path) == "old"
+    assert os.listdir(tmp_path) == ["data.txt"]
+
+
+def test_mark_dirty_coalesces_writes(tmp_path):
+    checkpoint = CheckpointManager(str(tmp_path), interval=0.2)
+    calls = []
+    export_started = threading.Event()
+    release = threading.Event()
+
+    def export():
+        calls.append(len(calls))
+        export_started.set()
+        assert release.wait(timeout=5)
+
+    checkpoint.register_export("export", export)
+    checkpoint.mark_dirty("export")
+    assert export_started.wait(timeout=5)
+    # updates arriving while the first export runs are written once more
+    for _ in range(50):
+        checkpoint.mark_dirty("export")
+    release.set()
+    checkpoint.flush()
+    assert calls == [0, 1]
+
+
+def test_snapshot_is_taken_at_mark_time(tmp_path):
+    checkpoint = CheckpointManager(str(tmp_path), interval=10)
+    state = {"value": 1}
+    path = str(tmp_path / "state.json")
+    checkpoint.register("state", path, lambda: dict(state))
+
+    checkpoint.mark_dirty("state")
+    state["value"] = 2
+    # flush wakes the worker without waiting for the interval
+    checkpoint.flush()
+    assert U.load_json(path) == {"value": 1}
+
+    checkpoint.mark_dirty("state")
+    checkpoint.flush()
+    assert U.load_json(path) == {"value": 2}
+
+
+def test_foreground_writes_immediately(tmp_path):
+    checkpoint = CheckpointManager(str(tmp_path), background=False)
+    path = str(tmp_path / "state.json")
+    checkpoint.register("state", path, lambda: [1, 2])
+    checkpoint.mark_dirty("state")
+    assert U.load_json(path) == [1, 2]
+    assert checkpoint.worker is None
+
+    record_path = str(tmp_path / "record.json")
+    checkpoint.write(record_path, {"x": 1})
+    assert U.load_json(record_path) == {"x": 1}
+
+
+def test_worker_survives_failed_write(tmp_path):
+    checkpoint = CheckpointManager(str(tmp_path), interval=0)
+
+    def export():
+        raise RuntimeError("disk full")
+
+    checkpoint.register_export("broken", export)
+    checkpoint.mark_dirty("broken")
+    checkpoint.flush()
+
+    path = str(tmp_path / "record.json")
+    checkpoint.write(path, {"x": 1})
+    checkpoint.flush()
+    assert U.load_json(path) == {"x": 1}
+
+
+def committed_batch(checkpoint, state):
+    for name in state:
+        checkpoint.mark_dirty(name)
+
+
+def make_checkpoint(ckpt_dir, state):
+    checkpoint = CheckpointManager(str(ckpt_dir), background=False)
+    for name in state:
+        checkpoint.register(name, str(ckpt_dir / f"{name}.json"), lambda name=name: state[name])
+    return checkpoint
+
+
+def test_manifest_names_the_committed_batch(tmp_path):
+    state = {"a": [1], "b": [2]}
+    checkpoint = make_checkpoint(tmp_path, state)
+    checkpoint.commit({name: (str(tmp_path / f"{name}.json"), data) for name, data in state.items()})
+
+    manifest = U.load_json(str(tmp_path / "checkpoint.json"))
+    assert manifest["generation"] == 1
+    assert set(manifest["files"]) == {"a.json", "b.json"}
+    assert manifest["files"]["a.json"]["hash"] == text_hash("[1]")
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "b.json", "checkpoint.json"]
+
+
+def test_crash_before_manifest_keeps_previous_batch(tmp_path, monkeypatch):
+    state = {"a": [1], "b": [2]}
+    checkpoint = make_checkpoint(tmp_path, state)
+    committed_batch(checkpoint, state)
+    state.update(a=[10], b=[20])
+
+    def crash(data, path):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(checkpoint_utils, "atomic_dump_json", crash)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoint.commit({name: (str(tmp_path / f"{name}.json"), state[name]) for name in state})
+    monkeypatch.undo()
+
+    resumed = make_checkpoint(tmp_path, state)
+    assert resumed.load_json(str(tmp_path / "a.json")) == [1]
+    assert resumed.load_json(str(tmp_path / "b.json")) == [2]
+    # temp files of the uncommitted batch are removed on register
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "b.json", "checkpoint.json"]
+
+
+def test_crash_after_manifest_is_rolled_forward(tmp_path, monkeypatch):
+    state = {"a": [1], "b": [2]}
+    checkpoint = make_checkpoint(tmp_path, state)
+    committed_batch(checkpoint, state)
+    replace = os.replace
+    calls = []
+
+    def crash_after_manifest(src, dst):
+        calls.append(dst)
+        # the manifest and the first file are replaced, then the process dies
+        if len(calls) > 2:
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(checkpoint_utils.os, "replace", crash_after_manifest)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoint.commit(
+            {name: (str(tmp_path / f"{name}.json"), [n * 10]) for name, n in [("a", 1), ("b", 2)]}
+        )
+    monkeypatch.undo()
+    assert U.load_json(str(tmp_path / "b.json")) == [2]
+
+    resumed = make_checkpoint(tmp_path, state)
+    assert resumed.load_json(str(tmp_path / "a.json")) == [10]
+    assert resumed.load_json(str(tmp_path / "b.json")) == [20]
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "b.json", "checkpoint.json"]
+
+
+def test_exports_run_before_the_manifest(tmp_path):
+    checkpoint = CheckpointManager(str(tmp_path), background=False)
+    generations = []
+    checkpoint.register_export(
+        "export", lambda: generations.append(checkpoint.load_manifest()["generation"])
+    )
+    checkpoint.register("a", str(tmp_path / "a.json"), lambda: [1])
+    checkpoint.commit({"export": checkpoint.components["export"](), "a": checkpoint.components["a"]()})
+    assert generations == [0]
+    assert checkpoint.load_manifest()["generation"] == 1
+
+
+def test_managers_share_the_manifest(tmp_path):
+    first = CheckpointManager(str(tmp_path), background=False)
+    second = CheckpointManager(str(tmp_path), background=False)
+    first.register("a", str(tmp_path / "a.json"), lambda: [1])
+    second.register("b", str(tmp_path / "b.json"), lambda: [2])
+    first.mark_dirty("a")
+    second.mark_dirty("b")
+    assert set(first.load_manifest()["files"]) == {"a.json", "b.json"}
+
+
+def test_load_json_reports_external_changes(tmp_path, capsys):
+    checkpoint = CheckpointManager(str(tmp_path), background=False)
+    checkpoint.register("a", str(tmp_path / "a.json"), lambda: [1])
+    checkpoint.mark_dirty("a")
+    U.dump_json([2], str(tmp_path / "a.json"))
+
+    assert checkpoint.load_json(str(tmp_path / "a.json")) == [2]
+    assert "changed outside" in capsys.readouterr().out
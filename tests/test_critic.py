@@ -0,0 +1,27 @@
+from voyager.agents.critic import CriticAgent
+
+
+def response(success, critique=""):
+    return {"success": success, "critique": critique}
+
+
+def test_vote_takes_the_majority():
+    assert CriticAgent.vote([response(True), response(False, "craft more"), response(True)]) == (
+        True,
+        "",
+    )
+    assert CriticAgent.vote(
+        [response(False), response(False, "mine 2 more logs"), response(True)]
+    ) == (False, "mine 2 more logs")
+
+
+def test_vote_tie_is_a_failure():
+    assert CriticAgent.vote([response(True, "done"), response(False, "no table")]) == (
+        False,
+        "no table",
+    )
+
+
+def test_vote_of_a_single_response():
+    assert CriticAgent.vote([response(False, "find a cave")]) == (False, "find a cave")
+    assert CriticAgent.vote([response(True)]) == (True, "")
@@ -0,0 +1,199 @@
+import pytest
+from langchain.schema import AIMessage
+
+from voyager.agents.curriculum import CurriculumAgent
+from voyager.llm import token_metrics
+from voyager.utils import CurriculumStore
+import voyager.utils as U
+
+from .conftest import make_events
+
+
+def make_curriculum(ckpt_dir, resume=False, **kwargs):
+    return CurriculumAgent(
+        ckpt_dir=str(ckpt_dir),
+        resume=resume,
+        core_inventory_items=r".*_log|.*_pickaxe",
+        **kwargs,
+    )
+
+
+def test_qa_cache_exact_lookup_skips_the_embedding(tmp_path, fake_openai):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.add_qa_cache("How to mine wood in Minecraft?", "Answer: punch a tree")
+    fake_openai.documents.clear()
+
+    assert curriculum.lookup_qa_cache(
+        ["how to mine  wood in minecraft", "How to mine wood in Minecraft?"]
+    ) == ["How to mine wood in Minecraft?"] * 2
+    assert fake_openai.documents == []
+
+
+def test_qa_cache_misses_are_embedded_in_one_batch(tmp_path, fake_openai):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.add_qa_cache("How to mine wood in Minecraft?", "Answer: punch a tree")
+    fake_openai.documents.clear()
+
+    result = curriculum.lookup_qa_cache(
+        ["What is a creeper?", "How to mine wood in Minecraft?", "What is a zombie?"]
+    )
+
+    assert result == [None, "How to mine wood in Minecraft?", None]
+    assert fake_openai.documents == [["What is a creeper?", "What is a zombie?"]]
+
+
+def test_qa_cache_similarity_fallback(tmp_path, fake_openai):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.add_qa_cache("How to mine wood in Minecraft?", "Answer: punch a tree")
+    # only the vectordb can answer now
+    curriculum.qa_cache_normalized.clear()
+
+    assert curriculum.lookup_qa_cache(["How to mine wood in Minecraft?"]) == [
+        "How to mine wood in Minecraft?"
+    ]
+
+
+def test_task_context_uses_the_cache(tmp_path, fake_openai, monkeypatch):
+    curriculum = make_curriculum(tmp_path)
+    answers = []
+    monkeypatch.setattr(
+        curriculum,
+        "run_qa_step2_answer_questions",
+        lambda question: answers.append(question) or "Answer: punch a tree",
+    )
+
+    first = curriculum.get_task_context("Mine 1 wood log")
+    assert curriculum.get_task_context("Mine 1 wood log") == first
+    assert answers == ["How to mine 1 wood log in Minecraft?"]
+
+
+def test_resume_restores_qa_cache(tmp_path, fake_openai):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.add_qa_cache("How to mine wood in Minecraft?", "Answer: punch a tree")
+    curriculum.save()
+    # added after the last vectordb persist
+    curriculum.add_qa_cache("What is a creeper?", "Answer: a mob")
+
+    resumed = make_curriculum(tmp_path, resume=True)
+
+    assert resumed.qa_cache == curriculum.qa_cache
+    assert resumed.qa_cache_questions_vectordb._collection.count() == 2
+    assert resumed.lookup_qa_cache(["what is a creeper"]) == ["What is a creeper?"]
+
+
+def test_failures_of_completed_tasks_are_not_recorded(tmp_path, fake_openai):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.update_exploration_progress({"task": "Mine 1 wood log", "success": False})
+    curriculum.update_exploration_progress({"task": "Mine 1 wood log", "success": True})
+    curriculum.update_exploration_progress({"task": "Mine 1 wood log", "success": False})
+    curriculum.update_exploration_progress({"task": "Craft 1 table", "success": False})
+
+    assert curriculum.completed_tasks == ["Mine 1 wood log"]
+    assert curriculum.failed_tasks == ["Craft 1 table"]
+    assert U.load_json(f"{tmp_path}/curriculum/failed_tasks.json") == ["Craft 1 table"]
+
+    resumed = make_curriculum(tmp_path, resume=True)
+    assert resumed.failed_tasks == ["Craft 1 table"]
+
+
+def test_resume_drops_failures_of_completed_tasks(tmp_path, fake_openai):
+    U.f_mkdir(f"{tmp_path}/curriculum")
+    store = CurriculumStore(f"{tmp_path}/curriculum/curriculum.db")
+    store.replace_tasks(["Mine 1 wood log"], ["Mine 1 wood log", "Craft 1 table"])
+    store.close()
+
+    curriculum = make_curriculum(tmp_path, resume=True)
+
+    assert curriculum.completed_tasks == ["Mine 1 wood log"]
+    assert curriculum.failed_tasks == ["Craft 1 table"]
+    assert curriculum.store.load_tasks()[1] == ["Craft 1 table"]
+
+
+def test_resume_imports_json_checkpoint(tmp_path, fake_openai):
+    U.f_mkdir(f"{tmp_path}/curriculum")
+    U.dump_json(["Mine 1 wood log"], f"{tmp_path}/curriculum/completed_tasks.json")
+    U.dump_json(["Craft 1 table"], f"{tmp_path}/curriculum/failed_tasks.json")
+    U.dump_json({"What is a creeper?": "Answer: a mob"}, f"{tmp_path}/curriculum/qa_cache.json")
+
+    curriculum = make_curriculum(tmp_path, resume=True)
+
+    assert curriculum.completed_tasks == ["Mine 1 wood log"]
+    assert curriculum.failed_tasks == ["Craft 1 table"]
+    assert curriculum.lookup_qa_cache(["what is a creeper"]) == ["What is a creeper?"]
+
+
+def word_count(messages):
+    return sum(len(message.content.split()) for message in messages)
+
+
+def test_prompt_is_compacted_in_priority_order(tmp_path, fake_openai, monkeypatch):
+    events = U.parse_events(make_events()).replace_observation(
+        voxels=[f"block_{i}" for i in range(40)]
+    )
+    curriculum = make_curriculum(tmp_path)
+    curriculum.failed_tasks = [f"Craft {i} tables" for i in range(30)]
+    monkeypatch.setattr(curriculum.llm, "count_tokens", word_count)
+    token_metrics.pop()
+    full = curriculum.render_human_message(events=events, chest_observation="")
+    system_tokens = word_count([curriculum.render_system_message()])
+
+    # summarizing the task lists is enough
+    curriculum.token_budget = system_tokens + len(full.content.split()) - 50
+    compacted = curriculum.render_human_message(events=events, chest_observation="")
+    assert "and 20 earlier tasks" in compacted.content
+    assert "block_39" in compacted.content
+
+    # the block lists are capped last
+    curriculum.token_budget = system_tokens
+    compacted = curriculum.render_human_message(events=events, chest_observation="")
+    assert "and 20 more" in compacted.content
+    assert token_metrics.pop()["curriculum"]["compactions"] == 2
+
+
+def test_prompt_within_budget_is_not_compacted(tmp_path, fake_openai, monkeypatch):
+    curriculum = make_curriculum(tmp_path)
+    curriculum.failed_tasks = [f"Craft {i} tables" for i in range(30)]
+    monkeypatch.setattr(curriculum.llm, "count_tokens", word_count)
+    token_metrics.pop()
+    full = curriculum.render_human_message(events=make_events(), chest_observation="")
+
+    curriculum.token_budget = 10**6
+    assert curriculum.render_human_message(events=make_events(), chest_observation="") == full
+    assert "curriculum" not in token_metrics.pop()
+
+
+def test_first_valid_task_is_taken(tmp_path, fake_openai, monkeypatch):
+    curriculum = make_curriculum(tmp_path, samples=4)
+    sampled = []
+    candidates = [
+        "Reasoning: no task",
+        "Task: Mine 1 wood log.",
+        "Task: Craft 1 crafting table",
+        "Task: Craft 1 crafting table",
+    ]
+    monkeypatch.setattr(
+        curriculum.llm,
+        "sample",
+        lambda messages, n: sampled.append(n) or [AIMessage(content=c) for c in candidates],
+    )
+    monkeypatch.setattr(curriculum, "get_task_context", lambda task: f"context of {task}")
+
+    assert curriculum.propose_next_ai_task(messages=[]) == (
+        "Mine 1 wood log",
+        "context of Mine 1 wood log",
+    )
+    assert sampled == [4]
+
+
+def test_unparsable_proposals_are_sampled_again(tmp_path, fake_openai, monkeypatch):
+    curriculum = make_curriculum(tmp_path, samples=2)
+    sampled = []
+    monkeypatch.setattr(
+        curriculum.llm,
+        "sample",
+        lambda messages, n: sampled.append(n) or [AIMessage(content="Reasoning: ...")] * n,
+    )
+
+    with pytest.raises(RuntimeError, match="Max retries"):
+        curriculum.propose_next_ai_task(messages=[], max_retries=3)
+    assert sampled == [2, 2, 2]
@@ -0,0 +1,146 @@
+import copy
+import gc
+import json
+import pickle
+import tracemalloc
+
+import pytest
+
+from voyager.utils import (
+    Events,
+    FrozenDict,
+    FrozenList,
+    freeze,
+    loads_frozen,
+    parse_events,
+    render_metrics,
+    replace_observation,
+)
+
+from .conftest import make_events
+
+
+def test_frozen_values_are_immutable():
+    frozen = freeze({"a": [1, {"b": 2}]})
+    assert isinstance(frozen, FrozenDict)
+    assert isinstance(frozen["a"], FrozenList)
+    with pytest.raises(TypeError):
+        frozen["c"] = 3
+    with pytest.raises(TypeError):
+        frozen["a"].append(3)
+    with pytest.raises(TypeError):
+        frozen["a"][1].update(b=3)
+
+
+def test_frozen_values_behave_like_json():
+    data = {"a": [1, {"b": [2, 3]}], "c": None}
+    frozen = loads_frozen(json.dumps(data))
+    assert frozen == data
+    assert json.loads(json.dumps(frozen)) == data
+    assert copy.deepcopy(frozen) is frozen
+    assert copy.copy(frozen["a"]) is frozen["a"]
+    unpickled = pickle.loads(pickle.dumps(frozen))
+    assert unpickled == data
+    assert isinstance(unpickled, FrozenDict)
+
+
+def test_replace_shares_unchanged_values():
+    events = freeze(make_events({"dirt": 1}))
+    replaced = replace_observation(events, inventory={"stone": 2})
+
+    assert replaced[-1][1]["inventory"] == {"stone": 2}
+    assert replaced[-1][1]["status"] is events[-1][1]["status"]
+    assert events[-1][1]["inventory"] == {"dirt": 1}
+
+
+def server_events(n):
+    """
+    Events with every status field sent by the mineflayer server
+    """
+    events = []
+    for i in range(n):
+        [[event_type, event]] = make_events({"oak_log": i}, position=(float(i), 64.0, 0.0))
+        event["status"].update(
+            saturation=5.0,
+            oxygen=20,
+            velocity={"x": 0.0, "y": -0.08, "z": 0.0},
+            yaw=1.5,
+            pitch=0.0,
+            onGround=True,
+            name="bot",
+            isInWater=False,
+        )
+        event["voxels"] = ["dirt", "grass_block", "oak_log"]
+        events.append([event_type, event])
+    return events
+
+
+def test_parse_events():
+    events = [["onChat", {**make_events()[0][1], "onChat": "hello"}]] + make_events(
+        {"dirt": 1}, position=(1.0, 2.0, 3.0)
+    )
+    parsed = parse_events(events)
+
+    assert parsed == events
+    assert parse_events(parsed) is parsed
+    assert parse_events(json.dumps(events)) == events
+    assert parsed.chat_messages == ["hello"]
+    assert parsed.observation.position == (1.0, 2.0, 3.0)
+    assert parsed.observation.inventory == {"dirt": 1}
+    assert isinstance(pickle.loads(pickle.dumps(parsed)), Events)
+
+    replaced = parsed.replace_observation(inventory={})
+    assert replaced.observation.inventory == {}
+    assert replaced.observations[0] is parsed.observations[0]
+    assert replaced.observation.voxels is parsed.observation.voxels
+    assert parsed.observation.inventory == {"dirt": 1}
+
+
+def test_events_are_rebuilt_from_observations():
+    events = server_events(2)
+    parsed = parse_events(json.dumps(events))
+
+    assert json.loads(json.dumps(parsed.to_json())) == events
+    assert parsed.observations[0].extra_keys is parsed.observations[1].extra_keys
+
+
+def test_parsed_events_are_smaller_than_the_raw_events():
+    text = json.dumps(server_events(200))
+
+    def retained(parse):
+        gc.collect()
+        tracemalloc.start()
+        value = parse(text)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert value
+        return size
+
+    # the raw event dicts are dropped once parsed, only their values are kept
+    assert retained(parse_events) < 0.75 * retained(loads_frozen)
+
+
+def test_observation_render_is_cached():
+    events = parse_events(make_events({"dirt": 1}))
+    observation = events.replace_observation(voxels=["dirt", "stone"]).observation
+    render_metrics.reset()
+    first = observation.render("inventory")
+    assert observation.render("inventory") is first
+    assert "dirt" in first
+    # each argument is a section of its own
+    assert observation.render("nearby_blocks", 1) == "Nearby blocks: dirt and 1 more\n\n"
+    assert observation.render("nearby_blocks") == "Nearby blocks: dirt, stone\n\n"
+
+    metrics = render_metrics.pop()
+    assert (metrics["render_hits"], metrics["render_misses"]) == (1, 3)
+    assert render_metrics.pop()["render_misses"] == 0
+
+
+def test_replaced_observation_is_rendered_again():
+    events = parse_events(make_events({"dirt": 1}))
+    events.observation.render("inventory")
+    replaced = events.replace_observation(inventory={"stone": 1})
+
+    assert "stone" in replaced.observation.render("inventory")
+    assert "dirt" in events.observation.render("inventory")
@@ -0,0 +1,236 @@
+import itertools
+import threading
+import time
+
+import pytest
+from langchain.schema import AIMessage
+
+from voyager.llm import ChatModel, LLMClient, RateLimitScheduler, chat
+from voyager.llm.client import TokenBucket, is_retryable
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1)
+    assert bucket.wait_time(1, now + 1) == 0
+    # larger than the bucket, waits for a full bucket
+    assert bucket.wait_time(120, now + 1) == pytest.approx(59)
+    assert TokenBucket().wait_time(10**6, now) == 0
+
+
+def test_scheduler_admits_by_priority():
+    scheduler = RateLimitScheduler(max_concurrency=1)
+    scheduler.acquire(0, 0)
+    order = []
+
+    def run(priority):
+        scheduler.acquire(priority, 0)
+        order.append(priority)
+        scheduler.release()
+
+    threads = []
+    for priority in [3, 1, 2, 1]:
+        thread = threading.Thread(target=run, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        # wait for the thread to queue so ties keep their arrival order
+        wait_until(lambda: len(scheduler.waiting) == len(threads))
+    scheduler.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [1, 1, 2, 3]
+    assert scheduler.in_flight == 0
+
+
+def test_scheduler_limits_concurrency():
+    scheduler = RateLimitScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def run():
+        scheduler.acquire(0, 0)
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+        scheduler.release()
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert max(peak) == 2
+
+
+def test_scheduler_pause_holds_back_requests():
+    scheduler = RateLimitScheduler()
+    scheduler.pause(0.1)
+    start = time.monotonic()
+    scheduler.acquire(0, 0)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_is_retryable():
+    assert is_retryable(RateLimitError())
+    assert not is_retryable(ValueError())
+
+
+def test_request_retries_retryable_errors():
+    client = LLMClient(backoff_base=0.001)
+    calls = itertools.count()
+
+    def send():
+        if next(calls) < 2:
+            raise RateLimitError()
+        return "done", 5
+
+    assert client.request("critic", 10, send) == ("done", 5)
+    metrics = client.metrics.pop()["critic"]
+    assert metrics["requests"] == 3
+    assert metrics["retries"] == 2
+    assert metrics["rate_limited"] == 2
+    assert client.scheduler.in_flight == 0
+
+
+def test_request_raises_other_errors():
+    client = LLMClient(backoff_base=0.001)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        client.request("action", 10, send)
+    assert len(calls) == 1
+    assert client.scheduler.in_flight == 0
+
+
+def test_request_gives_up_after_max_retries():
+    client = LLMClient(max_retries=2, backoff_base=0.001)
+
+    def send():
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        client.request("action", 10, send)
+    assert client.metrics.pop()["action"]["requests"] == 3
+
+
+def test_chat_models_share_one_connection_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    client = LLMClient()
+    first = client.chat_openai(model_name="gpt-4", request_timeout=120)
+    second = client.chat_openai(model_name="gpt-3.5-turbo", request_timeout=120)
+    other_timeout = client.chat_openai(model_name="gpt-4", request_timeout=30)
+
+    assert first.client is second.client
+    assert first.max_retries == 0
+    assert other_timeout.client is not first.client
+    assert len(client.clients) == 2
+    assert all(c._client is client.http_client for c in client.clients.values())
+
+
+def hedging_client(budget=1.0):
+    client = LLMClient()
+    client.configure_hedging(budget=budget, min_samples=1)
+    client.hedge_latencies[("action", "gpt-4")] = [0.05]
+    return client
+
+
+def test_hedged_request_duplicates_slow_request():
+    client = hedging_client()
+    calls = itertools.count()
+    cancels = []
+
+    def send(cancel):
+        cancels.append(cancel)
+        if next(calls) == 0:
+            assert cancel.wait(timeout=5)
+            return "slow", 0
+        return "fast", 0
+
+    assert client.hedged_request("action", "gpt-4", 10, send) == ("fast", 0)
+    assert cancels[0].wait(timeout=5)
+    assert not cancels[1].is_set()
+    metrics = client.metrics.pop()["action"]
+    assert metrics["hedges"] == 1
+    assert metrics["hedge_wins"] == 1
+
+
+def test_hedged_request_respects_budget():
+    client = hedging_client(budget=0)
+    calls = []
+
+    def send(cancel):
+        calls.append(cancel)
+        time.sleep(0.1)
+        return "slow", 0
+
+    assert client.hedged_request("action", "gpt-4", 10, send) == ("slow", 0)
+    assert len(calls) == 1
+    assert client.metrics.pop()["action"]["hedges"] == 0
+
+
+def test_hedged_request_without_latencies_is_not_hedged():
+    client = LLMClient()
+    client.configure_hedging(min_samples=1)
+
+    def send(cancel):
+        return "done", 0
+
+    assert client.hedged_request("critic", "gpt-4", 10, send) == ("done", 0)
+    assert len(client.hedge_latencies[("critic", "gpt-4")]) == 1
+
+
+class FakeChatOpenAI:
+    model_name = "gpt-4"
+    temperature = 0
+
+    def __init__(self, respond):
+        self.respond = respond
+
+    def __call__(self, messages):
+        return self.respond(messages)
+
+
+def test_plain_requests_are_hedged(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    client = hedging_client()
+    monkeypatch.setattr(chat, "llm_client", client)
+    monkeypatch.setattr(chat, "count_tokens", lambda text, model_name: len(text))
+    model = ChatModel("action", "gpt-4", streaming=False)
+    calls = itertools.count()
+    release = threading.Event()
+
+    def respond(messages):
+        if next(calls) == 0:
+            # the first request hangs until the duplicate has won
+            release.wait(timeout=5)
+            return AIMessage(content="slow")
+        return AIMessage(content="fast")
+
+    model.llm = FakeChatOpenAI(respond)
+    monkeypatch.setattr(model, "count_tokens", lambda messages: 1)
+
+    assert model([]).content == "fast"
+    release.set()
+    assert client.metrics.pop()["action"]["hedge_wins"] == 1
@@ -0,0 +1,38 @@
+from voyager.llm import ModelRouter, RouteMetrics, route_metrics
+
+
+class FakeModel:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+def test_model_router_escalates():
+    router = ModelRouter("test_route", FakeModel("fast"), FakeModel("strong"))
+    route_metrics.pop()
+
+    assert router(lambda m: (m.model_name, None), lambda m: m.model_name) == "fast"
+    assert (
+        router(lambda m: (m.model_name, "parse_failure"), lambda m: m.model_name)
+        == "strong"
+    )
+
+    stats = route_metrics.pop()["test_route"]
+    assert stats["calls"] == 2
+    assert stats["fast_hits"] == 1
+    assert stats["parse_failure"] == 1
+    assert stats["fast_hit_rate"] == 0.5
+    assert route_metrics.pop() == {}
+
+
+def test_route_metrics_keep_run_totals():
+    metrics = RouteMetrics()
+    metrics.record("critic")
+    metrics.record("critic", "low_confidence")
+    assert metrics.pop()["critic"]["total_fast_hit_rate"] == 0.5
+
+    metrics.record("critic")
+    stats = metrics.pop()["critic"]
+    assert stats["calls"] == 1
+    assert stats["fast_hit_rate"] == 1.0
+    assert stats["total_calls"] == 3
+    assert stats["total_fast_hit_rate"] == 2 / 3
@@ -0,0 +1,57 @@
+from langchain.schema import AIMessage
+
+from voyager.llm import (
+    ChatModel,
+    code_block_closed,
+    json_object_closed,
+    line_complete,
+    token_metrics,
+)
+
+
+def test_code_block_closed():
+    assert not code_block_closed("Explain: ...\n```javascript\nasync function a(bot) {")
+    assert code_block_closed("```javascript\nasync function a(bot) {}\n```")
+    assert code_block_closed("```js\n```")
+
+
+def test_json_object_closed():
+    assert not json_object_closed('{"reasoning": "a } in a string", ')
+    assert json_object_closed('{"a": {"b": "}"}, "c": 1}')
+    assert json_object_closed('Answer: {"success": true} trailing')
+    assert not json_object_closed('{"a": "\\"}"')
+
+
+def test_line_complete():
+    detect = line_complete("Task:")
+    assert not detect("Reasoning: ...\nTask: Mine 1 wood")
+    assert detect("Reasoning: ...\nTask: Mine 1 wood log\n")
+
+
+class FakeStreamingLLM:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = []
+        self.closed = False
+
+    def stream(self, messages):
+        try:
+            for chunk in self.chunks:
+                self.sent.append(chunk)
+                yield AIMessage(content=chunk)
+        finally:
+            self.closed = True
+
+
+def test_stream_stops_once_the_detector_fires(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    model = ChatModel("action", "gpt-4", streaming=True)
+    model.llm = FakeStreamingLLM(["Plan\n```js\n", "async function a(bot) {}\n", "```", " and more"])
+    token_metrics.pop()
+
+    message = model.stream([], stop_when=code_block_closed)
+
+    assert message.content == "Plan\n```js\nasync function a(bot) {}\n```"
+    assert model.llm.closed
+    assert len(model.llm.sent) == 3
+    assert token_metrics.pop()["action"]["early_stops"] == 1
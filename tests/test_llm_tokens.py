@@ -0,0 +1,32 @@
+from langchain.schema import HumanMessage, SystemMessage
+
+from voyager.llm import TokenMetrics, count_message_tokens, tokens
+
+
+class WordEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+def test_message_tokens_include_the_chat_framing(monkeypatch):
+    monkeypatch.setattr(tokens, "get_encoding", lambda model_name: WordEncoding())
+    messages = [SystemMessage(content="be brief"), HumanMessage(content="mine one log")]
+    # 4 tokens of framing per message and 2 for the reply
+    assert count_message_tokens(messages) == 2 + 3 + 2 * 4 + 2
+
+
+def test_token_metrics_pop_counts_since_the_last_pop():
+    metrics = TokenMetrics()
+    metrics.record_call("action", prompt_tokens=100, completion_tokens=20)
+    metrics.record_call("action", prompt_tokens=50, completion_tokens=10)
+    metrics.record_compaction("curriculum")
+
+    recent = metrics.pop()
+    assert recent["action"]["calls"] == 2
+    assert recent["action"]["prompt_tokens"] == 150
+    assert recent["curriculum"]["compactions"] == 1
+    assert metrics.pop() == {}
+
+    metrics.record_call("action", prompt_tokens=1, completion_tokens=1)
+    assert metrics.totals["action"]["calls"] == 3
+    assert metrics.pop()["action"]["calls"] == 1
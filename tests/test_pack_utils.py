@@ -0,0 +1,71 @@
+import numpy as np
+
+from voyager.utils import PackedSkillLibrary, pack_skill_library
+import voyager.utils as U
+
+
+def test_pack_round_trip(tmp_path):
+    skills = {
+        "mineWood": {"code": "async function mineWood(bot) {}", "description": "mine wood"},
+        "craftTable": {"code": "// é\nasync function craftTable(bot) {}", "description": "craft"},
+    }
+    embeddings = {"mineWood": [1.0, 0.0], "craftTable": [0.0, 2.0]}
+    pack_skill_library(
+        str(tmp_path), skills, embeddings, "fake", {"mineWood": {"produces": {"oak_log"}}}
+    )
+
+    library = PackedSkillLibrary(str(tmp_path))
+    try:
+        assert library.embedding_model == "fake"
+        assert dict(library.skills) == skills
+        assert np.allclose(np.linalg.norm(library.embeddings, axis=1), 1)
+        assert library.search([0.1, 1.0], k=5) == ["craftTable", "mineWood"]
+        assert library.search([0.1, 1.0], k=1, names=["mineWood"]) == ["mineWood"]
+        assert library.search([1.0, 0.0], k=1, names=[]) == []
+        assert library.entries[0]["items"] == {"produces": ["oak_log"]}
+    finally:
+        library.close()
+
+
+def test_pack_empty_library(tmp_path):
+    pack_skill_library(str(tmp_path), {}, {}, "fake", {})
+    library = PackedSkillLibrary(str(tmp_path))
+    assert len(library.skills) == 0
+    assert library.search([1.0], k=3) == []
+    library.close()
+
+
+def test_programs_decode_the_code_blob(tmp_path):
+    skills = {
+        "a": {"code": "async function a(bot) {}", "description": "a"},
+        "b": {"code": "// é\nasync function b(bot) {}", "description": "b"},
+    }
+    pack_skill_library(str(tmp_path), skills, {"a": [1.0], "b": [1.0]}, "fake", {})
+    library = PackedSkillLibrary(str(tmp_path))
+    try:
+        assert library.programs() == "".join(f"{s['code']}\n\n" for s in skills.values())
+        # code is read from the shared blob on every access, not kept
+        assert library.skills["b"] == skills["b"]
+        assert library.skills["b"] is not library.skills["b"]
+        assert not hasattr(library.skills, "materialized")
+    finally:
+        library.close()
+
+
+def test_reads_format_1(tmp_path):
+    code = ["async function a(bot) {}", "async function b(bot) {}"]
+    U.dump_text("".join(code), str(tmp_path / "code.bin"))
+    np.save(str(tmp_path / "embeddings.npy"), np.ones((2, 1), dtype=np.float32))
+    entries = [
+        {"name": name, "description": name, "offset": offset, "length": len(c), "items": {}}
+        for name, offset, c in [("a", 0, code[0]), ("b", len(code[0]), code[1])]
+    ]
+    U.dump_json(
+        {"format": 1, "embedding_model": "fake", "skills": entries},
+        str(tmp_path / "manifest.json"),
+    )
+
+    library = PackedSkillLibrary(str(tmp_path))
+    assert library.get_code("b") == code[1]
+    assert library.programs() == f"{code[0]}\n\n{code[1]}\n\n"
+    library.close()
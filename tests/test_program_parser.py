@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from langchain.schema import AIMessage
+
+from voyager.agents import program_parser
+from voyager.agents.action import ActionAgent
+from voyager.agents.program_parser import ProgramParseError, ProgramParser
+
+MAIN = "async function mineWood(bot) {\n  await mineBlock(bot, \"oak_log\", 1);\n}"
+HELPER = "function count(bot) {\n  return 1;\n}"
+
+
+def parse_result(*functions):
+    return {
+        "statements": len(functions),
+        "functions": [
+            {"name": name, "type": type, "body": body, "params": ["bot"]}
+            for name, type, body in functions
+        ],
+        "calls": [{"name": "mineBlock", "args": []}],
+        "declared": [name for name, _, _ in functions] + ["bot"],
+        "globals": [],
+    }
+
+
+class FakeParseService:
+    """
+    Stands in for parse_program.js, which needs node with babel installed
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.calls = []
+        self.failures = 0
+
+    def parseProgram(self, code):
+        self.calls.append(code)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("bridge is down")
+        result = self.results.get(code.strip(), {"error": "Unexpected token (1:0)"})
+        return json.dumps(result)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeParseService()
+    monkeypatch.setattr(
+        program_parser,
+        "require",
+        lambda name: (lambda babel, generator: service)
+        if name.endswith("parse_program.js")
+        else object(),
+    )
+    monkeypatch.setattr(program_parser.time, "sleep", lambda seconds: None)
+    return service
+
+
+def test_results_are_cached_by_code(service):
+    service.results[MAIN] = parse_result(("mineWood", "AsyncFunctionDeclaration", MAIN))
+    parser = ProgramParser(cache_size=1)
+
+    assert parser.parse(MAIN)["functions"][0]["name"] == "mineWood"
+    assert parser.parse(MAIN) == service.results[MAIN]
+    assert service.calls == [MAIN]
+
+    # least recently used results are evicted
+    with pytest.raises(ProgramParseError):
+        parser.parse("async function (")
+    parser.parse(MAIN)
+    assert service.calls == [MAIN, "async function (", MAIN]
+
+
+def test_syntax_errors_are_not_retried(service):
+    parser = ProgramParser()
+
+    for _ in range(2):
+        with pytest.raises(ProgramParseError, match="Unexpected token"):
+            parser.parse("async function (")
+    assert service.calls == ["async function ("]
+
+
+def test_bridge_failures_are_retried(service):
+    service.results[MAIN] = parse_result(("mineWood", "AsyncFunctionDeclaration", MAIN))
+    parser = ProgramParser(max_retries=3)
+
+    service.failures = 2
+    assert parser.parse(MAIN)["statements"] == 1
+    assert len(service.calls) == 3
+
+    service.failures = 3
+    with pytest.raises(ConnectionError):
+        parser.parse(MAIN + "\n")
+    assert len(service.calls) == 6
+
+
+def test_action_agent_takes_the_last_async_function(tmp_path, fake_openai, service):
+    code = f"{HELPER}\n\n{MAIN}"
+    service.results[code] = parse_result(
+        ("count", "FunctionDeclaration", HELPER),
+        ("mineWood", "AsyncFunctionDeclaration", MAIN),
+    )
+    agent = ActionAgent(ckpt_dir=str(tmp_path), validate_programs=False)
+
+    parsed = agent.process_ai_message(AIMessage(content=f"```javascript\n{code}\n```"))
+
+    assert parsed["program_name"] == "mineWood"
+    assert parsed["exec_code"] == "await mineWood(bot);"
+    assert parsed["program_code"] == code
+    assert parsed["analysis"]["declared"] == ["count", "mineWood", "bot"]
+    error = agent.process_ai_message(AIMessage(content="```js\nasync function (\n```"))
+    assert error.startswith("Error parsing action response")
+    assert "Unexpected token" in error
@@ -0,0 +1,120 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from voyager.agents import program_validator
+from voyager.agents.program_validator import ProgramValidator
+
+REGISTRY = {
+    "items": ["oak_log", "oak_planks", "crafting_table", "raw_iron", "coal", "furnace"],
+    "blocks": ["oak_log", "iron_ore", "crafting_table", "furnace"],
+    "entities": ["pig", "zombie"],
+}
+
+
+def arg(kind, value=None):
+    return {"kind": kind, "value": value}
+
+
+BOT = arg("identifier", "bot")
+
+
+def analysis(calls, declared=("bot",), globals=()):
+    return {
+        "calls": [{"name": name, "args": list(args)} for name, args in calls],
+        "declared": list(declared),
+        "globals": list(globals),
+    }
+
+
+@pytest.fixture
+def validator(monkeypatch):
+    monkeypatch.setattr(program_validator, "require", lambda name: lambda version: None)
+    parser = SimpleNamespace(
+        service=SimpleNamespace(registryNames=lambda mc_data: json.dumps(REGISTRY))
+    )
+    return ProgramValidator(parser)
+
+
+VALID_PROGRAMS = {
+    "primitives with literal and computed arguments": analysis(
+        [
+            ("mineBlock", [BOT, arg("string", "oak_log"), arg("number", 3)]),
+            ("craftItem", [BOT, arg("string", "oak_planks"), arg("identifier", "count")]),
+            ("placeItem", [BOT, arg("string", "crafting_table"), arg("other")]),
+            ("smeltItem", [BOT, arg("string", "raw_iron"), arg("string", "coal"), arg("number", 1)]),
+            ("killMob", [BOT, arg("string", "pig"), arg("number", 300)]),
+            ("exploreUntil", [BOT, arg("object"), arg("number", 60), arg("function")]),
+            ("getItemFromChest", [BOT, arg("identifier", "chestPosition"), arg("object")]),
+            ("mineBlock", [BOT, arg("other"), arg("other")]),
+        ],
+        declared=["craftTools", "bot", "count", "chestPosition"],
+    ),
+    "skills, local helpers and javascript globals": analysis(
+        [
+            ("craftWoodenPickaxe", [BOT]),
+            ("countLogs", [BOT]),
+            ("setTimeout", [arg("function"), arg("number", 100)]),
+            ("parseInt", [arg("string", "3")]),
+        ],
+        declared=["mineLogs", "bot", "countLogs"],
+        globals=["setTimeout", "parseInt"],
+    ),
+    "names in scope of the env": analysis(
+        [
+            ("require", [arg("string", "vec3")]),
+            ("itemByName", [BOT, arg("string", "oak_log")]),
+            ("failedCraftFeedback", [BOT, arg("string", "furnace"), arg("other"), arg("other")]),
+            ("givePlacedItemBack", [BOT, arg("array"), arg("array")]),
+        ],
+    ),
+    "a program redefining a primitive": analysis(
+        [("mineBlock", [BOT, arg("object"), arg("string", "all")])],
+        declared=["mineBlock", "bot", "name"],
+    ),
+}
+
+
+@pytest.mark.parametrize("name", VALID_PROGRAMS)
+def test_valid_programs_are_accepted(validator, name):
+    assert validator.validate(VALID_PROGRAMS[name], ["craftWoodenPickaxe"]) == []
+
+
+def test_undefined_functions_are_reported_once(validator):
+    errors = validator.validate(
+        analysis([("mineWoodLog", [BOT]), ("mineWoodLog", [BOT])]), skill_names=["craftTable"]
+    )
+    assert len(errors) == 1
+    assert errors[0].startswith("mineWoodLog is not defined")
+
+
+def test_primitive_arguments_are_checked(validator):
+    errors = validator.validate(
+        analysis(
+            [
+                ("mineBlock", [BOT, arg("string", "wood"), arg("string", "3")]),
+                ("killMob", [BOT, arg("string", "creeper")]),
+            ]
+        )
+    )
+    assert errors == [
+        "wood passed to mineBlock is not a valid block name",
+        "argument 3 of mineBlock must be a number, got string",
+        "creeper passed to killMob is not a valid mob name",
+    ]
+
+
+def test_names_are_not_checked_without_a_registry(monkeypatch):
+    def require(name):
+        raise RuntimeError("minecraft-data is not installed")
+
+    monkeypatch.setattr(program_validator, "require", require)
+    validator = ProgramValidator(SimpleNamespace(service=None))
+
+    assert validator.validate(
+        analysis([("mineBlock", [BOT, arg("string", "wood"), arg("number", 1)])])
+    ) == []
+    assert validator.validate(
+        analysis([("mineBlock", [BOT, arg("number", 1)])])
+    ) == ["argument 2 of mineBlock must be a string, got number"]
@@ -0,0 +1,42 @@
+import os
+
+from voyager.control_primitives_context import load_control_primitives_context
+from voyager.prompts import PROMPTS, PromptRegistry, load_prompt
+import voyager.utils as U
+
+
+def test_prompt_registry_reloads_in_dev_mode(tmp_path):
+    U.f_mkdir(str(tmp_path), "prompts")
+    path = tmp_path / "prompts" / "a.txt"
+    path.write_text("v1")
+    registry = PromptRegistry(str(tmp_path))
+    dev_registry = PromptRegistry(str(tmp_path), dev_mode=True)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return dev_registry.load_text("prompts/a.txt").upper()
+
+    assert registry.load_text("prompts/a.txt") == "v1"
+    assert dev_registry.get_derived("upper", ["prompts/a.txt"], build) == "V1"
+    assert dev_registry.get_derived("upper", ["prompts/a.txt"], build) == "V1"
+    assert registry.listdir("prompts", ".txt") == ["a"]
+
+    path.write_text("v2")
+    os.utime(path, (1, 1))
+    assert registry.load_text("prompts/a.txt") == "v1"
+    assert dev_registry.get_derived("upper", ["prompts/a.txt"], build) == "V2"
+    assert len(builds) == 2
+
+
+def test_package_prompts_are_read_once(monkeypatch):
+    critic = load_prompt("critic")
+    context = load_control_primitives_context()
+    reads = []
+    load_text = U.load_text
+    monkeypatch.setattr(U, "load_text", lambda path: reads.append(path) or load_text(path))
+    monkeypatch.setattr(PROMPTS, "dev_mode", False)
+
+    assert load_prompt("critic") is critic
+    assert load_control_primitives_context() == context
+    assert reads == []
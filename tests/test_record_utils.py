@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from voyager.utils import EventLog, EventRecorder
+import voyager.utils as U
+
+from .conftest import make_events
+
+
+def test_event_log_spans_segments(tmp_path):
+    log = EventLog(str(tmp_path), segment_bytes=200)
+    records = [make_events({"dirt": i + 1}, elapsed_time=i) for i in range(10)]
+    for i, events in enumerate(records):
+        assert log.append(f"task {i}", events) == i + 1
+
+    assert len({entry["segment"] for entry in log.entries}) > 1
+    assert log.read(7) == records[6]
+    assert [events for _, events in log.iter_records()] == records
+    assert [entry["iteration"] for entry, _ in log.iter_records(3, 5)] == [3, 4, 5]
+
+    reopened = EventLog(str(tmp_path), segment_bytes=200)
+    assert len(reopened) == 10
+    assert reopened.read(10) == records[9]
+
+
+def test_event_log_drops_torn_writes(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append("a", make_events({"dirt": 1}))
+    log.append("b", make_events({"dirt": 2}))
+    with open(log.index_path, "a") as fp:
+        fp.write('{"iteration": 3, "ta')
+    # the record of the second iteration was not fully written
+    segment_path = log.segment_path(0)
+    with open(segment_path, "r+b") as fp:
+        fp.truncate(os.path.getsize(segment_path) - 1)
+
+    recovered = EventLog(str(tmp_path))
+    assert len(recovered) == 1
+    assert recovered.append("c", make_events({"dirt": 3})) == 2
+    assert recovered.read(2) == make_events({"dirt": 3})
+    assert len(EventLog(str(tmp_path))) == 2
+
+
+def test_read_only_event_log_writes_nothing(tmp_path):
+    log = EventLog(str(tmp_path / "events"))
+    log.append("a", make_events())
+    with open(log.index_path, "a") as fp:
+        fp.write("torn")
+    index = U.load_text(log.index_path)
+
+    reader = EventLog(str(tmp_path / "events"), read_only=True)
+    assert len(reader) == 1
+    assert U.load_text(log.index_path) == index
+    with pytest.raises(AssertionError):
+        reader.append("b", make_events())
+
+    EventLog(str(tmp_path / "missing"), read_only=True)
+    assert not os.path.exists(tmp_path / "missing")
+
+
+def record_run(ckpt_dir, n_iterations, **kwargs):
+    recorder = EventRecorder(ckpt_dir=ckpt_dir, **kwargs)
+    for i in range(n_iterations):
+        recorder.record(
+            make_events(
+                {"oak_log": 1, f"item_{i}": 1},
+                position=(float(i), 64.0, 0.0),
+                biome="forest" if i % 2 else "plains",
+            ),
+            f"task {i}",
+        )
+    return recorder
+
+
+def test_recorder_resume_matches_live_state(tmp_path):
+    live = record_run(str(tmp_path), 7, snapshot_interval=3)
+    resumed = EventRecorder(ckpt_dir=str(tmp_path), resume=True, snapshot_interval=3)
+    assert resumed.snapshot() == live.snapshot()
+    assert resumed.iteration == 7
+    assert resumed.elapsed_time == 7 * 20
+
+
+def test_recorder_resume_with_cutoff(tmp_path):
+    record_run(str(tmp_path), 7, snapshot_interval=3)
+    expected = record_run(str(tmp_path / "short"), 4, snapshot_interval=3)
+
+    resumed = EventRecorder(ckpt_dir=str(tmp_path), snapshot_interval=3)
+    resumed.resume(cutoff=4)
+    assert resumed.snapshot() == expected.snapshot()
+
+
+def test_recorder_migrates_legacy_event_files(tmp_path):
+    ckpt_dir = str(tmp_path)
+    U.f_mkdir(ckpt_dir, "events")
+    for i in range(3):
+        U.dump_json(
+            make_events({f"item_{i}": 1}),
+            f"{ckpt_dir}/events/task {i}_20230101_00000{i}",
+        )
+
+    resumed = EventRecorder(ckpt_dir=ckpt_dir, resume=True)
+
+    assert resumed.iteration == 3
+    assert resumed.item_history == {"item_0", "item_1", "item_2"}
+    assert [entry["task"] for entry in resumed.log.entries] == [
+        "task 0",
+        "task 1",
+        "task 2",
+    ]
+
+
+def test_iterations_without_env_step_are_recorded_empty(tmp_path):
+    recorder = record_run(str(tmp_path), 2)
+    recorder.record([], "task 1")
+
+    assert recorder.iteration == 3
+    assert recorder.elapsed_time == 2 * 20
+    assert recorder.log.read(3) == []
+    resumed = EventRecorder(ckpt_dir=str(tmp_path), resume=True)
+    assert resumed.snapshot() == recorder.snapshot()
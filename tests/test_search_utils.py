@@ -0,0 +1,54 @@
+from voyager.agents.skill import SkillManager
+from voyager.utils import BM25Index, extract_item_names, tokenize
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("craftIronPickaxe") == ["craftironpickaxe", "craft", "iron", "pickaxe"]
+    assert tokenize("iron_ingot x3") == ["iron_ingot", "iron", "ingot", "x3", "x", "3"]
+    assert tokenize("Mine wood") == ["mine", "wood"]
+
+
+def test_extract_item_names():
+    code = 'await mineBlock(bot, "iron_ore", 3); mcData.itemsByName.iron_ingot'
+    assert extract_item_names(code) == ["iron_ore", "iron_ingot"]
+
+
+def build_index():
+    index = BM25Index()
+    index.add("mineIron", tokenize("mineIronOre mine iron_ore with a stone pickaxe"))
+    index.add("craftPickaxe", tokenize("craftStonePickaxe craft a stone pickaxe"))
+    index.add("mineWood", tokenize("mineWoodLog mine oak_log"))
+    return index
+
+
+def test_bm25_ranks_matching_documents():
+    index = build_index()
+    ranking = [doc_id for doc_id, _ in index.search(tokenize("mine iron ore"))]
+    assert ranking[0] == "mineIron"
+    assert "craftPickaxe" not in ranking
+    # the shorter document ranks first on a shared term
+    assert index.search(tokenize("pickaxe"), k=1)[0][0] == "craftPickaxe"
+    assert index.search(tokenize("diamond")) == []
+
+
+def test_bm25_filters_and_updates():
+    index = build_index()
+    ranking = index.search(tokenize("mine"), doc_ids=["mineWood"])
+    assert [doc_id for doc_id, _ in ranking] == ["mineWood"]
+
+    index.add("mineWood", tokenize("chopTree chop a tree"))
+    assert "oak_log" not in index
+    assert [doc_id for doc_id, _ in index.search(tokenize("tree"))] == ["mineWood"]
+
+    index.remove("mineWood")
+    index.remove("missing")
+    assert len(index) == 2
+    assert "chop" not in index
+    assert index.total_length == sum(index.doc_lengths.values())
+
+
+def test_fuse_rankings():
+    fused = SkillManager.fuse_rankings([["a", "b", "c"], ["b", "c", "d"]], k=3)
+    # b and c appear in both rankings
+    assert fused == ["b", "c", "a"]
+    assert SkillManager.fuse_rankings([["a"], []], k=5) == ["a"]
@@ -0,0 +1,231 @@
+import threading
+
+import pytest
+
+from voyager.agents.skill import SkillManager
+from voyager.utils import CheckpointManager
+import voyager.utils as U
+
+
+def skill_info(name, code=None):
+    code = code or f"async function {name}(bot) {{ await mineBlock(bot, \"oak_log\", 1); }}"
+    return {"task": f"Do {name}", "program_name": name, "program_code": code}
+
+
+def make_manager(ckpt_dir, **kwargs):
+    return SkillManager(ckpt_dir=str(ckpt_dir), background_ingest=False, **kwargs)
+
+
+def run_with_timeout(fn, timeout=5):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{fn} blocked"
+    return result["value"]
+
+
+def test_retrieval_is_cached_per_library_version(tmp_path, fake_openai):
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+
+    first = manager.retrieve_skills("Mine  wood log")
+    assert len(fake_openai.queries) == 1
+    # the cache key is the normalized query
+    assert manager.retrieve_skills("mine wood LOG") == first
+    assert len(fake_openai.queries) == 1
+
+    manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    second = manager.retrieve_skills("mine wood log")
+    assert len(fake_openai.queries) == 2
+    assert len(second) == 2
+
+
+def test_retrieval_cache_returns_copies(tmp_path, fake_openai):
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+
+    manager.retrieve_skills("mine wood log").clear()
+    assert len(manager.retrieve_skills("mine wood log")) == 1
+
+
+def test_skill_name_queries_skip_the_embedding(tmp_path, fake_openai):
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    manager.retrieval_top_k = 1
+
+    assert manager.retrieve_skills("craftTable") == ["async function craftTable(bot) {}"]
+    assert fake_openai.queries == []
+    manager.retrieve_skills("make a table")
+    assert fake_openai.queries == ["make a table"]
+
+
+def test_items_restrict_retrieval(tmp_path, fake_openai):
+    manager = make_manager(tmp_path, retrieval_top_k=1)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(
+        skill_info("mineStone", 'async function mineStone(bot) { await mineBlock(bot, "stone", 1); }')
+    )
+
+    assert manager.skills_for_items(["stone"]) == ["mineStone"]
+    assert manager.retrieve_skills("get some wood", items=["stone"]) == [
+        manager.skills["mineStone"]["code"]
+    ]
+
+
+def test_retrieval_is_not_blocked_by_background_ingest(tmp_path, fake_openai):
+    manager = SkillManager(ckpt_dir=str(tmp_path))
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.flush()
+
+    fake_openai.block.clear()
+    fake_openai.embedding_started.clear()
+    manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    assert fake_openai.embedding_started.wait(timeout=5)
+
+    # the ingest worker is waiting for its embedding
+    assert run_with_timeout(lambda: manager.retrieve_skills("mine wood log"))
+    assert "craftTable" in run_with_timeout(lambda: manager.programs)
+    assert "craftTable" in run_with_timeout(manager.skill_names)
+
+    fake_openai.block.set()
+    manager.flush()
+    assert set(manager.skills) == {"mineWoodLog", "craftTable"}
+    assert manager.pending_skills == {}
+    assert manager.vectordb._collection.count() == 2
+
+
+def test_resume_ingests_pending_skills(tmp_path, fake_openai):
+    ckpt_dir = str(tmp_path)
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.flush()
+    code = "async function craftTable(bot) {}"
+    U.dump_json({"craftTable": code}, f"{ckpt_dir}/skill/pending.json")
+
+    resumed = make_manager(tmp_path, resume=True)
+
+    assert resumed.skills["craftTable"]["code"] == code
+    assert resumed.vectordb._collection.count() == 2
+    assert resumed.pending_skills == {}
+
+
+def test_unchanged_skills_are_not_described_again(tmp_path, fake_openai, monkeypatch):
+    manager = make_manager(tmp_path)
+    described = []
+    describe = manager.generate_skill_description
+    monkeypatch.setattr(
+        manager,
+        "generate_skill_description",
+        lambda name, code: described.append(name) or describe(name, code),
+    )
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(skill_info("mineWoodLog", "async function mineWoodLog(bot) {}"))
+
+    assert described == ["mineWoodLog", "mineWoodLog"]
+    versions = manager.get_skill_versions("mineWoodLog")
+    assert [version["file"] for version in versions] == ["mineWoodLog", "mineWoodLogV2"]
+    assert versions[1]["code"] == "async function mineWoodLog(bot) {}"
+
+
+def test_import_keeps_first_copy_of_a_name(tmp_path, fake_openai):
+    sources = []
+    for i in range(2):
+        source = make_manager(tmp_path / f"trial{i}")
+        source.add_new_skill(
+            skill_info(
+                "mineWoodLog",
+                f"async function mineWoodLog(bot) {{ await mineBlock(bot, \"oak_log\", {i + 1}); }}",
+            )
+        )
+        source.flush()
+        sources.append(str(tmp_path / f"trial{i}"))
+
+    target = make_manager(tmp_path / "merged")
+    result = target.import_libraries(sources)
+
+    assert result["imported"] == ["mineWoodLog"]
+    assert result["skipped"] == ["mineWoodLog"]
+    assert '"oak_log", 1)' in target.skills["mineWoodLog"]["code"]
+    assert target.vectordb._collection.count() == 1
+
+
+def test_import_skips_reformatted_duplicates(tmp_path, fake_openai):
+    source = make_manager(tmp_path / "source")
+    source.add_new_skill(skill_info("chopTree", "async function mineWoodLog(bot) {\n  // chop\n}"))
+    source.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    source.flush()
+
+    target = make_manager(tmp_path / "target")
+    target.add_new_skill(skill_info("mineWoodLog", "async function mineWoodLog(bot) {}"))
+    result = target.import_libraries([str(tmp_path / "source")])
+
+    assert result == {"imported": ["craftTable"], "skipped": ["chopTree"]}
+    assert target.vectordb._collection.count() == 2
+    assert target.retrieve_skills("craftTable")
+
+
+def test_packed_library(tmp_path, fake_openai):
+    manager = make_manager(tmp_path / "ckpt")
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    manager.pack(str(tmp_path / "packed"))
+
+    packed = make_manager(tmp_path / "packed")
+
+    assert packed.programs == manager.programs
+    assert packed.retrieve_skills("craftTable") == [manager.skills["craftTable"]["code"]]
+    assert len(packed.retrieve_skills("build a house")) == 2
+    packed.add_new_skill(skill_info("smeltIron"))
+    assert "smeltIron" not in packed.skill_names()
+
+
+def crash_on_skills_commit(monkeypatch, ckpt_dir):
+    commit_files = CheckpointManager.commit_files
+    skills_path = f"{ckpt_dir}/skill/skills.json"
+
+    def crash(self, files):
+        if skills_path in files:
+            raise KeyboardInterrupt
+        commit_files(self, files)
+
+    monkeypatch.setattr(CheckpointManager, "commit_files", crash)
+
+
+def test_resume_recovers_skills_ahead_of_the_checkpoint(tmp_path, fake_openai, monkeypatch):
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    # the vectordb is persisted, then the process dies before skills.json
+    with monkeypatch.context() as patch:
+        crash_on_skills_commit(patch, tmp_path)
+        with pytest.raises(KeyboardInterrupt):
+            manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+        with pytest.raises(KeyboardInterrupt):
+            manager.add_new_skill(skill_info("mineWoodLog", "async function mineWoodLog(bot) {}"))
+    assert set(U.load_json(f"{tmp_path}/skill/skills.json")) == {"mineWoodLog"}
+
+    resumed = make_manager(tmp_path, resume=True)
+
+    assert resumed.skills == manager.skills
+    assert resumed.skills["mineWoodLog"]["code"] == "async function mineWoodLog(bot) {}"
+    assert resumed.vectordb._collection.count() == 2
+    assert resumed.pending_skills == {}
+    versions = resumed.get_skill_versions("mineWoodLog")
+    assert [version["file"] for version in versions] == ["mineWoodLog", "mineWoodLogV2"]
+    assert resumed.retrieve_skills("craftTable") == ["async function craftTable(bot) {}"]
+    assert set(U.load_json(f"{tmp_path}/skill/skills.json")) == {"mineWoodLog", "craftTable"}
+
+
+def test_resume_embeds_skills_missing_from_the_vectordb(tmp_path, fake_openai):
+    manager = make_manager(tmp_path)
+    manager.add_new_skill(skill_info("mineWoodLog"))
+    manager.add_new_skill(skill_info("craftTable", "async function craftTable(bot) {}"))
+    manager.vectordb._collection.delete(ids=["craftTable"])
+    manager.vectordb.persist()
+
+    resumed = make_manager(tmp_path, resume=True)
+
+    assert resumed.skills == manager.skills
+    assert resumed.vectordb._collection.count() == 2
@@ -0,0 +1,108 @@
+import os
+
+from voyager.utils.skill_utils import (
+    ItemCatalogue,
+    SkillVersionIndex,
+    extract_item_usage,
+    normalized_code_hash,
+)
+import voyager.utils as U
+
+
+def test_extract_item_usage():
+    code = """
+    await mineBlock(bot, "iron_ore", 3);
+    await smeltItem(bot, "raw_iron", "coal", 3);
+    await craftItem(bot, "iron_pickaxe", 1);
+    const table = mcData.blocksByName.crafting_table;
+    const ore = mcData.blocksByName.iron_ore;
+    await placeItem(bot, name, position);
+    """
+    assert extract_item_usage(code) == {
+        "produces": {"iron_ore", "iron_pickaxe"},
+        "consumes": {"raw_iron", "coal"},
+        "uses": {"crafting_table"},
+    }
+
+
+def test_item_catalogue():
+    catalogue = ItemCatalogue()
+    catalogue.add("mineIron", 'await mineBlock(bot, "iron_ore", 1);')
+    catalogue.add(
+        "smeltIron",
+        'await mineBlock(bot, "coal_ore", 1); await smeltItem(bot, "iron_ore", "coal");',
+    )
+
+    assert catalogue.skills_for_items(["iron_ore", "coal_ore"]) == ["smeltIron", "mineIron"]
+    assert catalogue.skills_for_items(["iron_ore"], roles=["produces"]) == ["mineIron"]
+    assert catalogue.items_in_text("Mine 3 iron ores and some coal ore") == [
+        "coal",
+        "coal_ore",
+        "iron_ore",
+    ]
+
+    catalogue.add("smeltIron", 'await smeltItem(bot, "iron_ore", "coal");')
+    assert "coal_ore" not in catalogue
+    catalogue.remove("mineIron")
+    assert catalogue.skills_for_items(["iron_ore"]) == ["smeltIron"]
+
+
+def write_code(code_dir, files):
+    U.f_mkdir(code_dir)
+    for file, code in files.items():
+        U.dump_text(code, os.path.join(code_dir, f"{file}.js"))
+
+
+def test_allocate_suffixes(tmp_path):
+    index = SkillVersionIndex(str(tmp_path / "code"))
+    assert index.allocate("craftChest") == "craftChest"
+    index.add("craftChest", "craftChest", "v1")
+    assert index.allocate("craftChest") == "craftChestV2"
+    index.add("craftChest", "craftChestV2", "v2")
+    assert index.allocate("craftChest") == "craftChestV3"
+
+
+def test_allocate_skips_gaps_and_existing_files(tmp_path):
+    code_dir = str(tmp_path / "code")
+    write_code(code_dir, {"a": "1", "aV2": "2", "aV4": "4", "aV5": "orphan"})
+    U.dump_json(
+        {"a": [{"file": "a", "hash": ""}, {"file": "aV2", "hash": ""}, {"file": "aV4", "hash": ""}]},
+        str(tmp_path / "versions.json"),
+    )
+    index = SkillVersionIndex(code_dir)
+    # V5 is on disk without being indexed
+    assert index.allocate("a") == "aV6"
+
+
+def test_backfill_groups_versions(tmp_path):
+    code_dir = str(tmp_path / "code")
+    write_code(
+        code_dir,
+        {"mine": "m1", "mineV2": "m2", "mineV10": "m10", "cookV2": "c2"},
+    )
+    index = SkillVersionIndex(code_dir)
+
+    assert [v["file"] for v in index.get_versions("mine")] == ["mine", "mineV2", "mineV10"]
+    # no base file, so cookV2 is a skill name of its own
+    assert [v["file"] for v in index.get_versions("cookV2")] == ["cookV2"]
+    assert index.is_latest("mine", "m10")
+    assert not index.is_latest("mine", "m2")
+    assert os.path.exists(tmp_path / "versions.json")
+    assert SkillVersionIndex(code_dir).versions == index.versions
+
+
+def test_normalized_code_hash_ignores_formatting():
+    code = "async function a(bot) {\n  // mine\n  await mineBlock(bot, 'dirt', 1);\n}"
+    reformatted = "async function a(bot){ /* mine */ await mineBlock(bot,'dirt',1); }"
+    assert normalized_code_hash(code) == normalized_code_hash(reformatted)
+    assert normalized_code_hash(code) != normalized_code_hash(code.replace("1", "2"))
+
+
+def test_unindexed_versions_are_found(tmp_path):
+    code_dir = str(tmp_path / "code")
+    write_code(code_dir, {"mine": "m1", "mineV2": "m2"})
+    index = SkillVersionIndex(code_dir, {"mine": [{"file": "mine", "hash": "h"}]})
+
+    assert index.has_unindexed("mine")
+    assert index.stored_files("mine") == ["mine", "mineV2"]
+    assert not index.has_unindexed("cook")
@@ -0,0 +1,40 @@
+from voyager.utils import CurriculumStore
+import voyager.utils as U
+
+
+def test_task_lists(tmp_path):
+    store = CurriculumStore(str(tmp_path / "curriculum.db"))
+    assert store.is_empty()
+    store.add_failed_task("Mine 1 iron ore")
+    store.add_failed_task("Mine 1 iron ore")
+    store.add_failed_task("Craft 1 furnace")
+    store.add_completed_task("Mine 1 wood log")
+    store.add_completed_task("Mine 1 iron ore")
+    store.add_completed_task("Mine 1 wood log")
+
+    assert store.load_tasks() == (
+        ["Mine 1 wood log", "Mine 1 iron ore"],
+        ["Craft 1 furnace"],
+    )
+    store.close()
+    reopened = CurriculumStore(str(tmp_path / "curriculum.db"))
+    assert not reopened.is_empty()
+    assert reopened.load_tasks()[0] == ["Mine 1 wood log", "Mine 1 iron ore"]
+
+
+def test_qa_cache_and_export(tmp_path):
+    store = CurriculumStore(str(tmp_path / "curriculum.db"))
+    store.add_qa("What is X?", "what is x?", "A")
+    store.add_qa_many([("What is Y?", "what is y?", "B"), ("What is X?", "what is x?", "C")])
+    store.replace_tasks(["a", "b"], ["c"])
+
+    store.export_json(str(tmp_path))
+
+    assert U.load_json(str(tmp_path / "completed_tasks.json")) == ["a", "b"]
+    assert U.load_json(str(tmp_path / "failed_tasks.json")) == ["c"]
+    assert U.load_json(str(tmp_path / "qa_cache.json")) == {
+        "What is Y?": "B",
+        "What is X?": "C",
+    }
+    store.clear()
+    assert store.is_empty()
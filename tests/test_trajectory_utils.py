@@ -0,0 +1,47 @@
+import pytest
+
+from voyager.utils import Trajectory
+
+
+def test_distance_and_cells():
+    trajectory = Trajectory(cell_size=16)
+    for x, z in [(0, 0), (3, 4), (3, 4), (20, 4), (0, 0)]:
+        trajectory.append(x, z)
+
+    assert len(trajectory) == 4
+    assert trajectory.distance == pytest.approx(5 + 17 + 20.4, abs=0.01)
+    assert trajectory.coverage() == 2
+    assert trajectory.coverage_area() == 2 * 16**2
+    # left cell (0, 0) and came back
+    assert trajectory.revisits() == 1
+    assert trajectory.visits(1, 1) == 2
+    assert trajectory.is_visited(17, 0)
+    assert not trajectory.is_visited(-1, 0)
+    assert trajectory.bounds() == ([0.0, 0.0], [20.0, 4.0])
+
+
+def test_min_distance_downsamples_points():
+    trajectory = Trajectory(min_distance=5.0)
+    for x in range(21):
+        trajectory.append(float(x), 0.0)
+
+    assert list(trajectory) == [[0.0, 0.0], [5.0, 0.0], [10.0, 0.0], [15.0, 0.0], [20.0, 0.0]]
+    assert trajectory.distance == 20
+
+
+def test_grows_past_capacity():
+    trajectory = Trajectory(capacity=2)
+    for x in range(5):
+        trajectory.append(float(x), 0.0)
+    assert trajectory[4] == [4.0, 0.0]
+
+
+def test_json_round_trip():
+    trajectory = Trajectory.from_points([(0, 0), (10, 10), (40, -5)], cell_size=8)
+    restored = Trajectory.from_json(trajectory.to_json())
+
+    assert list(restored) == list(trajectory)
+    assert restored.to_json() == trajectory.to_json()
+    restored.append(0.0, 0.0)
+    trajectory.append(0.0, 0.0)
+    assert restored.to_json() == trajectory.to_json()
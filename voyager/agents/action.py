@@ -2,14 +2,18 @@ import re
 import time
 
 import voyager.utils as U
-from javascript import require
-from langchain.chat_models import ChatOpenAI
+from voyager.llm import ChatModel, token_metrics
 from langchain.prompts import SystemMessagePromptTemplate
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
-from voyager.prompts import load_prompt
+from voyager.prompts import PROMPTS, load_prompt
 from voyager.control_primitives_context import load_control_primitives_context
 
+from .program_parser import ProgramParser
+from .program_validator import ProgramValidator
+
+CODE_PATTERN = re.compile(r"```(?:javascript|js)(.*?)```", re.DOTALL)
+
 
 class ActionAgent:
     def __init__(
@@ -21,59 +25,95 @@ class ActionAgent:
         resume=False,
         chat_log=True,
         execution_error=True,
+        checkpoint=None,
+        token_budget=None,
+        compact_block_limit=20,
+        validate_programs=True,
+        game_version="1.19",
+        streaming=False,
     ):
         self.ckpt_dir = ckpt_dir
         self.chat_log = chat_log
         self.execution_error = execution_error
+        self.token_budget = token_budget
+        self.compact_block_limit = compact_block_limit
         U.f_mkdir(f"{ckpt_dir}/action")
-        if resume:
+        self.checkpoint = checkpoint or U.CheckpointManager(ckpt_dir, background=False)
+        if resume and U.f_exists(f"{ckpt_dir}/action/chest_memory.json"):
             print(f"\033[32mLoading Action Agent from {ckpt_dir}/action\033[0m")
-            self.chest_memory = U.load_json(f"{ckpt_dir}/action/chest_memory.json")
+            self.chest_memory = self.checkpoint.load_json(
+                f"{ckpt_dir}/action/chest_memory.json"
+            )
         else:
             self.chest_memory = {}
-        self.llm = ChatOpenAI(
+        self.chest_observation = None
+        self.program_parser = ProgramParser()
+        self.program_validator = (
+            ProgramValidator(self.program_parser, game_version)
+            if validate_programs
+            else None
+        )
+        self.checkpoint.register(
+            "chest_memory",
+            f"{ckpt_dir}/action/chest_memory.json",
+            lambda: dict(self.chest_memory),
+        )
+        self.llm = ChatModel(
+            "action",
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timout,
+            streaming=streaming,
         )
 
     def update_chest_memory(self, chests):
+        changed = False
         for position, chest in chests.items():
             if position in self.chest_memory:
-                if isinstance(chest, dict):
+                if isinstance(chest, dict) and self.chest_memory[position] != chest:
                     self.chest_memory[position] = chest
+                    changed = True
                 if chest == "Invalid":
                     print(
                         f"\033[32mAction Agent removing chest {position}: {chest}\033[0m"
                     )
                     self.chest_memory.pop(position)
+                    changed = True
             else:
                 if chest != "Invalid":
                     print(f"\033[32mAction Agent saving chest {position}: {chest}\033[0m")
                     self.chest_memory[position] = chest
-        U.dump_json(self.chest_memory, f"{self.ckpt_dir}/action/chest_memory.json")
+                    changed = True
+        if changed:
+            self.chest_observation = None
+            self.checkpoint.mark_dirty("chest_memory")
 
     def render_chest_observation(self):
-        chests = []
+        # rendered once per change of chest_memory
+        if self.chest_observation is not None:
+            U.render_metrics.hits += 1
+            return self.chest_observation
+        start = time.perf_counter()
+        filled, empty, unknown = [], [], []
         for chest_position, chest in self.chest_memory.items():
             if isinstance(chest, dict) and len(chest) > 0:
-                chests.append(f"{chest_position}: {chest}")
-        for chest_position, chest in self.chest_memory.items():
-            if isinstance(chest, dict) and len(chest) == 0:
-                chests.append(f"{chest_position}: Empty")
-        for chest_position, chest in self.chest_memory.items():
-            if isinstance(chest, str):
+                filled.append(f"{chest_position}: {chest}")
+            elif isinstance(chest, dict):
+                empty.append(f"{chest_position}: Empty")
+            else:
                 assert chest == "Unknown"
-                chests.append(f"{chest_position}: Unknown items inside")
-        assert len(chests) == len(self.chest_memory)
+                unknown.append(f"{chest_position}: Unknown items inside")
+        chests = filled + empty + unknown
         if chests:
             chests = "\n".join(chests)
-            return f"Chests:\n{chests}\n\n"
+            self.chest_observation = f"Chests:\n{chests}\n\n"
         else:
-            return f"Chests: None\n\n"
+            self.chest_observation = f"Chests: None\n\n"
+        U.render_metrics.seconds += time.perf_counter() - start
+        U.render_metrics.misses += 1
+        return self.chest_observation
 
     def render_system_message(self, skills=[]):
-        system_template = load_prompt("action_template")
         # FIXME: Hardcoded control_primitives
         base_skills = [
             "exploreUntil",
@@ -88,44 +128,45 @@ class ActionAgent:
                 "useChest",
                 "mineflayer",
             ]
-        programs = "\n\n".join(load_control_primitives_context(base_skills) + skills)
-        response_format = load_prompt("action_response_format")
+        prefix, base_programs, suffix = PROMPTS.get_derived(
+            ("action_system_message", tuple(base_skills)),
+            ["prompts/action_template.txt", "prompts/action_response_format.txt"]
+            + [f"control_primitives_context/{skill}.js" for skill in base_skills],
+            lambda: self.compile_system_message(base_skills),
+        )
+        programs = "\n\n".join([base_programs] + skills)
+        return SystemMessage(content=prefix + programs + suffix)
+
+    @staticmethod
+    def compile_system_message(base_skills):
+        """
+        Returns: the text of the system message before and after the
+        programs, and the base skill programs, which only change when the
+        prompt files do
+        """
         system_message_prompt = SystemMessagePromptTemplate.from_template(
-            system_template
+            load_prompt("action_template")
         )
+        placeholder = "\0programs\0"
         system_message = system_message_prompt.format(
-            programs=programs, response_format=response_format
+            programs=placeholder, response_format=load_prompt("action_response_format")
         )
         assert isinstance(system_message, SystemMessage)
-        return system_message
+        prefix, suffix = system_message.content.split(placeholder)
+        base_programs = "\n\n".join(load_control_primitives_context(base_skills))
+        return prefix, base_programs, suffix
 
     def render_human_message(
-        self, *, events, code="", task="", context="", critique=""
+        self, *, events, code="", task="", context="", critique="", block_limit=None
     ):
-        chat_messages = []
-        error_messages = []
-        # FIXME: damage_messages is not used
-        damage_messages = []
-        assert events[-1][0] == "observe", "Last event must be observe"
-        for i, (event_type, event) in enumerate(events):
-            if event_type == "onChat":
-                chat_messages.append(event["onChat"])
-            elif event_type == "onError":
-                error_messages.append(event["onError"])
-            elif event_type == "onDamage":
-                damage_messages.append(event["onDamage"])
-            elif event_type == "observe":
-                biome = event["status"]["biome"]
-                time_of_day = event["status"]["timeOfDay"]
-                voxels = event["voxels"]
-                entities = event["status"]["entities"]
-                health = event["status"]["health"]
-                hunger = event["status"]["food"]
-                position = event["status"]["position"]
-                equipment = event["status"]["equipment"]
-                inventory_used = event["status"]["inventoryUsed"]
-                inventory = event["inventory"]
-                assert i == len(events) - 1, "observe must be the last event"
+        events = U.parse_events(events)
+        # FIXME: events.damage_messages is not used
+        chat_messages = events.chat_messages
+        error_messages = events.error_messages
+        obs = events.observation
+        assert all(
+            o.event_type != "observe" for o in events.observations[:-1]
+        ), "observe must be the last event"
 
         observation = ""
 
@@ -148,35 +189,18 @@ class ActionAgent:
             else:
                 observation += f"Chat log: None\n\n"
 
-        observation += f"Biome: {biome}\n\n"
-
-        observation += f"Time: {time_of_day}\n\n"
-
-        if voxels:
-            observation += f"Nearby blocks: {', '.join(voxels)}\n\n"
-        else:
-            observation += f"Nearby blocks: None\n\n"
-
-        if entities:
-            nearby_entities = [
-                k for k, v in sorted(entities.items(), key=lambda x: x[1])
-            ]
-            observation += f"Nearby entities (nearest to farthest): {', '.join(nearby_entities)}\n\n"
-        else:
-            observation += f"Nearby entities (nearest to farthest): None\n\n"
-
-        observation += f"Health: {health:.1f}/20\n\n"
-
-        observation += f"Hunger: {hunger:.1f}/20\n\n"
-
-        observation += f"Position: x={position['x']:.1f}, y={position['y']:.1f}, z={position['z']:.1f}\n\n"
-
-        observation += f"Equipment: {equipment}\n\n"
-
-        if inventory:
-            observation += f"Inventory ({inventory_used}/36): {inventory}\n\n"
-        else:
-            observation += f"Inventory ({inventory_used}/36): Empty\n\n"
+        observation += obs.render("biome")
+        observation += obs.render("time")
+        observation += obs.render("nearby_blocks", block_limit)
+        for section in [
+            "nearby_entities_ranked",
+            "health",
+            "hunger",
+            "position",
+            "equipment",
+            "inventory",
+        ]:
+            observation += obs.render(section)
 
         if not (
             task == "Place and deposit useless items into a chest"
@@ -198,62 +222,88 @@ class ActionAgent:
 
         return HumanMessage(content=observation)
 
+    def render_messages(self, *, skills, **human_message_kwargs):
+        """
+        Render the system and human message. If they exceed token_budget,
+        compact them in order: drop retrieved skills from the least relevant
+        one, then cap the nearby block list.
+        """
+        system_message = self.render_system_message(skills=skills)
+        human_message = self.render_human_message(**human_message_kwargs)
+        if self.token_budget is None:
+            return system_message, human_message
+        compacted = False
+        while (
+            skills
+            and self.llm.count_tokens([system_message, human_message])
+            > self.token_budget
+        ):
+            skills = skills[:-1]
+            system_message = self.render_system_message(skills=skills)
+            compacted = True
+        if self.llm.count_tokens([system_message, human_message]) > self.token_budget:
+            human_message = self.render_human_message(
+                block_limit=self.compact_block_limit, **human_message_kwargs
+            )
+            compacted = True
+        if compacted:
+            token_metrics.record_compaction(self.llm.agent)
+            print(
+                f"\033[33mAction Agent compacted the prompt to "
+                f"{self.llm.count_tokens([system_message, human_message])} tokens, "
+                f"keeping {len(skills)} skills\033[0m"
+            )
+        return system_message, human_message
+
     def process_ai_message(self, message):
         assert isinstance(message, AIMessage)
 
-        retry = 3
-        error = None
-        while retry > 0:
-            try:
-                babel = require("@babel/core")
-                babel_generator = require("@babel/generator").default
+        code = "\n".join(CODE_PATTERN.findall(message.content))
+        try:
+            parsed = self.program_parser.parse(code)
+            functions = parsed["functions"]
+            assert parsed["statements"] > 0, "No functions found"
+            # find the last async function
+            main_function = None
+            for function in reversed(functions):
+                if function["type"] == "AsyncFunctionDeclaration":
+                    main_function = function
+                    break
+            assert (
+                main_function is not None
+            ), "No async function found. Your main function must be async."
+            assert (
+                len(main_function["params"]) == 1
+                and main_function["params"][0] == "bot"
+            ), f"Main function {main_function['name']} must take a single argument named 'bot'"
+            program_code = "\n\n".join(function["body"] for function in functions)
+            exec_code = f"await {main_function['name']}(bot);"
+            return {
+                "program_code": program_code,
+                "program_name": main_function["name"],
+                "exec_code": exec_code,
+                "analysis": {
+                    key: parsed[key] for key in ["calls", "declared", "globals"]
+                },
+            }
+        except Exception as e:
+            # syntax errors and invalid programs are deterministic, the parser
+            # already retried failures of the javascript bridge
+            return f"Error parsing action response (before program execution): {e}"
 
-                code_pattern = re.compile(r"```(?:javascript|js)(.*?)```", re.DOTALL)
-                code = "\n".join(code_pattern.findall(message.content))
-                parsed = babel.parse(code)
-                functions = []
-                assert len(list(parsed.program.body)) > 0, "No functions found"
-                for i, node in enumerate(parsed.program.body):
-                    if node.type != "FunctionDeclaration":
-                        continue
-                    node_type = (
-                        "AsyncFunctionDeclaration"
-                        if node["async"]
-                        else "FunctionDeclaration"
-                    )
-                    functions.append(
-                        {
-                            "name": node.id.name,
-                            "type": node_type,
-                            "body": babel_generator(node).code,
-                            "params": list(node["params"]),
-                        }
-                    )
-                # find the last async function
-                main_function = None
-                for function in reversed(functions):
-                    if function["type"] == "AsyncFunctionDeclaration":
-                        main_function = function
-                        break
-                assert (
-                    main_function is not None
-                ), "No async function found. Your main function must be async."
-                assert (
-                    len(main_function["params"]) == 1
-                    and main_function["params"][0].name == "bot"
-                ), f"Main function {main_function['name']} must take a single argument named 'bot'"
-                program_code = "\n\n".join(function["body"] for function in functions)
-                exec_code = f"await {main_function['name']}(bot);"
-                return {
-                    "program_code": program_code,
-                    "program_name": main_function["name"],
-                    "exec_code": exec_code,
-                }
-            except Exception as e:
-                retry -= 1
-                error = e
-                time.sleep(1)
-        return f"Error parsing action response (before program execution): {error}"
+    def validate_program(self, parsed_result, skill_names=()):
+        """
+        Returns: critique describing why the program would fail, or None if
+        it passed the static checks
+        """
+        if self.program_validator is None:
+            return None
+        errors = self.program_validator.validate(parsed_result["analysis"], skill_names)
+        if not errors:
+            return None
+        return "The program was not executed because it is invalid:\n" + "\n".join(
+            f"- {error}" for error in errors
+        )
 
     def summarize_chatlog(self, events):
         def filter_item(message: str):
@@ -272,9 +322,8 @@ class ActionAgent:
                 return ""
 
         chatlog = set()
-        for event_type, event in events:
-            if event_type == "onChat":
-                item = filter_item(event["onChat"])
-                if item:
-                    chatlog.add(item)
+        for message in U.parse_events(events).chat_messages:
+            item = filter_item(message)
+            if item:
+                chatlog.add(item)
         return "I also need " + ", ".join(chatlog) + "." if chatlog else ""
@@ -1,8 +1,15 @@
+import voyager.utils as U
 from voyager.prompts import load_prompt
 from voyager.utils.json_utils import fix_and_parse_json
-from langchain.chat_models import ChatOpenAI
+from voyager.llm import ChatModel, ModelRouter, json_object_closed
 from langchain.schema import HumanMessage, SystemMessage
 
+# appended to the critic prompt of the fast model only
+CONFIDENCE_INSTRUCTION = (
+    '\n\nAlso add a "confidence" field to the JSON, a number from 0 to 1 '
+    'of how sure you are about "success".'
+)
+
 
 class CriticAgent:
     def __init__(
@@ -11,58 +18,66 @@ class CriticAgent:
         temperature=0,
         request_timout=120,
         mode="auto",
+        streaming=False,
+        samples=1,
+        fast_model_name=None,
+        confidence_threshold=0.8,
     ):
-        self.llm = ChatOpenAI(
+        self.llm = ChatModel(
+            "critic",
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timout,
+            streaming=streaming,
         )
         assert mode in ["auto", "manual"]
         self.mode = mode
+        # number of responses sampled per check, voted on when > 1
+        self.samples = samples
+        # checks are first answered by the fast model, if any, and escalated
+        # to model_name on parse failure, disagreement or low confidence
+        self.router = None
+        if fast_model_name is not None:
+            self.router = ModelRouter(
+                "critic",
+                ChatModel(
+                    "critic_fast",
+                    model_name=fast_model_name,
+                    temperature=temperature,
+                    request_timeout=request_timout,
+                    streaming=streaming,
+                ),
+                self.llm,
+            )
+        self.confidence_threshold = confidence_threshold
 
     def render_system_message(self):
         system_message = SystemMessage(content=load_prompt("critic"))
         return system_message
 
     def render_human_message(self, *, events, task, context, chest_observation):
-        assert events[-1][0] == "observe", "Last event must be observe"
-        biome = events[-1][1]["status"]["biome"]
-        time_of_day = events[-1][1]["status"]["timeOfDay"]
-        voxels = events[-1][1]["voxels"]
-        health = events[-1][1]["status"]["health"]
-        hunger = events[-1][1]["status"]["food"]
-        position = events[-1][1]["status"]["position"]
-        equipment = events[-1][1]["status"]["equipment"]
-        inventory_used = events[-1][1]["status"]["inventoryUsed"]
-        inventory = events[-1][1]["inventory"]
-
-        for i, (event_type, event) in enumerate(events):
-            if event_type == "onError":
-                print(f"\033[31mCritic Agent: Error occurs {event['onError']}\033[0m")
-                return None
-
-        observation = ""
-
-        observation += f"Biome: {biome}\n\n"
-
-        observation += f"Time: {time_of_day}\n\n"
+        events = U.parse_events(events)
+        obs = events.observation
 
-        if voxels:
-            observation += f"Nearby blocks: {', '.join(voxels)}\n\n"
-        else:
-            observation += f"Nearby blocks: None\n\n"
-
-        observation += f"Health: {health:.1f}/20\n\n"
-        observation += f"Hunger: {hunger:.1f}/20\n\n"
-
-        observation += f"Position: x={position['x']:.1f}, y={position['y']:.1f}, z={position['z']:.1f}\n\n"
+        if events.error_messages:
+            print(
+                f"\033[31mCritic Agent: Error occurs {events.error_messages[0]}\033[0m"
+            )
+            return None
 
-        observation += f"Equipment: {equipment}\n\n"
+        observation = ""
 
-        if inventory:
-            observation += f"Inventory ({inventory_used}/36): {inventory}\n\n"
-        else:
-            observation += f"Inventory ({inventory_used}/36): Empty\n\n"
+        for section in [
+            "biome",
+            "time",
+            "nearby_blocks",
+            "health",
+            "hunger",
+            "position",
+            "equipment",
+            "inventory",
+        ]:
+            observation += obs.render(section)
 
         observation += chest_observation
 
@@ -98,20 +113,77 @@ class CriticAgent:
         if messages[1] is None:
             return False, ""
 
-        critic = self.llm(messages).content
-        print(f"\033[31m****Critic Agent ai message****\n{critic}\033[0m")
-        try:
-            response = fix_and_parse_json(critic)
-            assert response["success"] in [True, False]
-            if "critique" not in response:
-                response["critique"] = ""
-            return response["success"], response["critique"]
-        except Exception as e:
-            print(f"\033[31mError parsing critic response: {e} Trying again!\033[0m")
+        responses = self.ask(self.llm, messages)
+        if not responses:
+            print("\033[31mNo critic response could be parsed. Trying again!\033[0m")
             return self.ai_check_task_success(
                 messages=messages,
                 max_retries=max_retries - 1,
             )
+        return self.vote(responses)
+
+    def ask(self, llm, messages):
+        """
+        Returns: the parsed responses of the sampled candidates, those that
+        could not be parsed left out
+        """
+        if self.samples > 1:
+            candidates = [
+                ai_message.content for ai_message in llm.sample(messages, self.samples)
+            ]
+        else:
+            candidates = [llm(messages, stop_when=json_object_closed).content]
+        responses = []
+        for critic in candidates:
+            print(f"\033[31m****Critic Agent ai message****\n{critic}\033[0m")
+            try:
+                response = fix_and_parse_json(critic)
+                assert response["success"] in [True, False]
+                response.setdefault("critique", "")
+                responses.append(response)
+            except Exception as e:
+                print(f"\033[31mError parsing critic response: {e}\033[0m")
+        return responses
+
+    def fast_check_task_success(self, llm, messages):
+        """
+        Returns: ((success, critique), None) if the fast model is confident,
+        else (None, escalation reason)
+        """
+        messages = [
+            SystemMessage(content=messages[0].content + CONFIDENCE_INSTRUCTION),
+            messages[1],
+        ]
+        responses = self.ask(llm, messages)
+        if not responses:
+            return None, "parse_failure"
+        if len({response["success"] for response in responses}) > 1:
+            return None, "disagreement"
+        try:
+            confidence = min(float(response["confidence"]) for response in responses)
+        except (KeyError, TypeError, ValueError):
+            return None, "parse_failure"
+        if confidence < self.confidence_threshold:
+            return None, "low_confidence"
+        return self.vote(responses), None
+
+    @staticmethod
+    def vote(responses):
+        """
+        Args:
+            responses: parsed responses of the candidates
+        Returns: majority success, a tie counts as failure, and the first
+        non-empty critique that agrees with it
+        """
+        successes = sum(response["success"] for response in responses)
+        success = successes * 2 > len(responses)
+        critiques = [r["critique"] for r in responses if r["success"] == success]
+        critique = next((c for c in critiques if c), critiques[0])
+        if len(responses) > 1:
+            print(
+                f"\033[31mCritic Agent vote: {successes}/{len(responses)} successful\033[0m"
+            )
+        return success, critique
 
     def check_task_success(
         self, *, events, task, context, chest_observation, max_retries=5
@@ -131,6 +203,13 @@ class CriticAgent:
         if self.mode == "manual":
             return self.human_check_task_success()
         elif self.mode == "auto":
+            if self.router is not None and human_message is not None:
+                return self.router(
+                    lambda llm: self.fast_check_task_success(llm, messages),
+                    lambda llm: self.ai_check_task_success(
+                        messages=messages, max_retries=max_retries
+                    ),
+                )
             return self.ai_check_task_success(
                 messages=messages, max_retries=max_retries
             )
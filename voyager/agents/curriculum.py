@@ -6,7 +6,7 @@ import re
 import voyager.utils as U
 from voyager.prompts import load_prompt
 from voyager.utils.json_utils import fix_and_parse_json
-from langchain.chat_models import ChatOpenAI
+from voyager.llm import ChatModel, ModelRouter, line_complete, token_metrics
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.vectorstores import Chroma
@@ -126,41 +126,109 @@ class CurriculumAgent:
         mode="auto",
         warm_up=None,
         core_inventory_items: str | None = None,
+        qa_cache_similarity_threshold=0.05,
+        checkpoint=None,
+        token_budget=None,
+        compact_task_limit=10,
+        compact_block_limit=20,
+        streaming=False,
+        samples=1,
+        qa_fast_model_name=None,
     ):
-        self.llm = ChatOpenAI(
+        self.llm = ChatModel(
+            "curriculum",
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timout,
+            streaming=streaming,
         )
-        self.qa_llm = ChatOpenAI(
+        self.qa_llm = ChatModel(
+            "curriculum_qa",
             model_name=qa_model_name,
             temperature=qa_temperature,
             request_timeout=request_timout,
         )
+        # questions are first answered by the fast model, if any, and
+        # escalated to qa_model_name when the answer is missing or unknown
+        self.qa_router = None
+        if qa_fast_model_name is not None:
+            self.qa_router = ModelRouter(
+                "curriculum_qa",
+                ChatModel(
+                    "curriculum_qa_fast",
+                    model_name=qa_fast_model_name,
+                    temperature=qa_temperature,
+                    request_timeout=request_timout,
+                ),
+                self.qa_llm,
+            )
         assert mode in [
             "auto",
             "manual",
         ], f"mode {mode} not supported"
         self.mode = mode
+        # number of proposals sampled per call, the first valid one is taken
+        self.samples = samples
         self.ckpt_dir = ckpt_dir
         U.f_mkdir(f"{ckpt_dir}/curriculum/vectordb")
+        # qa cache and task lists live in sqlite, json files are only exported
+        self.store = U.CurriculumStore(f"{ckpt_dir}/curriculum/curriculum.db")
         if resume:
             print(f"\033[35mLoading Curriculum Agent from {ckpt_dir}/curriculum\033[0m")
-            self.completed_tasks = U.load_json(
+            if self.store.is_empty() and U.f_exists(
                 f"{ckpt_dir}/curriculum/completed_tasks.json"
-            )
-            self.failed_tasks = U.load_json(f"{ckpt_dir}/curriculum/failed_tasks.json")
-            self.qa_cache = U.load_json(f"{ckpt_dir}/curriculum/qa_cache.json")
+            ):
+                self.import_json_checkpoint()
+            self.completed_tasks, self.failed_tasks = self.store.load_tasks()
+            completed = set(self.completed_tasks)
+            if any(task in completed for task in self.failed_tasks):
+                # written by versions that recorded failures of completed tasks
+                self.failed_tasks = [
+                    task for task in self.failed_tasks if task not in completed
+                ]
+                self.store.replace_tasks(self.completed_tasks, self.failed_tasks)
+            self.qa_cache = self.store.load_qa_cache()
         else:
+            self.store.clear()
             self.completed_tasks = []
             self.failed_tasks = []
             self.qa_cache = {}
+        # json exports of the store, read back from sqlite and written behind
+        # by the checkpoint manager
+        self.checkpoint = checkpoint or U.CheckpointManager(ckpt_dir, background=False)
+        self.checkpoint.register_export(
+            "curriculum_export",
+            lambda: self.store.export_json(f"{ckpt_dir}/curriculum"),
+        )
+        # exact lookup in front of the vectordb, normalized question -> question
+        self.qa_cache_normalized = {
+            self.normalize_question(question): question for question in self.qa_cache
+        }
+        # max vectordb distance for a cached question to count as the same question
+        self.qa_cache_similarity_threshold = qa_cache_similarity_threshold
+        self.token_budget = token_budget
+        self.compact_task_limit = compact_task_limit
+        self.compact_block_limit = compact_block_limit
         # vectordb for qa cache
+        self.qa_embedding_function = OpenAIEmbeddings()
         self.qa_cache_questions_vectordb = Chroma(
             collection_name="qa_cache_questions_vectordb",
-            embedding_function=OpenAIEmbeddings(),
+            embedding_function=self.qa_embedding_function,
             persist_directory=f"{ckpt_dir}/curriculum/vectordb",
         )
+        if self.qa_cache_questions_vectordb._collection.count() < len(self.qa_cache):
+            # the vectordb is persisted lazily, re-add questions lost in a crash
+            stored = set(
+                self.qa_cache_questions_vectordb._collection.get(
+                    include=["documents"]
+                )["documents"]
+            )
+            missing = [question for question in self.qa_cache if question not in stored]
+            print(
+                f"\033[35mCurriculum Agent re-embedding {len(missing)} cached questions\033[0m"
+            )
+            self.qa_cache_questions_vectordb.add_texts(texts=missing)
+            self.qa_cache_questions_vectordb.persist()
         assert self.qa_cache_questions_vectordb._collection.count() == len(
             self.qa_cache
         ), (
@@ -192,6 +260,30 @@ class CurriculumAgent:
         #訪れたバイオームを記録する新しいセット属性を追加
         self.visited_biomes = set()
 
+    def import_json_checkpoint(self):
+        """
+        Migrate a checkpoint written before curriculum.db existed
+        """
+        print(f"\033[35mImporting json checkpoint into {self.store.db_path}\033[0m")
+        self.store.replace_tasks(
+            U.load_json(f"{self.ckpt_dir}/curriculum/completed_tasks.json"),
+            U.load_json(f"{self.ckpt_dir}/curriculum/failed_tasks.json"),
+        )
+        qa_cache = U.load_json(f"{self.ckpt_dir}/curriculum/qa_cache.json")
+        self.store.add_qa_many(
+            [
+                (question, self.normalize_question(question), answer)
+                for question, answer in qa_cache.items()
+            ]
+        )
+
+    def save(self):
+        """
+        Persist the qa vectordb and queue the json exports of the checkpoint
+        """
+        self.qa_cache_questions_vectordb.persist()
+        self.checkpoint.mark_dirty("curriculum_export")
+
     @property
     def default_warmup(self):
         return {
@@ -248,23 +340,25 @@ class CurriculumAgent:
         
         return system_message2
 
-    def render_observation(self, *, events, chest_observation):
-        assert events[-1][0] == "observe", "Last event must be observe"
-        event = events[-1][1]
-        biome = event["status"]["biome"]
-        time_of_day = event["status"]["timeOfDay"]
-        voxels = event["voxels"]
-        block_records = event["blockRecords"]
-        entities = event["status"]["entities"]
-        health = event["status"]["health"]
-        hunger = event["status"]["food"]
-        position = event["status"]["position"]
-        equipment = event["status"]["equipment"]
-        inventory_used = event["status"]["inventoryUsed"]
-        inventory = event["inventory"]
+    def summarize_tasks(self, tasks, limit=None):
+        """
+        Returns: the tasks joined, or with limit only the most recent ones
+        and the number of earlier tasks
+        """
+        if not tasks:
+            return "None"
+        if limit is None or len(tasks) <= limit:
+            return ", ".join(tasks)
+        return f"{', '.join(tasks[-limit:])} and {len(tasks) - limit} earlier tasks"
+
+    def render_observation(self, *, events, chest_observation, compact_level=0):
+        """
+        compact_level 1 summarizes the task lists, 2 also caps the block lists
+        """
+        obs = U.parse_events(events).observation
         
         # 訪れたバイオームを追加
-        self.visited_biomes.add(biome)
+        self.visited_biomes.add(obs.biome)
         # 訪れたバイオームのリストをテキスト形式で生成
         visited_biomes_text = ", ".join(sorted(self.visited_biomes))
         
@@ -291,56 +385,30 @@ class CurriculumAgent:
         
         
 
-        if not any(
-            "dirt" in block
-            or "log" in block
-            or "grass" in block
-            or "sand" in block
-            or "snow" in block
-            for block in voxels
-        ):
-            biome = "underground"
-
-        other_blocks = ", ".join(
-            list(
-                set(block_records).difference(set(voxels).union(set(inventory.keys())))
-            )
-        )
-
-        other_blocks = other_blocks if other_blocks else "None"
-
-        nearby_entities = (
-            ", ".join([k for k, v in sorted(entities.items(), key=lambda x: x[1])])
-            if entities
-            else "None"
-        )
-
-        completed_tasks = (
-            ", ".join(self.completed_tasks) if self.completed_tasks else "None"
-        )
-        failed_tasks = ", ".join(self.failed_tasks) if self.failed_tasks else "None"
+        task_limit = self.compact_task_limit if compact_level >= 1 else None
+        block_limit = self.compact_block_limit if compact_level >= 2 else None
+        completed_tasks = self.summarize_tasks(self.completed_tasks, task_limit)
+        failed_tasks = self.summarize_tasks(self.failed_tasks, task_limit)
 
         # filter out optional inventory items if required
         if self.progress < self.warm_up["optional_inventory_items"]:
-            inventory = {
-                k: v
-                for k, v in inventory.items()
-                if self._core_inv_items_regex.search(k) is not None
-            }
+            inventory = obs.render("inventory", self._core_inv_items_regex)
+        else:
+            inventory = obs.render("inventory")
 
         observation = {
             "context": "",
-            "biome": f"Biome: {biome}\n\n",
-            "time": f"Time: {time_of_day}\n\n",
-            "nearby_blocks": f"Nearby blocks: {', '.join(voxels) if voxels else 'None'}\n\n",
+            "biome": obs.render("surface_biome"),
+            "time": obs.render("time"),
+            "nearby_blocks": obs.render("nearby_blocks", block_limit),
             # "nearby_blocks": f"Nearby blocks: {voxels2}\n\n",
-            "other_blocks": f"Other blocks that are recently seen: {other_blocks}\n\n",
-            "nearby_entities": f"Nearby entities: {nearby_entities}\n\n",
-            "health": f"Health: {health:.1f}/20\n\n",
-            "hunger": f"Hunger: {hunger:.1f}/20\n\n",
-            "position": f"Position: x={position['x']:.1f}, y={position['y']:.1f}, z={position['z']:.1f}\n\n",
-            "equipment": f"Equipment: {equipment}\n\n",
-            "inventory": f"Inventory ({inventory_used}/36): {inventory if inventory else 'Empty'}\n\n",
+            "other_blocks": obs.render("other_blocks", block_limit),
+            "nearby_entities": obs.render("nearby_entities"),
+            "health": obs.render("health"),
+            "hunger": obs.render("hunger"),
+            "position": obs.render("position"),
+            "equipment": obs.render("equipment"),
+            "inventory": inventory,
             "chests": chest_observation,
             "completed_tasks": f"Completed tasks so far: {completed_tasks}\n\n",
             "failed_tasks": f"Failed tasks that are too hard: {failed_tasks}\n\n",
@@ -353,7 +421,6 @@ class CurriculumAgent:
         return observation
 
     def render_human_message(self, *, events, chest_observation):
-        content = ""
         observation = self.render_observation(
             events=events, chest_observation=chest_observation
         )
@@ -371,6 +438,7 @@ class CurriculumAgent:
                 if i > 5:
                     break
 
+        included = []
         for key in self.curriculum_observations:
             if self.progress >= self.warm_up[key]:
                 if self.warm_up[key] != 0:
@@ -378,7 +446,25 @@ class CurriculumAgent:
                 else:
                     should_include = True
                 if should_include:
-                    content += observation[key]
+                    included.append(key)
+        content = "".join(observation[key] for key in included)
+
+        if self.token_budget is not None:
+            system_message = self.render_system_message()
+            compact_level = 0
+            while compact_level < 2 and self.llm.count_tokens(
+                [system_message, HumanMessage(content=content)]
+            ) > self.token_budget:
+                compact_level += 1
+                compacted = self.render_observation(
+                    events=events,
+                    chest_observation=chest_observation,
+                    compact_level=compact_level,
+                )
+                compacted["context"] = observation["context"]
+                content = "".join(compacted[key] for key in included)
+            if compact_level:
+                token_metrics.record_compaction(self.llm.agent)
 
         print(f"\033[35m****Curriculum Agent human message****\n{content}\033[0m")
         return HumanMessage(content=content)
@@ -392,7 +478,8 @@ class CurriculumAgent:
             return task, context
 
         # hard code task when inventory is almost full
-        inventoryUsed = events[-1][1]["status"]["inventoryUsed"]
+        obs = U.parse_events(events).observation
+        inventoryUsed = obs.inventory_used
         if inventoryUsed >= 33:
             if chest_observation != "Chests: None\n\n":
                 chests = chest_observation[8:-2].split("\n")
@@ -412,7 +499,7 @@ class CurriculumAgent:
                             "You can use bot.inventoryUsed() to check how many inventory slots are used."
                         )
                         return task, context
-            if "chest" in events[-1][1]["inventory"]:
+            if "chest" in obs.inventory:
                 task = "Place a chest"
                 context = (
                     f"You have a chest in inventory, place it around you. "
@@ -449,21 +536,39 @@ class CurriculumAgent:
     def propose_next_ai_task(self, *, messages, max_retries=5):
         if max_retries == 0:
             raise RuntimeError("Max retries reached, failed to propose ai task.")
-        curriculum = self.llm(messages).content
-        print(f"\033[31m****Curriculum Agent ai message****\n{curriculum}\033[0m")
+        if self.samples > 1:
+            candidates = [
+                ai_message.content
+                for ai_message in self.llm.sample(messages, self.samples)
+            ]
+        else:
+            candidates = [self.llm(messages, stop_when=line_complete("Task:")).content]
+        tasks = []
+        for curriculum in candidates:
+            print(f"\033[31m****Curriculum Agent ai message****\n{curriculum}\033[0m")
+            try:
+                response = self.parse_ai_message(curriculum)
+                assert "next_task" in response
+                tasks.append(response["next_task"])
+            except Exception as e:
+                print(f"\033[35mError parsing curriculum response: {e}\033[0m")
+        if not tasks:
+            print("\033[35mNo curriculum response could be parsed. Trying again!\033[0m")
+            return self.propose_next_ai_task(
+                messages=messages,
+                max_retries=max_retries - 1,
+            )
+        # the samples only guard against unparsable responses
+        task = tasks[0]
         try:
-            response = self.parse_ai_message(curriculum)
-            assert "next_task" in response
-            context = self.get_task_context(response["next_task"])
-            return response["next_task"], context
+            context = self.get_task_context(task)
         except Exception as e:
-            print(
-                f"\033[35mError parsing curriculum response: {e}. Trying again!\033[0m"
-            )
+            print(f"\033[35mError getting task context: {e}. Trying again!\033[0m")
             return self.propose_next_ai_task(
                 messages=messages,
                 max_retries=max_retries - 1,
             )
+        return task, context
             
     ## 世界モデル検証        
     def propose_next_ai_task2(self, *, messages, max_retries=5):
@@ -499,38 +604,32 @@ class CurriculumAgent:
             return
         if info["success"]:
             print(f"\033[35mCompleted task {task}.\033[0m")
-            self.completed_tasks.append(task)
+            if task not in self.completed_tasks:
+                self.completed_tasks.append(task)
+            self.failed_tasks = [t for t in self.failed_tasks if t != task]
+            self.store.add_completed_task(task)
         else:
             print(
                 f"\033[35mFailed to complete task {task}. Skipping to next task.\033[0m"
             )
-            self.failed_tasks.append(task)
-
-        # clean up tasks and dump to disk
-        self.clean_up_tasks()
+            # a task completed before is not listed as failed
+            if task not in self.completed_tasks:
+                self.failed_tasks.append(task)
+                self.store.add_failed_task(task)
+        self.checkpoint.mark_dirty("curriculum_export")
 
     def clean_up_tasks(self):
-        updated_completed_tasks = []
-        # record repeated failed tasks
-        updated_failed_tasks = self.failed_tasks
+        """
+        Dedup completed tasks, drop completed tasks from failed tasks and
+        write both lists to the store, e.g. after editing the lists directly
+        """
         # dedup but keep order
-        for task in self.completed_tasks:
-            if task not in updated_completed_tasks:
-                updated_completed_tasks.append(task)
-
-        # remove completed tasks from failed tasks
-        for task in updated_completed_tasks:
-            while task in updated_failed_tasks:
-                updated_failed_tasks.remove(task)
-
-        self.completed_tasks = updated_completed_tasks
-        self.failed_tasks = updated_failed_tasks
-
-        # dump to json
-        U.dump_json(
-            self.completed_tasks, f"{self.ckpt_dir}/curriculum/completed_tasks.json"
-        )
-        U.dump_json(self.failed_tasks, f"{self.ckpt_dir}/curriculum/failed_tasks.json")
+        self.completed_tasks = list(dict.fromkeys(self.completed_tasks))
+        # record repeated failed tasks
+        completed = set(self.completed_tasks)
+        self.failed_tasks = [task for task in self.failed_tasks if task not in completed]
+        self.store.replace_tasks(self.completed_tasks, self.failed_tasks)
+        self.checkpoint.mark_dirty("curriculum_export")
 
     def decompose_task(self, task, events):
         messages = [
@@ -547,34 +646,71 @@ class CurriculumAgent:
         print(f"\033[31m****Curriculum Agent task decomposition****\n{response}\033[0m")
         return fix_and_parse_json(response)
 
+    @staticmethod
+    def normalize_question(question):
+        return " ".join(question.lower().split()).rstrip("?").strip()
+
+    def lookup_qa_cache(self, questions):
+        """
+        Find cached questions matching the given ones, first by normalized text
+        and then with one batched similarity query for the remaining questions.
+        :return: list of the matching cached question or None for each question
+        """
+        cached = [
+            self.qa_cache_normalized.get(self.normalize_question(question))
+            for question in questions
+        ]
+        misses = [i for i, question in enumerate(cached) if question is None]
+        if not misses or self.qa_cache_questions_vectordb._collection.count() == 0:
+            return cached
+        embeddings = self.qa_embedding_function.embed_documents(
+            [questions[i] for i in misses]
+        )
+        results = self.qa_cache_questions_vectordb._collection.query(
+            query_embeddings=embeddings,
+            n_results=1,
+            include=["documents", "distances"],
+        )
+        for i, documents, distances in zip(
+            misses, results["documents"], results["distances"]
+        ):
+            if documents and distances[0] < self.qa_cache_similarity_threshold:
+                assert documents[0] in self.qa_cache
+                cached[i] = documents[0]
+        return cached
+
+    def add_qa_cache(self, question, answer):
+        normalized = self.normalize_question(question)
+        self.qa_cache[question] = answer
+        self.qa_cache_normalized[normalized] = question
+        self.store.add_qa(question, normalized, answer)
+        self.checkpoint.mark_dirty("curriculum_export")
+        # persisted in save(), lost entries are re-added on resume
+        self.qa_cache_questions_vectordb.add_texts(
+            texts=[question],
+        )
+
     def run_qa(self, *, events, chest_observation):
         questions_new, _ = self.run_qa_step1_ask_questions(
             events=events, chest_observation=chest_observation
         )
         questions = []
         answers = []
-        for question in questions_new:
-            if self.qa_cache_questions_vectordb._collection.count() > 0:
-                docs_and_scores = (
-                    self.qa_cache_questions_vectordb.similarity_search_with_score(
-                        question, k=1
-                    )
+        for question, question_cached in zip(
+            questions_new, self.lookup_qa_cache(questions_new)
+        ):
+            if question_cached is None:
+                # the same question may be asked twice in one batch
+                question_cached = self.qa_cache_normalized.get(
+                    self.normalize_question(question)
                 )
-                if docs_and_scores and docs_and_scores[0][1] < 0.05:
-                    question_cached = docs_and_scores[0][0].page_content
-                    assert question_cached in self.qa_cache
-                    answer_cached = self.qa_cache[question_cached]
-                    questions.append(question_cached)
-                    answers.append(answer_cached)
-                    continue
+            if question_cached is not None:
+                questions.append(question_cached)
+                answers.append(self.qa_cache[question_cached])
+                continue
             answer = self.run_qa_step2_answer_questions(question=question)
             assert question not in self.qa_cache
-            self.qa_cache[question] = answer
-            self.qa_cache_questions_vectordb.add_texts(
-                texts=[question],
-            )
-            U.dump_json(self.qa_cache, f"{self.ckpt_dir}/curriculum/qa_cache.json")
-            self.qa_cache_questions_vectordb.persist()
+            self.add_qa_cache(question, answer)
             questions.append(question)
             answers.append(answer)
         assert len(questions_new) == len(questions) == len(answers)
@@ -586,16 +722,12 @@ class CurriculumAgent:
             f"How to {task.replace('_', ' ').replace(' ore', '').replace(' ores', '').replace('.', '').strip().lower()}"
             f" in Minecraft?"
         )
-        if question in self.qa_cache:
-            answer = self.qa_cache[question]
+        question_cached = self.qa_cache_normalized.get(self.normalize_question(question))
+        if question_cached is not None:
+            answer = self.qa_cache[question_cached]
         else:
             answer = self.run_qa_step2_answer_questions(question=question)
-            self.qa_cache[question] = answer
-            self.qa_cache_questions_vectordb.add_texts(
-                texts=[question],
-            )
-            U.dump_json(self.qa_cache, f"{self.ckpt_dir}/curriculum/qa_cache.json")
-            self.qa_cache_questions_vectordb.persist()
+            self.add_qa_cache(question, answer)
         context = f"Question: {question}\n{answer}"
         return context
 
@@ -612,7 +744,7 @@ class CurriculumAgent:
         return HumanMessage(content=content)
 
     def run_qa_step1_ask_questions(self, *, events, chest_observation):
-        biome = events[-1][1]["status"]["biome"].replace("_", " ")
+        biome = U.parse_events(events).observation.biome.replace("_", " ")
         questions = [
             f"What are the blocks that I can find in the {biome} in Minecraft?",
             f"What are the items that I can find in the {biome} in Minecraft?",
@@ -659,6 +791,26 @@ class CurriculumAgent:
             self.render_human_message_qa_step2_answer_questions(question=question),
         ]
         print(f"\033[35mCurriculum Agent Question: {question}\033[0m")
-        qa_answer = self.qa_llm(messages).content
+        if self.qa_router is None:
+            return self.answer_question(self.qa_llm, messages)
+        return self.qa_router(
+            lambda llm: self.check_answer(self.answer_question(llm, messages)),
+            lambda llm: self.answer_question(llm, messages),
+        )
+
+    def answer_question(self, llm, messages):
+        qa_answer = llm(messages).content
         print(f"\033[31mCurriculum Agent {qa_answer}\033[0m")
         return qa_answer
+
+    @staticmethod
+    def check_answer(qa_answer):
+        """
+        Returns: (qa_answer, escalation reason or None)
+        """
+        if not qa_answer.strip().startswith("Answer:"):
+            return qa_answer, "parse_failure"
+        answer = qa_answer.strip()[len("Answer:") :].strip().rstrip(".").lower()
+        if answer in ["", "unknown"]:
+            return qa_answer, "low_confidence"
+        return qa_answer, None
@@ -0,0 +1,134 @@
+// Parse a program in a single bridge call. The babel modules are passed in
+// by the python side, which installs and loads them through the bridge.
+module.exports = function (babel, generator) {
+    const generate = generator.default;
+
+    function describeArgument(node) {
+        switch (node.type) {
+            case "StringLiteral":
+                return { kind: "string", value: node.value };
+            case "NumericLiteral":
+                return { kind: "number", value: node.value };
+            case "BooleanLiteral":
+                return { kind: "boolean", value: node.value };
+            case "Identifier":
+                return { kind: "identifier", value: node.name };
+            case "ObjectExpression":
+            case "NewExpression":
+                return { kind: "object", value: null };
+            case "ArrayExpression":
+                return { kind: "array", value: null };
+            case "FunctionExpression":
+            case "ArrowFunctionExpression":
+                return { kind: "function", value: null };
+            default:
+                return { kind: "other", value: null };
+        }
+    }
+
+    function declareNames(pattern, declared) {
+        if (!pattern) {
+            return;
+        }
+        if (pattern.type === "Identifier") {
+            declared.add(pattern.name);
+        } else if (pattern.type === "ObjectPattern") {
+            for (const property of pattern.properties) {
+                declareNames(property.value || property.argument, declared);
+            }
+        } else if (pattern.type === "ArrayPattern") {
+            for (const element of pattern.elements) {
+                declareNames(element, declared);
+            }
+        } else if (pattern.type === "AssignmentPattern") {
+            declareNames(pattern.left, declared);
+        } else if (pattern.type === "RestElement") {
+            declareNames(pattern.argument, declared);
+        }
+    }
+
+    // collect calls of plain identifiers and every name the program declares
+    function walk(node, calls, declared) {
+        if (!node || typeof node.type !== "string") {
+            return;
+        }
+        if (node.type === "CallExpression" && node.callee.type === "Identifier") {
+            calls.push({
+                name: node.callee.name,
+                args: node.arguments.map(describeArgument),
+            });
+        } else if (node.type === "VariableDeclarator") {
+            declareNames(node.id, declared);
+        } else if (node.type === "CatchClause") {
+            declareNames(node.param, declared);
+        }
+        if (node.type.includes("Function")) {
+            if (node.id) {
+                declared.add(node.id.name);
+            }
+            for (const param of node.params) {
+                declareNames(param, declared);
+            }
+        }
+        for (const key of Object.keys(node)) {
+            if (key === "loc" || key.endsWith("Comments")) {
+                continue;
+            }
+            const child = node[key];
+            if (Array.isArray(child)) {
+                for (const item of child) {
+                    walk(item, calls, declared);
+                }
+            } else if (child && typeof child === "object") {
+                walk(child, calls, declared);
+            }
+        }
+    }
+
+    function parseProgram(code) {
+        let ast;
+        try {
+            ast = babel.parse(code);
+        } catch (e) {
+            return JSON.stringify({ error: e.message });
+        }
+        const functions = [];
+        for (const node of ast.program.body) {
+            if (node.type !== "FunctionDeclaration") {
+                continue;
+            }
+            functions.push({
+                name: node.id.name,
+                type: node.async ? "AsyncFunctionDeclaration" : "FunctionDeclaration",
+                body: generate(node).code,
+                params: node.params.map((param) =>
+                    param.type === "Identifier" ? param.name : generate(param).code
+                ),
+            });
+        }
+        const calls = [];
+        const declared = new Set();
+        walk(ast.program, calls, declared);
+        return JSON.stringify({
+            statements: ast.program.body.length,
+            functions,
+            calls,
+            declared: [...declared],
+            // calls resolved by the javascript runtime itself, e.g. setTimeout
+            globals: [...new Set(calls.map((call) => call.name))].filter(
+                (name) => typeof globalThis[name] !== "undefined"
+            ),
+        });
+    }
+
+    // item, block and entity names of a minecraft-data registry
+    function registryNames(mcData) {
+        return JSON.stringify({
+            items: Object.keys(mcData.itemsByName),
+            blocks: Object.keys(mcData.blocksByName),
+            entities: Object.keys(mcData.entitiesByName),
+        });
+    }
+
+    return { parseProgram, registryNames };
+};
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import voyager.utils as U
+from javascript import require
+
+
+class ProgramParseError(Exception):
+    """
+    The code does not parse, retrying cannot help
+    """
+
+
+class ProgramParser:
+    """
+    Extracts the top-level function declarations of a program, with their
+    async-ness, parameter names and regenerated code, in a single call to
+    parse_program.js through the javascript bridge. Babel and the script are
+    loaded once, and results are cached by code hash.
+    """
+
+    def __init__(self, cache_size=256, max_retries=3):
+        babel = require("@babel/core")
+        babel_generator = require("@babel/generator")
+        self.service = require(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "parse_program.js")
+        )(babel, babel_generator)
+        self.cache_size = cache_size
+        self.max_retries = max_retries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def parse(self, code):
+        """
+        Returns: {"statements": number of top-level statements,
+            "functions": [{"name", "type", "body", "params"}]}
+        Raises: ProgramParseError for syntax errors, which are cached too
+        """
+        key = U.code_hash(code)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                result = self.cache[key]
+                if "error" in result:
+                    raise ProgramParseError(result["error"])
+                return result
+        result = self.call(code)
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        if "error" in result:
+            raise ProgramParseError(result["error"])
+        return result
+
+    def call(self, code):
+        # only failures of the bridge itself are worth retrying
+        for retry in range(self.max_retries):
+            try:
+                return json.loads(self.service.parseProgram(code))
+            except Exception:
+                if retry == self.max_retries - 1:
+                    raise
+                time.sleep(1)
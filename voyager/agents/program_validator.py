@@ -0,0 +1,119 @@
+import json
+import re
+
+from javascript import require
+from voyager.control_primitives import load_control_primitives
+from voyager.prompts import PROMPTS
+
+# argument kinds of the control primitives, after bot. A kind is checked
+# against literal arguments only, and string literals are looked up in the
+# registry named next to it.
+PRIMITIVE_SIGNATURES = {
+    "mineBlock": [("string", "blocks"), ("number", None)],
+    "craftItem": [("string", "items"), ("number", None)],
+    "placeItem": [("string", "items"), ("object", None)],
+    "smeltItem": [("string", "items"), ("string", "items"), ("number", None)],
+    "killMob": [("string", "entities"), ("number", None)],
+    "exploreUntil": [("object", None), ("number", None), ("function", None)],
+    "getItemFromChest": [("object", None), ("object", None)],
+    "depositItemIntoChest": [("object", None), ("object", None)],
+    "checkItemInsideChest": [("object", None)],
+}
+
+REGISTRY_KINDS = {"blocks": "block", "items": "item", "entities": "mob"}
+
+_FUNCTION_PATTERN = re.compile(r"(?:async\s+)?function\s*\*?\s*(\w+)\s*\(")
+# const x = require(...) and const { a, b: { c } } = require(...)
+_REQUIRE_PATTERN = re.compile(
+    r"(?:const|let|var)\s+(\w+|\{(?:[^{}]|\{[^{}]*\})*\})\s*=\s*require\("
+)
+
+
+class ProgramValidator:
+    """
+    Static checks of a parsed program before it is sent to the env:
+    every called function must be declared by the program, be a skill, a
+    control primitive, a function of the mineflayer env or a javascript
+    global, and literal arguments of control primitives must have the right
+    type and name a known item, block or mob of the game version.
+    """
+
+    def __init__(self, program_parser, game_version="1.19"):
+        self.env_functions = set()
+        for primitive in load_control_primitives():
+            self.env_functions.update(_FUNCTION_PATTERN.findall(primitive))
+        # programs are evaluated inside index.js, so its functions, the
+        # names it binds with require and require itself are in scope
+        index_js = PROMPTS.load_text("env/mineflayer/index.js")
+        self.env_functions.update(_FUNCTION_PATTERN.findall(index_js))
+        for binding in _REQUIRE_PATTERN.findall(index_js):
+            self.env_functions.update(re.findall(r"\w+", binding))
+        self.env_functions.add("require")
+        try:
+            mc_data = require("minecraft-data")(game_version)
+            names = json.loads(program_parser.service.registryNames(mc_data))
+            self.registry = {kind: set(names[kind]) for kind in REGISTRY_KINDS}
+            # aliases the env adds to mcData
+            self.registry["items"].update(
+                ["leather_cap", "leather_tunic", "leather_pants", "lapis_lazuli_ore"]
+            )
+            self.registry["blocks"].add("lapis_lazuli_ore")
+        except Exception as e:
+            print(
+                f"\033[33mProgram validator could not load minecraft-data {game_version}, "
+                f"item names are not checked: {e}\033[0m"
+            )
+            self.registry = None
+
+    def validate(self, analysis, skill_names=()):
+        """
+        Args:
+            analysis: calls, declared and globals of a program, as returned
+                by ProgramParser.parse
+            skill_names: names of the skills in the library
+        Returns: list of error messages, empty if the program looks valid
+        """
+        errors = []
+        known = (
+            self.env_functions
+            | set(skill_names)
+            | set(analysis["declared"])
+            | set(analysis["globals"])
+        )
+        undefined = []
+        for call in analysis["calls"]:
+            name = call["name"]
+            if name not in known:
+                if name not in undefined:
+                    undefined.append(name)
+                continue
+            if name in PRIMITIVE_SIGNATURES and name not in analysis["declared"]:
+                errors += self.check_arguments(name, call["args"])
+        for name in undefined:
+            errors.append(
+                f"{name} is not defined. Only call functions you define, "
+                f"the given skills and control primitives, or mineflayer APIs."
+            )
+        return errors
+
+    def check_arguments(self, name, args):
+        errors = []
+        signature = PRIMITIVE_SIGNATURES[name]
+        for i, (arg, (kind, registry)) in enumerate(zip(args[1:], signature)):
+            if arg["kind"] in ["identifier", "other"]:
+                continue
+            if arg["kind"] != kind:
+                errors.append(
+                    f"argument {i + 2} of {name} must be a {kind}, got {arg['kind']}"
+                )
+                continue
+            if (
+                registry
+                and self.registry is not None
+                and arg["value"] not in self.registry[registry]
+            ):
+                errors.append(
+                    f"{arg['value']} passed to {name} is not a valid "
+                    f"{REGISTRY_KINDS[registry]} name"
+                )
+        return errors
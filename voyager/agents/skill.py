@@ -1,7 +1,10 @@
-import os
+import queue
+import threading
+
+import numpy as np
 
 import voyager.utils as U
-from langchain.chat_models import ChatOpenAI
+from voyager.llm import ChatModel, ModelRouter
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.vectorstores import Chroma
@@ -16,79 +19,372 @@ class SkillManager:
         model_name="gpt-3.5-turbo",
         temperature=0,
         retrieval_top_k=5,
+        retrieval_mode="hybrid",
         request_timout=120,
         ckpt_dir="ckpt",
         resume=False,
+        background_ingest=True,
+        checkpoint=None,
+        fast_model_name=None,
     ):
-        self.llm = ChatOpenAI(
+        self.llm = ChatModel(
+            "skill",
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timout,
         )
+        # descriptions are first written by the fast model, if any, and
+        # escalated to model_name when they are not a single line of text
+        self.router = None
+        if fast_model_name is not None:
+            self.router = ModelRouter(
+                "skill",
+                ChatModel(
+                    "skill_fast",
+                    model_name=fast_model_name,
+                    temperature=temperature,
+                    request_timeout=request_timout,
+                ),
+                self.llm,
+            )
+        # programs for env execution
+        self.control_primitives = load_control_primitives()
+        self.retrieval_top_k = retrieval_top_k
+        assert retrieval_mode in [
+            "vector",
+            "hybrid",
+        ], f"retrieval mode {retrieval_mode} not supported"
+        self.retrieval_mode = retrieval_mode
+        self.ckpt_dir = ckpt_dir
+        # retrieval results keyed by (normalized query, library version),
+        # the version is bumped whenever the library changes
+        self.version = 0
+        self.retrieval_cache = {}
+        self.embedding_function = OpenAIEmbeddings()
+        self.lock = threading.RLock()
+        # serializes vectordb access, taken inside self.lock by commits and
+        # queries and alone by the checkpoint writer persisting the vectordb
+        self.vectordb_lock = threading.Lock()
+        self.pending_skills = {}
+        self.ingest_queue = queue.Queue()
+        self.ingest_worker = None
+        self.background_ingest = background_ingest
+        # lexical index over skill names, descriptions and item names in code
+        self.lexical_index = U.BM25Index()
+        self.lexical_terms = set()
+        # items produced / consumed by each skill, backfilled from skill code
+        self.item_catalogue = U.ItemCatalogue()
+        self.checkpoint = checkpoint or U.CheckpointManager(ckpt_dir, background=False)
+        if U.f_exists(f"{ckpt_dir}/manifest.json"):
+            self.load_packed_library(ckpt_dir)
+            return
+        self.packed_library = None
         U.f_mkdir(f"{ckpt_dir}/skill/code")
         U.f_mkdir(f"{ckpt_dir}/skill/description")
         U.f_mkdir(f"{ckpt_dir}/skill/vectordb")
-        # programs for env execution
-        self.control_primitives = load_control_primitives()
+        self.checkpoint.register(
+            "skills", f"{ckpt_dir}/skill/skills.json", lambda: dict(self.skills)
+        )
+        self.checkpoint.register(
+            "skill_items",
+            f"{ckpt_dir}/skill/items.json",
+            lambda: self.item_catalogue.to_json(),
+        )
+        self.checkpoint.register(
+            "skill_versions",
+            f"{ckpt_dir}/skill/versions.json",
+            lambda: {
+                name: list(versions)
+                for name, versions in self.version_index.versions.items()
+            },
+        )
+        self.checkpoint.register(
+            "skill_pending",
+            f"{ckpt_dir}/skill/pending.json",
+            lambda: dict(self.pending_skills),
+        )
+        # skills.json, versions.json and pending.json are read as of the
+        # last committed checkpoint batch, so they agree with each other
         if resume:
             print(f"\033[33mLoading Skill Manager from {ckpt_dir}/skill\033[0m")
-            self.skills = U.load_json(f"{ckpt_dir}/skill/skills.json")
+            self.skills = self.checkpoint.load_json(f"{ckpt_dir}/skill/skills.json")
         else:
             self.skills = {}
-        self.retrieval_top_k = retrieval_top_k
-        self.ckpt_dir = ckpt_dir
+        # name -> stored versions with content hashes, see skill/versions.json
+        versions = None
+        if U.f_exists(f"{ckpt_dir}/skill/versions.json"):
+            versions = self.checkpoint.load_json(f"{ckpt_dir}/skill/versions.json")
+        self.version_index = U.SkillVersionIndex(f"{ckpt_dir}/skill/code", versions)
+        # skills waiting for description and embedding, journaled to disk so
+        # that they are ingested on resume if the process dies before commit
+        if U.f_exists(f"{ckpt_dir}/skill/pending.json"):
+            self.pending_skills = self.checkpoint.load_json(
+                f"{ckpt_dir}/skill/pending.json"
+            )
         self.vectordb = Chroma(
             collection_name="skill_vectordb",
-            embedding_function=OpenAIEmbeddings(),
+            embedding_function=self.embedding_function,
             persist_directory=f"{ckpt_dir}/skill/vectordb",
         )
+        if resume:
+            self.reconcile_vectordb()
         assert self.vectordb._collection.count() == len(self.skills), (
             f"Skill Manager's vectordb is not synced with skills.json.\n"
             f"There are {self.vectordb._collection.count()} skills in vectordb but {len(self.skills)} skills in skills.json.\n"
             f"Did you set resume=False when initializing the manager?\n"
             f"You may need to manually delete the vectordb directory for running from scratch."
         )
+        # persisted by the checkpoint writer, outside self.lock
+        self.checkpoint.register_export("skill_vectordb", self.persist_vectordb)
+        for skill_name, entry in self.skills.items():
+            self.index_skill(skill_name, entry["code"], entry["description"])
+        self.build_item_catalogue()
+        for program_name, program_code in list(self.pending_skills.items()):
+            if self.version_index.is_latest(program_name, program_code):
+                # committed after the checkpoint batch that journaled it
+                del self.pending_skills[program_name]
+                self.checkpoint.mark_dirty("skill_pending")
+                continue
+            print(f"\033[33mSkill Manager resuming ingestion of {program_name}\033[0m")
+            self.enqueue_skill(program_name, program_code)
+
+    def reconcile_vectordb(self):
+        """
+        Bring skills.json in line with the vectordb after a crash. The
+        vectordb is persisted before each checkpoint batch is committed, so
+        it may hold skills, or newer versions of them, that were committed
+        after the batch skills.json was loaded from. Their code and
+        description files are written on commit, so they are recovered from
+        skill/code. Skills whose vector was not persisted are embedded again.
+        """
+        stored = self.vectordb._collection.get(include=["documents"])
+        documents = dict(zip(stored["ids"], stored["documents"]))
+        recovered = []
+        for name, document in documents.items():
+            if (
+                name in self.skills
+                and self.skills[name]["description"] == document
+                and not self.version_index.has_unindexed(name)
+            ):
+                continue
+            file = self.find_stored_version(name, document)
+            latest = self.version_index.latest(name)
+            if file is None or (
+                name in self.skills and latest is not None and latest["file"] == file
+            ):
+                # already in skills.json, or an older description than
+                # skills.json that is embedded again below
+                continue
+            code = U.load_text(f"{self.ckpt_dir}/skill/code/{file}.js")
+            self.skills[name] = {"code": code, "description": document}
+            if file not in {v["file"] for v in self.version_index.get_versions(name)}:
+                self.version_index.add(name, file, code)
+            recovered.append(name)
+        missing = [
+            name
+            for name in self.skills
+            if documents.get(name) != self.skills[name]["description"]
+        ]
+        if not recovered and not missing:
+            return
+        print(
+            f"\033[33mSkill Manager reconciling skills.json with the vectordb: "
+            f"recovered {len(recovered)}, embedding {len(missing)} skills\033[0m"
+        )
+        if missing:
+            outdated = [name for name in missing if name in documents]
+            if outdated:
+                self.vectordb._collection.delete(ids=outdated)
+            self.vectordb.add_texts(
+                texts=[self.skills[name]["description"] for name in missing],
+                ids=missing,
+                metadatas=[{"name": name} for name in missing],
+            )
+            self.vectordb.persist()
+        self.checkpoint.mark_dirty("skills")
+        self.checkpoint.mark_dirty("skill_versions")
+
+    def find_stored_version(self, name, description):
+        """
+        Returns: the newest stored version of a skill if its description
+        file holds description, else None
+        """
+        files = self.version_index.stored_files(name)
+        if not files:
+            return None
+        path = f"{self.ckpt_dir}/skill/description/{files[-1]}.txt"
+        if U.f_exists(path) and U.load_text(path) == description:
+            return files[-1]
+        return None
+
+    def persist_vectordb(self):
+        with self.vectordb_lock:
+            self.vectordb.persist()
+
+    def load_packed_library(self, library_dir):
+        """
+        Open a packed library (see voyager/utils/pack_utils.py) read-only.
+        Skill code is only decoded when a skill is retrieved or executed.
+        """
+        print(f"\033[33mLoading packed skill library from {library_dir}\033[0m")
+        self.packed_library = U.PackedSkillLibrary(library_dir)
+        assert self.packed_library.embedding_model == self.embedding_model, (
+            f"Packed library was embedded with {self.packed_library.embedding_model} "
+            f"but the Skill Manager uses {self.embedding_model}"
+        )
+        self.skills = self.packed_library.skills
+        self.vectordb = None
+        self.version_index = None
+        for entry in self.packed_library.entries:
+            # the manifest already holds the item names found in the code
+            items = sorted(set().union(*entry["items"].values()))
+            self.index_skill(entry["name"], "", entry["description"], items=items)
+            self.item_catalogue.add_usage(entry["name"], entry["items"])
+
+    def pack(self, output_dir):
+        """
+        Write this library in the packed format, for fast read-only loading
+        with SkillManager(ckpt_dir=output_dir)
+        """
+        assert self.packed_library is None, "Library is already packed"
+        self.flush()
+        with self.lock:
+            names = list(self.skills.keys())
+            embeddings = {}
+            if names:
+                with self.vectordb_lock:
+                    stored = self.vectordb._collection.get(
+                        ids=names, include=["embeddings"]
+                    )
+                embeddings = dict(zip(stored["ids"], stored["embeddings"]))
+            U.pack_skill_library(
+                output_dir,
+                skills=self.skills,
+                embeddings=embeddings,
+                embedding_model=self.embedding_model,
+                item_usage=self.item_catalogue.skill_items,
+            )
+        print(f"\033[33mSkill Manager packed {len(names)} skills to {output_dir}\033[0m")
 
     @property
     def programs(self):
-        programs = ""
-        for skill_name, entry in self.skills.items():
-            programs += f"{entry['code']}\n\n"
+        if self.packed_library is not None:
+            # one decode of the shared code blob, nothing is pending in a
+            # read-only library
+            programs = self.packed_library.programs()
+        else:
+            programs = ""
+            with self.lock:
+                for skill_name, entry in self.skills.items():
+                    if skill_name not in self.pending_skills:
+                        programs += f"{entry['code']}\n\n"
+                for skill_name, code in self.pending_skills.items():
+                    programs += f"{code}\n\n"
         for primitives in self.control_primitives:
             programs += f"{primitives}\n\n"
         return programs
 
+    def skill_names(self):
+        """
+        Returns: names of all skills, including those still being ingested
+        """
+        with self.lock:
+            return set(self.skills) | set(self.pending_skills)
+
     def add_new_skill(self, info):
         if info["task"].startswith("Deposit useless items into the chest at"):
             # No need to reuse the deposit skill
             return
+        if self.packed_library is not None:
+            print(
+                f"\033[33mSkill Manager is read-only with a packed library, "
+                f"not saving {info['program_name']}\033[0m"
+            )
+            return
         program_name = info["program_name"]
         program_code = info["program_code"]
+        with self.lock:
+            if self.pending_skills.get(program_name, None) == program_code or (
+                program_name not in self.pending_skills
+                and self.version_index.is_latest(program_name, program_code)
+            ):
+                print(
+                    f"\033[33mSkill {program_name} is unchanged. Skipping!\033[0m"
+                )
+                return
+            self.pending_skills[program_name] = program_code
+            self.checkpoint.mark_dirty("skill_pending")
+        self.enqueue_skill(program_name, program_code)
+
+    def enqueue_skill(self, program_name, program_code):
+        if not self.background_ingest:
+            self.ingest_skill(program_name, program_code)
+            return
+        if self.ingest_worker is None:
+            self.ingest_worker = threading.Thread(
+                target=self.run_ingest_worker, daemon=True
+            )
+            self.ingest_worker.start()
+        self.ingest_queue.put((program_name, program_code))
+
+    def run_ingest_worker(self):
+        while True:
+            program_name, program_code = self.ingest_queue.get()
+            try:
+                self.ingest_skill(program_name, program_code)
+            except Exception as e:
+                # the skill stays in pending.json and is retried on resume
+                print(f"\033[31mSkill Manager failed to ingest {program_name}: {e}\033[0m")
+            finally:
+                self.ingest_queue.task_done()
+
+    def flush(self):
+        """
+        Block until all queued skills are described, embedded and committed,
+        and their files and the vectordb are written by the checkpoint writer
+        """
+        self.ingest_queue.join()
+        self.checkpoint.flush()
+
+    def ingest_skill(self, program_name, program_code):
         skill_description = self.generate_skill_description(program_name, program_code)
         print(
             f"\033[33mSkill Manager generated description for {program_name}:\n{skill_description}\033[0m"
         )
-        if program_name in self.skills:
-            print(f"\033[33mSkill {program_name} already exists. Rewriting!\033[0m")
-            self.vectordb._collection.delete(ids=[program_name])
-            i = 2
-            while f"{program_name}V{i}.js" in os.listdir(f"{self.ckpt_dir}/skill/code"):
-                i += 1
-            dumped_program_name = f"{program_name}V{i}"
-        else:
-            dumped_program_name = program_name
-        self.vectordb.add_texts(
-            texts=[skill_description],
-            ids=[program_name],
-            metadatas=[{"name": program_name}],
-        )
+        # the embedding request runs without the lock so that retrieval in
+        # the learn loop is not blocked by it
+        embedding = self.embedding_function.embed_documents([skill_description])[0]
+        with self.lock:
+            self.commit_skill(program_name, program_code, skill_description, embedding)
+            # a newer version of the skill may have been queued meanwhile
+            if self.pending_skills.get(program_name) == program_code:
+                del self.pending_skills[program_name]
+            # written in the same checkpoint batch as skills.json
+            self.checkpoint.mark_dirty("skill_pending")
+
+    def commit_skill(self, program_name, program_code, skill_description, embedding):
+        """
+        Add a described and embedded skill, called with self.lock held
+        """
+        with self.vectordb_lock:
+            if program_name in self.skills:
+                print(f"\033[33mSkill {program_name} already exists. Rewriting!\033[0m")
+                self.vectordb._collection.delete(ids=[program_name])
+            self.vectordb._collection.add(
+                ids=[program_name],
+                embeddings=[embedding],
+                documents=[skill_description],
+                metadatas=[{"name": program_name}],
+            )
+            n_vectors = self.vectordb._collection.count()
+        dumped_program_name = self.version_index.allocate(program_name)
         self.skills[program_name] = {
             "code": program_code,
             "description": skill_description,
         }
-        assert self.vectordb._collection.count() == len(
-            self.skills
-        ), "vectordb is not synced with skills.json"
+        self.index_skill(program_name, program_code, skill_description)
+        self.item_catalogue.add(program_name, program_code)
+        assert n_vectors == len(self.skills), "vectordb is not synced with skills.json"
         U.dump_text(
             program_code, f"{self.ckpt_dir}/skill/code/{dumped_program_name}.js"
         )
@@ -96,8 +392,167 @@ class SkillManager:
             skill_description,
             f"{self.ckpt_dir}/skill/description/{dumped_program_name}.txt",
         )
-        U.dump_json(self.skills, f"{self.ckpt_dir}/skill/skills.json")
-        self.vectordb.persist()
+        self.version_index.add(program_name, dumped_program_name, program_code)
+        self.checkpoint.mark_dirty("skill_vectordb")
+        self.checkpoint.mark_dirty("skills")
+        self.checkpoint.mark_dirty("skill_items")
+        self.checkpoint.mark_dirty("skill_versions")
+        self.version += 1
+        self.retrieval_cache = {}
+
+    def get_skill_versions(self, program_name):
+        """
+        :return: stored versions of a skill, oldest first, as dicts with
+        "file", "hash", "code" and "description"
+        """
+        versions = []
+        if self.version_index is None:
+            return versions
+        for entry in self.version_index.get_versions(program_name):
+            file = entry["file"]
+            description_path = f"{self.ckpt_dir}/skill/description/{file}.txt"
+            versions.append(
+                {
+                    **entry,
+                    "code": U.load_text(f"{self.ckpt_dir}/skill/code/{file}.js"),
+                    "description": U.load_text(description_path)
+                    if U.f_exists(description_path)
+                    else "",
+                }
+            )
+        return versions
+
+    @property
+    def embedding_model(self):
+        return self.embedding_function.model
+
+    @staticmethod
+    def load_embedding_model(library_dir):
+        # libraries written before embedding.json existed used langchain's default
+        path = f"{library_dir}/skill/embedding.json"
+        if U.f_exists(path):
+            return U.load_json(path)["model"]
+        return "text-embedding-ada-002"
+
+    def import_libraries(self, library_dirs, similarity_threshold=0.98):
+        """
+        Merge other skill libraries into this one in a single batch.
+        Skills whose normalized code matches an existing skill, whose name is
+        already taken (by this library or by an earlier library in
+        library_dirs, so the first copy of a name wins), or whose description embedding has cosine similarity
+        >= similarity_threshold with an existing skill are skipped.
+        Stored embeddings are reused when the source library used the same
+        embedding model, the rest are embedded in one batch.
+        :param library_dirs: ckpt dirs containing a skill/ folder
+        :return: dict with the imported and skipped skill names
+        """
+        assert self.packed_library is None, "Cannot import into a packed library"
+        self.flush()
+        with self.lock:
+            ids = list(self.skills.keys())
+            embeddings = {}
+            if ids:
+                with self.vectordb_lock:
+                    existing = self.vectordb._collection.get(
+                        ids=ids, include=["embeddings"]
+                    )
+                embeddings = dict(zip(existing["ids"], existing["embeddings"]))
+            known_hashes = {
+                U.normalized_code_hash(entry["code"]) for entry in self.skills.values()
+            }
+            kept_vectors = [embeddings[name] for name in ids]
+            claimed_names = set(self.skills)
+
+            # collect candidates, reusing stored embeddings where possible
+            candidates = []
+            skipped = []
+            for library_dir in library_dirs:
+                library_skills = U.load_json(f"{library_dir}/skill/skills.json")
+                stored = {}
+                if self.load_embedding_model(library_dir) == self.embedding_model:
+                    source = Chroma(
+                        collection_name="skill_vectordb",
+                        embedding_function=self.embedding_function,
+                        persist_directory=f"{library_dir}/skill/vectordb",
+                    )
+                    stored_entries = source._collection.get(include=["embeddings"])
+                    stored = dict(
+                        zip(stored_entries["ids"], stored_entries["embeddings"])
+                    )
+                for name, entry in library_skills.items():
+                    normalized_hash = U.normalized_code_hash(entry["code"])
+                    if name in claimed_names or normalized_hash in known_hashes:
+                        skipped.append(name)
+                        continue
+                    claimed_names.add(name)
+                    known_hashes.add(normalized_hash)
+                    candidates.append((name, entry, stored.get(name)))
+            missing = [i for i, (_, _, vector) in enumerate(candidates) if vector is None]
+            if missing:
+                print(
+                    f"\033[33mSkill Manager embedding {len(missing)} imported skills\033[0m"
+                )
+                vectors = self.embedding_function.embed_documents(
+                    [candidates[i][1]["description"] for i in missing]
+                )
+                for i, vector in zip(missing, vectors):
+                    name, entry, _ = candidates[i]
+                    candidates[i] = (name, entry, vector)
+
+            # drop near-duplicates by description similarity
+            kept = np.array(kept_vectors, dtype=np.float32)
+            if len(kept):
+                kept /= np.linalg.norm(kept, axis=1, keepdims=True) + 1e-8
+            imported = []
+            for name, entry, vector in candidates:
+                vector = np.asarray(vector, dtype=np.float32)
+                vector /= np.linalg.norm(vector) + 1e-8
+                if len(kept) and float(np.max(kept @ vector)) >= similarity_threshold:
+                    skipped.append(name)
+                    continue
+                kept = np.vstack([kept, vector]) if len(kept) else vector[None, :]
+                imported.append((name, entry, vector))
+
+            with self.vectordb_lock:
+                if imported:
+                    self.vectordb._collection.add(
+                        ids=[name for name, _, _ in imported],
+                        embeddings=[vector.tolist() for _, _, vector in imported],
+                        documents=[entry["description"] for _, entry, _ in imported],
+                        metadatas=[{"name": name} for name, _, _ in imported],
+                    )
+                n_vectors = self.vectordb._collection.count()
+            for name, entry, _ in imported:
+                self.skills[name] = {
+                    "code": entry["code"],
+                    "description": entry["description"],
+                }
+                self.index_skill(name, entry["code"], entry["description"])
+                self.item_catalogue.add(name, entry["code"])
+                dumped_program_name = self.version_index.allocate(name)
+                U.dump_text(
+                    entry["code"], f"{self.ckpt_dir}/skill/code/{dumped_program_name}.js"
+                )
+                U.dump_text(
+                    entry["description"],
+                    f"{self.ckpt_dir}/skill/description/{dumped_program_name}.txt",
+                )
+                self.version_index.add(name, dumped_program_name, entry["code"])
+            assert n_vectors == len(self.skills), "vectordb is not synced with skills.json"
+            U.dump_json(
+                {"model": self.embedding_model}, f"{self.ckpt_dir}/skill/embedding.json"
+            )
+            self.checkpoint.mark_dirty("skill_vectordb")
+            self.checkpoint.mark_dirty("skills")
+            self.checkpoint.mark_dirty("skill_items")
+            self.checkpoint.mark_dirty("skill_versions")
+            self.version += 1
+            self.retrieval_cache = {}
+        print(
+            f"\033[33mSkill Manager imported {len(imported)} skills, "
+            f"skipped {len(skipped)} duplicates\033[0m"
+        )
+        return {"imported": [name for name, _, _ in imported], "skipped": skipped}
 
     def generate_skill_description(self, program_name, program_code):
         messages = [
@@ -108,20 +563,156 @@ class SkillManager:
                 + f"The main function is `{program_name}`."
             ),
         ]
-        skill_description = f"    // { self.llm(messages).content}"
+        if self.router is None:
+            description = self.llm(messages).content
+        else:
+            description = self.router(
+                lambda llm: self.check_description(llm(messages).content),
+                lambda llm: llm(messages).content,
+            )
+        skill_description = f"    // { description}"
         return f"async function {program_name}(bot) {{\n{skill_description}\n}}"
 
-    def retrieve_skills(self, query):
-        k = min(self.vectordb._collection.count(), self.retrieval_top_k)
+    @staticmethod
+    def check_description(description):
+        """
+        Returns: (description, escalation reason or None)
+        """
+        text = description.strip()
+        if not text or "\n" in text or "```" in text:
+            return description, "parse_failure"
+        return description, None
+
+    def index_skill(self, skill_name, code, description, items=None):
+        if items is None:
+            items = U.extract_item_names(code)
+        # the name is repeated so that exact-name queries rank first
+        tokens = (
+            U.tokenize(skill_name) * 2
+            + U.tokenize(description)
+            + U.tokenize(" ".join(items))
+        )
+        self.lexical_index.add(skill_name, tokens)
+        self.lexical_terms.add(skill_name.lower())
+        self.lexical_terms.update(items)
+
+    def build_item_catalogue(self):
+        for skill_name, entry in self.skills.items():
+            self.item_catalogue.add(skill_name, entry["code"])
+        if self.skills:
+            self.checkpoint.mark_dirty("skill_items")
+
+    def skills_for_items(self, items, roles=None):
+        """
+        Query the item catalogue.
+        :param items: item names, e.g. ["iron_ingot", "stick"]
+        :param roles: subset of "produces", "consumes" and "uses", default all
+        :return: skill names handling the items, most matches first
+        """
+        return self.item_catalogue.skills_for_items(items, roles=roles)
+
+    def items_in_text(self, text):
+        return self.item_catalogue.items_in_text(text)
+
+    def is_lexical_query(self, query):
+        """
+        A query is lexical if it only consists of known skill names or item
+        names, e.g. "craftIronPickaxe" or "iron_ingot, stick".
+        Such queries are answered by the inverted index alone.
+        """
+        words = [w for w in query.lower().replace(",", " ").split() if w]
+        return bool(words) and all(w in self.lexical_terms for w in words)
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def fuse_rankings(rankings, k, rrf_k=60):
+        """
+        Reciprocal rank fusion of several rankings of skill names
+        """
+        scores = {}
+        for ranking in rankings:
+            for rank, name in enumerate(ranking):
+                scores[name] = scores.get(name, 0) + 1 / (rrf_k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+    def retrieve_skills(self, query, items=None):
+        """
+        :param query: retrieval query
+        :param items: optional item names, e.g. from the task and inventory.
+        If enough skills handle these items, only they are searched.
+        """
+        with self.lock:
+            return self._retrieve_skills(query, items=items)
+
+    def _retrieve_skills(self, query, items=None):
+        k = min(len(self.skills), self.retrieval_top_k)
         if k == 0:
             return []
+        candidates = None
+        if items:
+            candidates = self.skills_for_items(items)
+            if len(candidates) < k:
+                candidates = None
+        cache_key = (
+            self.normalize_query(query),
+            tuple(candidates) if candidates else None,
+            self.version,
+        )
+        if cache_key in self.retrieval_cache:
+            print(f"\033[33mSkill Manager reusing cached retrieval\033[0m")
+            return list(self.retrieval_cache[cache_key])
         print(f"\033[33mSkill Manager retrieving for {k} skills\033[0m")
-        docs_and_scores = self.vectordb.similarity_search_with_score(query, k=k)
+        if candidates:
+            print(
+                f"\033[33mSkill Manager pre-filtered {len(candidates)} skills "
+                f"by items: {', '.join(items)}\033[0m"
+            )
+        if self.retrieval_mode == "vector":
+            names = self.vector_search(query, k=k, names=candidates)
+        else:
+            lexical_names = [
+                name
+                for name, _ in self.lexical_index.search(
+                    U.tokenize(query), k=2 * k, doc_ids=candidates
+                )
+            ]
+            if lexical_names and self.is_lexical_query(query):
+                names = lexical_names[:k]
+            else:
+                names = self.fuse_rankings(
+                    [
+                        lexical_names,
+                        self.vector_search(query, k=2 * k, names=candidates),
+                    ],
+                    k=k,
+                )
         print(
-            f"\033[33mSkill Manager retrieved skills: "
-            f"{', '.join([doc.metadata['name'] for doc, _ in docs_and_scores])}\033[0m"
+            f"\033[33mSkill Manager retrieved skills: {', '.join(names)}\033[0m"
         )
-        skills = []
-        for doc, _ in docs_and_scores:
-            skills.append(self.skills[doc.metadata["name"]]["code"])
-        return skills
+        skills = [self.skills[name]["code"] for name in names]
+        self.retrieval_cache[cache_key] = skills
+        return list(skills)
+
+    def vector_search(self, query, k, names=None):
+        k = min(len(self.skills), k)
+        if names is not None:
+            k = min(len(names), k)
+        if k == 0:
+            return []
+        embedding = self.embedding_function.embed_query(query)
+        if self.packed_library is not None:
+            return self.packed_library.search(embedding, k=k, names=names)
+        if names is None:
+            where = None
+        elif len(names) == 1:
+            where = {"name": names[0]}
+        else:
+            where = {"$or": [{"name": name} for name in names]}
+        with self.vectordb_lock:
+            docs = self.vectordb.similarity_search_by_vector(
+                embedding, k=k, filter=where
+            )
+        return [doc.metadata["name"] for doc in docs]
@@ -0,0 +1,43 @@
+"""
+Summarize and compare recorded runs, e.g.
+
+    python -m voyager.compare_runs ckpt_trial1 ckpt_trial2
+
+For every ckpt dir prints iterations, ticks, distinct items obtained and the
+tick each tech tree milestone was reached. Columns are cached in
+events/columns.npz, so later comparisons only read new iterations.
+"""
+import argparse
+
+import voyager.utils as U
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Voyager runs")
+    parser.add_argument("runs", nargs="+", help="ckpt dirs of the runs")
+    parser.add_argument(
+        "--tasks", action="store_true", help="also print the ticks spent per task"
+    )
+    args = parser.parse_args()
+
+    milestones = list(U.analytics_utils.TECH_TREE)
+    print("\t".join(["run", "iterations", "ticks", "items"] + milestones))
+    for run in args.runs:
+        columns = U.export_event_columns(run)
+        summary = columns.summary()
+        print(
+            "\t".join(
+                str(value)
+                for value in [run, summary["iterations"], summary["ticks"], summary["items"]]
+                + [summary["tech_tree"][milestone] for milestone in milestones]
+            )
+        )
+        if args.tasks:
+            for task, ticks in sorted(
+                columns.ticks_by_task().items(), key=lambda kv: -kv[1]
+            ):
+                print(f"\t{ticks}\t{task}")
+
+
+if __name__ == "__main__":
+    main()
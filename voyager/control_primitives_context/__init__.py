@@ -1,18 +1,11 @@
-import pkg_resources
-import os
-import voyager.utils as U
+from voyager.prompts import PROMPTS
 
 
 def load_control_primitives_context(primitive_names=None):
-    package_path = pkg_resources.resource_filename("voyager", "")
     if primitive_names is None:
-        primitive_names = [
-            primitive[:-3]
-            for primitive in os.listdir(f"{package_path}/control_primitives_context")
-            if primitive.endswith(".js")
-        ]
+        primitive_names = PROMPTS.listdir("control_primitives_context", ".js")
     primitives = [
-        U.load_text(f"{package_path}/control_primitives_context/{primitive_name}.js")
+        PROMPTS.load_text(f"control_primitives_context/{primitive_name}.js")
         for primitive_name in primitive_names
     ]
     return primitives
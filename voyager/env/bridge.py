@@ -4,7 +4,6 @@ import warnings
 from typing import SupportsFloat, Any, Tuple, Dict
 
 import requests
-import json
 
 import gymnasium as gym
 from gymnasium.core import ObsType
@@ -122,7 +121,7 @@ class VoyagerEnv(gym.Env):
             raise RuntimeError("Failed to step Minecraft server")
         returned_data = res.json()
         self.pause()
-        return json.loads(returned_data)
+        return U.parse_events(returned_data)
 
     def render(self):
         raise NotImplementedError("render is not implemented")
@@ -159,7 +158,7 @@ class VoyagerEnv(gym.Env):
         # All the reset in step will be soft
         self.reset_options["reset"] = "soft"
         self.pause()
-        return json.loads(returned_data)
+        return U.parse_events(returned_data)
 
     def close(self):
         self.unpause()
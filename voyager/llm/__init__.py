@@ -0,0 +1,5 @@
+from .tokens import count_tokens, count_message_tokens, TokenMetrics, token_metrics
+from .client import LLMClient, RateLimitScheduler, LANE_PRIORITIES, llm_client
+from .chat import ChatModel
+from .streaming import code_block_closed, json_object_closed, line_complete
+from .routing import ModelRouter, RouteMetrics, route_metrics
@@ -0,0 +1,115 @@
+from langchain.schema import AIMessage
+
+from .client import llm_client
+from .tokens import count_message_tokens, count_tokens, token_metrics
+
+
+class ChatModel:
+    """
+    Chat model of one agent. Counts the prompt and completion tokens of
+    every call into token_metrics under the agent name. Other attributes
+    are those of the underlying ChatOpenAI.
+    With streaming=True, calls given a stop_when detector stream the
+    completion and cancel it as soon as stop_when(text so far) is True.
+    sample() requests several completions of one prompt in a single call.
+    Requests go through the shared llm_client, in the lane of the agent.
+    When llm_client hedging is on, temperature 0 calls are hedged. With
+    streaming=True the losing duplicate is cancelled, otherwise its response
+    is discarded.
+    """
+
+    def __init__(
+        self, agent, model_name, temperature=0, request_timeout=120, streaming=False
+    ):
+        self.agent = agent
+        self.streaming = streaming
+        self.llm = llm_client.chat_openai(
+            model_name=model_name,
+            temperature=temperature,
+            request_timeout=request_timeout,
+        )
+        # ChatOpenAI with n set, one per number of samples
+        self.samplers = {}
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["llm"], name)
+
+    def count_tokens(self, messages):
+        return count_message_tokens(messages, self.llm.model_name)
+
+    def __call__(self, messages, stop_when=None):
+        prompt_tokens = self.count_tokens(messages)
+
+        def send():
+            if self.streaming and stop_when is not None:
+                ai_message = self.stream(messages, stop_when)
+            else:
+                ai_message = self.llm(messages)
+            return ai_message, count_tokens(ai_message.content, self.llm.model_name)
+
+        def send_cancellable(cancel):
+            if not self.streaming:
+                return send()
+            ai_message = self.stream(messages, stop_when, cancel)
+            return ai_message, count_tokens(ai_message.content, self.llm.model_name)
+
+        if llm_client.hedging and self.llm.temperature == 0:
+            ai_message, completion_tokens = llm_client.hedged_request(
+                self.agent, self.llm.model_name, prompt_tokens, send_cancellable
+            )
+        else:
+            ai_message, completion_tokens = llm_client.request(
+                self.agent, prompt_tokens, send
+            )
+        token_metrics.record_call(self.agent, prompt_tokens, completion_tokens)
+        return ai_message
+
+    def stream(self, messages, stop_when=None, cancel=None):
+        """
+        Args:
+            stop_when: optional detector, the stream stops once it is True
+            cancel: optional threading.Event, the stream stops once it is set
+        """
+        content = ""
+        chunks = self.llm.stream(messages)
+        try:
+            for chunk in chunks:
+                if cancel is not None and cancel.is_set():
+                    break
+                content += chunk.content
+                if stop_when is not None and stop_when(content):
+                    token_metrics.add(self.agent, early_stops=1)
+                    break
+        finally:
+            # closing the generator cancels the request
+            chunks.close()
+        return AIMessage(content=content)
+
+    def sample(self, messages, n):
+        """
+        Returns: n candidate AIMessages, from a single request
+        """
+        if n == 1:
+            return [self(messages)]
+        if n not in self.samplers:
+            self.samplers[n] = llm_client.chat_openai(
+                model_name=self.llm.model_name,
+                temperature=self.llm.temperature,
+                request_timeout=self.llm.request_timeout,
+                n=n,
+            )
+        prompt_tokens = self.count_tokens(messages)
+
+        def send():
+            result = self.samplers[n].generate([messages])
+            candidates = [generation.message for generation in result.generations[0]]
+            return candidates, sum(
+                count_tokens(candidate.content, self.llm.model_name)
+                for candidate in candidates
+            )
+
+        candidates, completion_tokens = llm_client.request(
+            self.agent, prompt_tokens, send
+        )
+        token_metrics.record_call(self.agent, prompt_tokens, completion_tokens)
+        return candidates
@@ -0,0 +1,438 @@
+"""
+Shared LLM client of all agents.
+
+Every ChatModel builds its ChatOpenAI through llm_client, so all agents and
+all Voyager instances of a process share one connection pool and one
+RateLimitScheduler. The scheduler admits requests by priority lane (action
+before critic before curriculum before curriculum QA and skill descriptions)
+within a requests and tokens per minute budget and a concurrency limit.
+Rate limited requests are retried by the client with exponential backoff,
+pausing every lane, instead of by each ChatOpenAI on its own.
+
+With hedging enabled, a temperature 0 request still running after a
+percentile of the recent latencies of its agent and model is sent a second
+time. The first response wins and the other one is cancelled, or its
+response discarded if its request cannot be cancelled. The number
+of duplicates is capped at a fraction of the hedgeable requests.
+"""
+import functools
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+from langchain.chat_models import ChatOpenAI
+
+LANE_PRIORITIES = {
+    "action": 0,
+    "critic": 1,
+    "curriculum": 2,
+    "curriculum_qa": 3,
+    "skill": 4,
+}
+# fast tiers of routed agents share the lane of the agent
+LANE_PRIORITIES.update(
+    {f"{lane}_fast": priority for lane, priority in list(LANE_PRIORITIES.items())}
+)
+
+_RETRYABLE_ERRORS = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+    "InternalServerError",
+}
+
+
+def is_rate_limit(error):
+    return (
+        type(error).__name__ == "RateLimitError"
+        or getattr(error, "status_code", None) == 429
+        or getattr(error, "http_status", None) == 429
+    )
+
+
+def is_retryable(error):
+    return is_rate_limit(error) or type(error).__name__ in _RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    """
+    Bucket of per_minute units refilled continuously. Units taken after the
+    fact, such as completion tokens, may drive the level below zero.
+    """
+
+    def __init__(self, per_minute=None):
+        self.per_minute = per_minute
+        self.level = per_minute or 0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.per_minute is not None:
+            self.level = min(
+                self.per_minute,
+                self.level + (now - self.updated) * self.per_minute / 60,
+            )
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        Returns: seconds until amount can be taken, requests larger than
+        the bucket wait for a full bucket
+        """
+        if self.per_minute is None:
+            return 0
+        self.refill(now)
+        missing = min(amount, self.per_minute) - self.level
+        return max(0, missing * 60 / self.per_minute)
+
+    def take(self, amount):
+        if self.per_minute is not None:
+            self.level -= amount
+
+
+class RateLimitScheduler:
+    """
+    Admits requests in priority order (lower first, then first come) when a
+    concurrency slot, one request and the prompt tokens are available and
+    no rate limit pause is active. Completion tokens are charged on release.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8):
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.in_flight = 0
+        self.paused_until = 0
+        self.configure(requests_per_minute, tokens_per_minute, max_concurrency)
+
+    def configure(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8):
+        with self.condition:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+            self.max_concurrency = max_concurrency
+            self.condition.notify_all()
+
+    def acquire(self, priority, tokens):
+        with self.condition:
+            entry = (priority, next(self.counter))
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = None
+                    if self.paused_until > now:
+                        timeout = self.paused_until - now
+                    elif self.waiting[0] == entry and self.in_flight < self.max_concurrency:
+                        timeout = max(
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now),
+                        )
+                        if timeout == 0:
+                            heapq.heappop(self.waiting)
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            self.in_flight += 1
+                            # the next waiter may fit as well
+                            self.condition.notify_all()
+                            return
+                    self.condition.wait(timeout)
+            except BaseException:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self.condition.notify_all()
+                raise
+
+    def release(self, completion_tokens=0):
+        with self.condition:
+            self.in_flight -= 1
+            self.tokens.take(completion_tokens)
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Hold back every lane for seconds, after a rate limit error
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+
+class LaneMetrics:
+    """
+    Requests, retries, rate limit errors, time waiting for the scheduler,
+    request latency and hedging per lane. pop() returns and resets the
+    metrics since the previous pop, with latency percentiles of the last
+    latency_window requests of each lane and the share of hedgeable calls
+    that were hedged.
+    """
+
+    def __init__(self, latency_window=1000):
+        self.lock = threading.Lock()
+        self.latency_window = latency_window
+        self.recent = {}
+        self.latencies = {}
+
+    def record(self, lane, wait_time, latency=None, retry=False, rate_limited=False):
+        with self.lock:
+            stats = self.recent.setdefault(
+                lane,
+                {"requests": 0, "retries": 0, "rate_limited": 0, "wait_time": 0.0},
+            )
+            stats["requests"] += 1
+            stats["retries"] += retry
+            stats["rate_limited"] += rate_limited
+            stats["wait_time"] += wait_time
+            if latency is not None:
+                self.latencies.setdefault(
+                    lane, deque(maxlen=self.latency_window)
+                ).append(latency)
+
+    def record_hedge(self, lane, hedged, hedge_won):
+        with self.lock:
+            stats = self.recent.setdefault(
+                lane,
+                {"requests": 0, "retries": 0, "rate_limited": 0, "wait_time": 0.0},
+            )
+            stats["hedgeable"] = stats.get("hedgeable", 0) + 1
+            stats["hedges"] = stats.get("hedges", 0) + hedged
+            stats["hedge_wins"] = stats.get("hedge_wins", 0) + hedge_won
+
+    def pop(self):
+        with self.lock:
+            recent, self.recent = self.recent, {}
+            for lane, stats in recent.items():
+                if stats.get("hedgeable"):
+                    stats["hedge_rate"] = stats["hedges"] / stats["hedgeable"]
+                latencies = sorted(self.latencies.get(lane, ()))
+                if latencies:
+                    stats["latency_p50"] = latencies[len(latencies) // 2]
+                    stats["latency_p95"] = latencies[int(len(latencies) * 0.95)]
+        return recent
+
+
+class LLMClient:
+    """
+    Builds ChatOpenAI instances sharing one connection pool and sends their
+    requests through the scheduler.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_concurrency=8,
+        max_retries=6,
+        backoff_base=1.0,
+        backoff_max=60.0,
+    ):
+        self.scheduler = RateLimitScheduler(
+            requests_per_minute, tokens_per_minute, max_concurrency
+        )
+        self.metrics = LaneMetrics()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self.pool_size = max_concurrency
+        self.http_client = None
+        # openai clients on the shared pool, by request timeout and api key
+        self.clients = {}
+        self.configure_hedging(enabled=False)
+        self.executor = None
+
+    def configure(
+        self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8
+    ):
+        self.scheduler.configure(requests_per_minute, tokens_per_minute, max_concurrency)
+        self.pool_size = max(self.pool_size, max_concurrency)
+
+    def configure_hedging(
+        self, enabled=True, percentile=95, budget=0.1, min_samples=10, window=200
+    ):
+        """
+        Args:
+            percentile: a request is duplicated once it runs longer than this
+                percentile of the recent latencies of its agent and model
+            budget: max duplicates, as a fraction of the hedgeable requests
+            min_samples: latencies needed before an agent and model is hedged
+            window: number of recent latencies kept per agent and model
+        """
+        with self.lock:
+            self.hedging = enabled
+            self.hedge_percentile = percentile
+            self.hedge_budget = budget
+            self.hedge_min_samples = min_samples
+            self.hedge_window = window
+            self.hedge_latencies = {}
+            self.hedgeable = 0
+            self.hedges = 0
+
+    def hedge_delay(self, key):
+        """
+        Returns: seconds after which a request of key is duplicated, None
+        while there are too few latencies
+        """
+        with self.lock:
+            latencies = sorted(self.hedge_latencies.get(key, ()))
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return latencies[index]
+
+    def take_hedge(self):
+        with self.lock:
+            if self.hedges + 1 > self.hedge_budget * self.hedgeable:
+                return False
+            self.hedges += 1
+            return True
+
+    def pool_kwargs(self, request_timeout):
+        """
+        Returns: ChatOpenAI kwargs to use the shared connection pool
+        """
+        with self.lock:
+            if int(openai.__version__.split(".")[0]) >= 1:
+                if self.http_client is None:
+                    import httpx
+
+                    self.http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=self.pool_size,
+                            max_keepalive_connections=self.pool_size,
+                        )
+                    )
+                # a sync client is passed in directly, some ChatOpenAI
+                # versions also hand http_client to their async client
+                key = (request_timeout, os.environ.get("OPENAI_API_KEY"))
+                if key not in self.clients:
+                    self.clients[key] = openai.OpenAI(
+                        http_client=self.http_client,
+                        timeout=request_timeout,
+                        max_retries=0,
+                    )
+                return {"client": self.clients[key].chat.completions}
+            # openai < 1 sends every request through openai.requestssession
+            if self.http_client is None:
+                import requests
+
+                self.http_client = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                )
+                self.http_client.mount("https://", adapter)
+                openai.requestssession = self.http_client
+            return {}
+
+    def chat_openai(self, **kwargs):
+        # retries are done by request(), across all agents
+        return ChatOpenAI(
+            max_retries=0, **self.pool_kwargs(kwargs.get("request_timeout")), **kwargs
+        )
+
+    def backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def request(self, lane, prompt_tokens, send):
+        """
+        Args:
+            lane: agent name, see LANE_PRIORITIES
+            prompt_tokens: tokens of the prompt, taken from the budget up front
+            send: function sending the request and returning (result,
+                completion tokens)
+        Returns: what send returns
+        """
+        priority = LANE_PRIORITIES.get(lane, len(LANE_PRIORITIES))
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            self.scheduler.acquire(priority, prompt_tokens)
+            sent = time.monotonic()
+            completion_tokens = 0
+            try:
+                result = send()
+                completion_tokens = result[1]
+            except Exception as e:
+                rate_limited = is_rate_limit(e)
+                self.metrics.record(
+                    lane, sent - start, retry=attempt > 0, rate_limited=rate_limited
+                )
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                print(
+                    f"\033[33m{lane} request failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s\033[0m"
+                )
+                if rate_limited:
+                    self.scheduler.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            finally:
+                self.scheduler.release(completion_tokens)
+            self.metrics.record(
+                lane, sent - start, time.monotonic() - sent, retry=attempt > 0
+            )
+            return result
+
+    def hedged_request(self, lane, model_name, prompt_tokens, send):
+        """
+        Like request(), duplicating the request if it is slow.
+        send(cancel) should stop early and return once the threading.Event
+        cancel is set, a send that ignores it has its result discarded.
+        """
+        key = (lane, model_name)
+        delay = self.hedge_delay(key)
+        with self.lock:
+            self.hedgeable += 1
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(thread_name_prefix="llm_hedge")
+        start = time.monotonic()
+        cancels = [threading.Event()]
+        futures = [
+            self.executor.submit(
+                self.request, lane, prompt_tokens, functools.partial(send, cancels[0])
+            )
+        ]
+        done, _ = wait(futures, timeout=delay)
+        if not done and self.take_hedge():
+            cancels.append(threading.Event())
+            futures.append(
+                self.executor.submit(
+                    self.request,
+                    lane,
+                    prompt_tokens,
+                    functools.partial(send, cancels[1]),
+                )
+            )
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                winner = futures.index(future)
+                for i, cancel in enumerate(cancels):
+                    if i != winner:
+                        cancel.set()
+                with self.lock:
+                    self.hedge_latencies.setdefault(
+                        key, deque(maxlen=self.hedge_window)
+                    ).append(time.monotonic() - start)
+                self.metrics.record_hedge(lane, len(futures) > 1, winner > 0)
+                return future.result()
+        self.metrics.record_hedge(lane, len(futures) > 1, False)
+        raise error
+
+
+llm_client = LLMClient()
@@ -0,0 +1,76 @@
+"""
+Two-tier model routing: a call is answered by a fast model first and
+escalated to the strong model when the fast answer does not parse, is of
+low confidence, or its samples disagree.
+"""
+import threading
+
+ESCALATION_REASONS = ["parse_failure", "low_confidence", "disagreement"]
+
+
+class RouteMetrics:
+    """
+    Calls answered by the fast tier and escalations by reason, per route.
+    pop() returns and resets the counts since the previous pop, with the
+    fast tier hit rate, and the calls and hit rate of the whole run so far.
+    """
+
+    FIELDS = ["calls", "fast_hits", *ESCALATION_REASONS]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.recent = {}
+
+    def record(self, route, reason=None):
+        """
+        reason: escalation reason, None if the fast answer was kept
+        """
+        assert reason is None or reason in ESCALATION_REASONS
+        with self.lock:
+            for stats in [self.totals, self.recent]:
+                route_stats = stats.setdefault(route, dict.fromkeys(self.FIELDS, 0))
+                route_stats["calls"] += 1
+                route_stats[reason or "fast_hits"] += 1
+
+    def pop(self):
+        with self.lock:
+            recent, self.recent = self.recent, {}
+            for route, stats in recent.items():
+                totals = self.totals[route]
+                stats["fast_hit_rate"] = stats["fast_hits"] / stats["calls"]
+                stats["total_calls"] = totals["calls"]
+                stats["total_fast_hit_rate"] = totals["fast_hits"] / totals["calls"]
+        return recent
+
+
+route_metrics = RouteMetrics()
+
+
+class ModelRouter:
+    """
+    Routes the calls of one route between a fast and a strong ChatModel
+    """
+
+    def __init__(self, route, fast, strong):
+        self.route = route
+        self.fast = fast
+        self.strong = strong
+
+    def __call__(self, fast_call, strong_call):
+        """
+        Args:
+            fast_call: function(fast ChatModel) -> (result, escalation reason
+                or None to keep the result)
+            strong_call: function(strong ChatModel) -> result
+        Returns: the fast result, or the strong one after escalation
+        """
+        result, reason = fast_call(self.fast)
+        route_metrics.record(self.route, reason)
+        if reason is None:
+            return result
+        print(
+            f"\033[33m{self.route}: escalating to {self.strong.model_name} "
+            f"({reason})\033[0m"
+        )
+        return strong_call(self.strong)
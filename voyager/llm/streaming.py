@@ -0,0 +1,52 @@
+"""
+Detectors for streamed completions. Each takes the text received so far and
+returns True once it holds everything the caller parses, so generation can
+be cancelled.
+"""
+import re
+
+_CODE_BLOCK_PATTERN = re.compile(r"```(?:javascript|js).*?```", re.DOTALL)
+
+
+def code_block_closed(text):
+    return _CODE_BLOCK_PATTERN.search(text) is not None
+
+
+def json_object_closed(text):
+    """
+    True once the first top-level json object is closed, ignoring braces
+    inside strings
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                return True
+    return False
+
+
+def line_complete(prefix):
+    """
+    Returns: detector that is True once a line starting with prefix has
+    been fully received
+    """
+    pattern = re.compile(rf"^{re.escape(prefix)}.*\n", re.MULTILINE)
+
+    def detect(text):
+        return pattern.search(text) is not None
+
+    return detect
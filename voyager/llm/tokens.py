@@ -0,0 +1,75 @@
+"""
+Token counting with tiktoken and per-agent token metrics.
+"""
+import threading
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model_name="gpt-4"):
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model_name="gpt-4"):
+    """
+    Token count of a chat prompt, including the few tokens of framing the
+    chat format adds per message
+    """
+    return sum(count_tokens(message.content, model_name) + 4 for message in messages) + 2
+
+
+class TokenMetrics:
+    """
+    Prompt and completion tokens, calls, prompt compactions and streamed
+    completions stopped early, per agent.
+    totals accumulate over the whole run, pop() returns and resets the
+    counts since the previous pop.
+    """
+
+    FIELDS = [
+        "calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "compactions",
+        "early_stops",
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.recent = {}
+
+    def add(self, agent, **counts):
+        with self.lock:
+            for stats in [self.totals, self.recent]:
+                agent_stats = stats.setdefault(agent, dict.fromkeys(self.FIELDS, 0))
+                for field, count in counts.items():
+                    agent_stats[field] += count
+
+    def record_call(self, agent, prompt_tokens, completion_tokens):
+        self.add(
+            agent,
+            calls=1,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+
+    def record_compaction(self, agent):
+        self.add(agent, compactions=1)
+
+    def pop(self):
+        with self.lock:
+            recent, self.recent = self.recent, {}
+        return recent
+
+
+token_metrics = TokenMetrics()
@@ -0,0 +1,51 @@
+"""
+Merge several skill libraries into one, e.g.
+
+    python -m voyager.merge_skills --output merged_ckpt skill_library/trial1 skill_library/trial2
+
+Each library is a ckpt dir containing a skill/ folder. The output library is
+created if needed, otherwise the libraries are merged into it.
+"""
+import argparse
+import os
+
+import voyager.utils as U
+from voyager.agents import SkillManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge Voyager skill libraries")
+    parser.add_argument("libraries", nargs="+", help="ckpt dirs to import")
+    parser.add_argument("--output", required=True, help="ckpt dir to merge into")
+    parser.add_argument(
+        "--similarity-threshold",
+        type=float,
+        default=0.98,
+        help="skip skills whose description is at least this similar to an existing one",
+    )
+    parser.add_argument(
+        "--pack", default=None, help="also write the merged library in packed format here"
+    )
+    parser.add_argument("--openai-api-key", default=None)
+    args = parser.parse_args()
+
+    if args.openai_api_key:
+        os.environ["OPENAI_API_KEY"] = args.openai_api_key
+    skill_manager = SkillManager(
+        ckpt_dir=args.output,
+        resume=U.f_exists(f"{args.output}/skill/skills.json"),
+        background_ingest=False,
+    )
+    result = skill_manager.import_libraries(
+        args.libraries, similarity_threshold=args.similarity_threshold
+    )
+    print(
+        f"Merged {len(result['imported'])} skills into {args.output}, "
+        f"{len(skill_manager.skills)} skills in total"
+    )
+    if args.pack:
+        skill_manager.pack(args.pack)
+
+
+if __name__ == "__main__":
+    main()
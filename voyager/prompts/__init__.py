@@ -1,7 +1,84 @@
+import os
+import threading
+
 import pkg_resources
 import voyager.utils as U
 
 
+class PromptRegistry:
+    """
+    In-memory cache of the prompt and primitive files shipped with the
+    package, and of values derived from them such as compiled templates.
+    Files are read once. In dev mode (dev_mode=True or VOYAGER_PROMPTS_DEV=1)
+    the mtime of each file is checked on access and edited files are
+    reloaded, together with everything derived from them.
+    """
+
+    def __init__(self, root, dev_mode=False):
+        self.root = root
+        self.dev_mode = dev_mode
+        self.lock = threading.RLock()
+        self.texts = {}
+        self.listings = {}
+        self.derived = {}
+
+    def load_text(self, path):
+        """
+        Args:
+            path: file path relative to the package, e.g. "prompts/critic.txt"
+        """
+        with self.lock:
+            cached = self.texts.get(path)
+            if cached is not None and not self.dev_mode:
+                return cached[1]
+            mtime = os.path.getmtime(f"{self.root}/{path}")
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, U.load_text(f"{self.root}/{path}"))
+                self.texts[path] = cached
+            return cached[1]
+
+    def version(self, path):
+        self.load_text(path)
+        return self.texts[path][0]
+
+    def listdir(self, path, suffix=""):
+        """
+        Returns: names of the files in path ending with suffix, suffix removed
+        """
+        with self.lock:
+            if path not in self.listings or self.dev_mode:
+                self.listings[path] = [
+                    f[: len(f) - len(suffix)]
+                    for f in os.listdir(f"{self.root}/{path}")
+                    if f.endswith(suffix)
+                ]
+            return self.listings[path]
+
+    def get_derived(self, key, paths, build):
+        """
+        Returns: build(), computed once and again only when one of the files
+        it was built from has changed
+        """
+        with self.lock:
+            versions = tuple(self.version(path) for path in paths)
+            cached = self.derived.get(key)
+            if cached is None or cached[0] != versions:
+                cached = (versions, build())
+                self.derived[key] = cached
+            return cached[1]
+
+    def clear(self):
+        with self.lock:
+            self.texts.clear()
+            self.listings.clear()
+            self.derived.clear()
+
+
+PROMPTS = PromptRegistry(
+    pkg_resources.resource_filename("voyager", ""),
+    dev_mode=os.environ.get("VOYAGER_PROMPTS_DEV", "") not in ["", "0"],
+)
+
+
 def load_prompt(prompt):
-    package_path = pkg_resources.resource_filename("voyager", "")
-    return U.load_text(f"{package_path}/prompts/{prompt}.txt")
+    return PROMPTS.load_text(f"prompts/{prompt}.txt")
@@ -1,3 +1,18 @@
 from .file_utils import *
 from .json_utils import *
-from .record_utils import EventRecorder
+from .record_utils import EventLog, EventRecorder
+from .search_utils import BM25Index, tokenize, extract_item_names
+from .skill_utils import (
+    ItemCatalogue,
+    SkillVersionIndex,
+    code_hash,
+    normalized_code_hash,
+    extract_item_usage,
+)
+from .pack_utils import PackedSkillLibrary, pack_skill_library
+from .store_utils import CurriculumStore
+from .checkpoint_utils import CheckpointManager, atomic_dump_json, atomic_dump_text
+from .analytics_utils import EventColumns, export_event_columns, compare_runs
+from .trajectory_utils import Trajectory
+from .event_utils import FrozenDict, FrozenList, freeze, loads_frozen, replace_observation
+from .observation_utils import Events, Observation, Position, parse_events, render_metrics
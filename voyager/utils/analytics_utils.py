@@ -0,0 +1,304 @@
+"""
+Columnar export of recorded events for run analysis.
+
+A run's event log is turned into one numpy array per field, one row per
+event, and cached as events/columns.npz. The cache is extended with only the
+iterations recorded since it was written, so comparing many runs costs one
+npz load each instead of decompressing and parsing every event.
+"""
+import numpy as np
+
+from .file_utils import f_exists, f_join
+from .json_utils import load_json
+from .record_utils import EventLog, legacy_event_records
+
+COLUMNS_FORMAT_VERSION = 1
+
+# milestones of the tech tree, in order
+TECH_TREE = {
+    "wooden_tool": ["wooden_pickaxe", "wooden_axe", "wooden_sword", "wooden_shovel", "wooden_hoe"],
+    "stone_tool": ["stone_pickaxe", "stone_axe", "stone_sword", "stone_shovel", "stone_hoe"],
+    "iron_tool": ["iron_pickaxe", "iron_axe", "iron_sword", "iron_shovel", "iron_hoe"],
+    "diamond_tool": ["diamond_pickaxe", "diamond_axe", "diamond_sword", "diamond_shovel", "diamond_hoe"],
+}
+
+_SCALAR_COLUMNS = {
+    "iteration": np.int32,
+    "tick": np.int64,
+    "elapsed": np.int64,
+    "event_type": np.int8,
+    "x": np.float32,
+    "y": np.float32,
+    "z": np.float32,
+    "health": np.float32,
+    "food": np.float32,
+    "biome": np.int16,
+}
+
+
+class EventColumns:
+    """
+    One row per recorded event.
+        iteration   iteration the event was recorded in, starting from 1
+        tick        ticks since the start of the run, as counted by EventRecorder
+        elapsed     the event's status.elapsedTime
+        event_type  index into event_types
+        x, y, z     bot position
+        health, food
+        biome       index into biomes
+        inventory   [n_events, n_items] item counts, columns index into items
+    tasks[i] is the task of iteration i + 1.
+    """
+
+    def __init__(self, columns, inventory, event_types, biomes, items, tasks, elapsed_time):
+        self.columns = columns
+        self.inventory = inventory
+        self.event_types = event_types
+        self.biomes = biomes
+        self.items = items
+        self.tasks = tasks
+        self.elapsed_time = elapsed_time
+        self.item_index = {item: i for i, item in enumerate(items)}
+
+    def __len__(self):
+        return len(self.columns["iteration"])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def n_iterations(self):
+        return len(self.tasks)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            {name: np.zeros(0, dtype=dtype) for name, dtype in _SCALAR_COLUMNS.items()},
+            np.zeros((0, 0), dtype=np.int32),
+            [],
+            [],
+            [],
+            [],
+            0,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != COLUMNS_FORMAT_VERSION:
+                return None
+            return cls(
+                {name: data[name] for name in _SCALAR_COLUMNS},
+                data["inventory"],
+                data["event_types"].tolist(),
+                data["biomes"].tolist(),
+                data["items"].tolist(),
+                data["tasks"].tolist(),
+                int(data["elapsed_time"]),
+            )
+
+    def save(self, path):
+        # np.savez appends .npz to names without it, write through a file object
+        with open(path, "wb") as fp:
+            np.savez(
+                fp,
+                format=COLUMNS_FORMAT_VERSION,
+                inventory=self.inventory,
+                event_types=np.array(self.event_types, dtype=str),
+                biomes=np.array(self.biomes, dtype=str),
+                items=np.array(self.items, dtype=str),
+                tasks=np.array(self.tasks, dtype=str),
+                elapsed_time=self.elapsed_time,
+                **self.columns,
+            )
+
+    def first_acquired(self, items=None, by="tick"):
+        """
+        Returns: dict of item -> tick (or iteration) it first appeared in the
+        inventory, None for items never acquired
+        """
+        items = self.items if items is None else items
+        axis = self.columns[by]
+        result = {}
+        for item in items:
+            column = self.item_index.get(item)
+            if column is None:
+                result[item] = None
+                continue
+            rows = np.flatnonzero(self.inventory[:, column] > 0)
+            result[item] = int(axis[rows[0]]) if len(rows) else None
+        return result
+
+    def discovery_curve(self, by="tick"):
+        """
+        Returns: (xs, counts), the number of distinct items obtained so far
+        each time a new item was obtained
+        """
+        if not len(self) or not len(self.items):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        held = self.inventory > 0
+        has_any = held.any(axis=0)
+        first_rows = np.sort(held.argmax(axis=0)[has_any])
+        rows, new_items = np.unique(first_rows, return_counts=True)
+        return self.columns[by][rows].astype(np.int64), np.cumsum(new_items)
+
+    def tech_tree_timing(self, tech_tree=None, by="tick"):
+        """
+        Returns: dict of milestone -> tick (or iteration) the first of its
+        items was obtained, None if never reached
+        """
+        tech_tree = tech_tree or TECH_TREE
+        result = {}
+        for milestone, items in tech_tree.items():
+            times = [t for t in self.first_acquired(items, by=by).values() if t is not None]
+            result[milestone] = min(times) if times else None
+        return result
+
+    def task_ticks(self):
+        """
+        Returns: list of (iteration, task, ticks spent on it)
+        """
+        observe = self.event_types.index("observe") if "observe" in self.event_types else -1
+        weights = np.where(self.columns["event_type"] == observe, self.columns["elapsed"], 0)
+        ticks = np.bincount(
+            self.columns["iteration"], weights=weights, minlength=self.n_iterations + 1
+        )
+        return [
+            (iteration, task, int(ticks[iteration]))
+            for iteration, task in enumerate(self.tasks, start=1)
+        ]
+
+    def ticks_by_task(self):
+        """
+        Returns: dict of task -> total ticks over all its attempts
+        """
+        result = {}
+        for _, task, ticks in self.task_ticks():
+            result[task] = result.get(task, 0) + ticks
+        return result
+
+    def summary(self, tech_tree=None):
+        return {
+            "iterations": self.n_iterations,
+            "events": len(self),
+            "ticks": self.elapsed_time,
+            "items": int((self.inventory > 0).any(axis=0).sum()) if len(self) else 0,
+            "biomes": len(self.biomes),
+            "tech_tree": self.tech_tree_timing(tech_tree),
+        }
+
+
+def _extend_columns(base, records):
+    """
+    Append (index entry, events) records to base in a single pass
+    """
+    event_types = list(base.event_types)
+    biomes = list(base.biomes)
+    items = list(base.items)
+    tasks = list(base.tasks)
+    type_ids = {name: i for i, name in enumerate(event_types)}
+    biome_ids = {name: i for i, name in enumerate(biomes)}
+    item_ids = {name: i for i, name in enumerate(items)}
+    elapsed_time = base.elapsed_time
+    rows = {name: [] for name in _SCALAR_COLUMNS}
+    inventory_rows, inventory_cols, inventory_counts = [], [], []
+    n_rows = 0
+    for entry, events in records:
+        tasks.append(entry["task"])
+        for event_type, event in events:
+            status = event["status"]
+            if event_type not in type_ids:
+                type_ids[event_type] = len(event_types)
+                event_types.append(event_type)
+            biome = status["biome"]
+            if biome not in biome_ids:
+                biome_ids[biome] = len(biomes)
+                biomes.append(biome)
+            rows["iteration"].append(entry["iteration"])
+            rows["tick"].append(elapsed_time + status["elapsedTime"])
+            rows["elapsed"].append(status["elapsedTime"])
+            rows["event_type"].append(type_ids[event_type])
+            rows["x"].append(status["position"]["x"])
+            rows["y"].append(status["position"]["y"])
+            rows["z"].append(status["position"]["z"])
+            rows["health"].append(status["health"])
+            rows["food"].append(status["food"])
+            rows["biome"].append(biome_ids[biome])
+            for item, count in event["inventory"].items():
+                if item not in item_ids:
+                    item_ids[item] = len(items)
+                    items.append(item)
+                inventory_rows.append(n_rows)
+                inventory_cols.append(item_ids[item])
+                inventory_counts.append(count)
+            n_rows += 1
+            if event_type == "observe":
+                elapsed_time += status["elapsedTime"]
+    columns = {
+        name: np.concatenate([base.columns[name], np.array(values, dtype=dtype)])
+        for (name, dtype), values in zip(_SCALAR_COLUMNS.items(), rows.values())
+    }
+    inventory = np.zeros((len(base) + n_rows, len(items)), dtype=np.int32)
+    inventory[: len(base), : len(base.items)] = base.inventory
+    inventory[
+        len(base) + np.array(inventory_rows, dtype=np.int64),
+        np.array(inventory_cols, dtype=np.int64),
+    ] = inventory_counts
+    return EventColumns(
+        columns, inventory, event_types, biomes, items, tasks, elapsed_time
+    )
+
+
+def export_event_columns(ckpt_dir, use_cache=True):
+    """
+    Returns: EventColumns of a run, reading only the iterations recorded
+    since events/columns.npz was last written. The event log is opened
+    read-only, so a live run can be analysed. Runs in the per-iteration
+    json layout that predates the event log are read file by file and not
+    cached, resuming them migrates them to the event log.
+    """
+    log = EventLog(f_join(ckpt_dir, "events"), read_only=True)
+    if not len(log):
+        legacy = legacy_event_records(ckpt_dir)
+        if legacy:
+            print(
+                f"\033[33m{ckpt_dir} has {len(legacy)} event files in the legacy layout, "
+                f"reading them without caching\033[0m"
+            )
+            return _extend_columns(
+                EventColumns.empty(),
+                (
+                    ({"iteration": iteration, "task": task}, load_json(path))
+                    for iteration, (task, path) in enumerate(legacy, 1)
+                ),
+            )
+    cache_path = f_join(ckpt_dir, "events", "columns.npz")
+    base = None
+    if use_cache and f_exists(cache_path):
+        try:
+            base = EventColumns.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            # interrupted write, rebuild
+            base = None
+        if base is not None and base.n_iterations > len(log):
+            # the log was replaced since the cache was written
+            base = None
+    base = base or EventColumns.empty()
+    if base.n_iterations == len(log):
+        return base
+    columns = _extend_columns(base, log.iter_records(base.n_iterations + 1))
+    columns.save(cache_path)
+    return columns
+
+
+def compare_runs(ckpt_dirs, tech_tree=None):
+    """
+    Returns: dict of ckpt dir -> summary of the run
+    """
+    return {
+        ckpt_dir: export_event_columns(ckpt_dir).summary(tech_tree)
+        for ckpt_dir in ckpt_dirs
+    }
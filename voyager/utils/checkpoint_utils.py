@@ -0,0 +1,244 @@
+"""
+Write-behind checkpointing of agent state.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from .file_utils import f_exists, f_join, f_mkdir
+from .json_utils import load_json
+
+
+def atomic_dump_text(s, *fpaths):
+    """
+    Write to a temp file in the same directory and rename it over the target,
+    so readers never see a partially written file
+    """
+    fpath = f_join(*fpaths)
+    dir_path = os.path.dirname(os.path.abspath(fpath))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            fp.write(s)
+        os.replace(tmp_path, fpath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_dump_json(data, *fpaths, **kwargs):
+    atomic_dump_text(json.dumps(data, **kwargs), *fpaths)
+
+
+# one lock per manifest, managers sharing a ckpt_dir commit in turn
+_MANIFEST_LOCKS = {}
+_MANIFEST_LOCKS_LOCK = threading.Lock()
+
+
+def _manifest_lock(path):
+    with _MANIFEST_LOCKS_LOCK:
+        return _MANIFEST_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def text_hash(s):
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+class CheckpointManager:
+    """
+    Components register a json file and a snapshot function returning the
+    data to dump, or an export function writing their files themselves.
+    mark_dirty() only takes the snapshot (a cheap copy) in the calling
+    thread; a background thread serializes and writes the latest snapshot of
+    every dirty component and runs dirty exports, so repeated updates
+    between two writes cost a single write. flush() blocks until everything
+    is written. With background=False every mark_dirty() writes immediately.
+
+    The json files of a batch are committed together through checkpoint.json:
+    1. every file is written and synced under a temp name, path.{generation}.tmp
+    2. checkpoint.json, naming the generation and the temp name and hash of
+       each file, atomically replaces the previous manifest
+    3. the temp files are renamed over their paths
+    A crash before 2 leaves the previous batch in place, a crash after it is
+    rolled forward by recover(), so the files always belong to one batch.
+    Exports run before the manifest is committed, so they are never behind it.
+    """
+
+    def __init__(self, ckpt_dir="ckpt", background=True, interval=1.0):
+        self.ckpt_dir = ckpt_dir
+        self.background = background
+        self.interval = interval
+        self.manifest_path = f_join(ckpt_dir, "checkpoint.json")
+        self.components = {}
+        self.pending = {}
+        self.writing = False
+        self.flushing = 0
+        self.condition = threading.Condition()
+        self.worker = None
+        f_mkdir(ckpt_dir)
+        self.recover()
+
+    def register(self, name, path, snapshot):
+        """
+        Args:
+            name: unique component name, e.g. "chest_memory"
+            path: json file the component is dumped to
+            snapshot: function returning json-serializable data, called by
+                mark_dirty() in the caller's thread. It should return a
+                shallow copy, the data is serialized later by the writer
+        """
+        self.remove_uncommitted(path)
+        self.components[name] = lambda: (path, snapshot())
+
+    def register_export(self, name, export):
+        """
+        Args:
+            name: unique component name
+            export: function writing the component's files, called by the
+                writer, e.g. to export a store that is its own source of truth
+        """
+        self.components[name] = lambda: export
+
+    def mark_dirty(self, name):
+        self.enqueue(name, self.components[name]())
+
+    def write(self, path, data):
+        """
+        Queue a one-off json file write, e.g. a new record file
+        """
+        self.enqueue(path, (path, data))
+
+    def enqueue(self, key, write):
+        if not self.background:
+            self.commit({key: write})
+            return
+        with self.condition:
+            self.pending[key] = write
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run_worker, daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+
+    def run_worker(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                # coalesce updates arriving within the interval into one write
+                self.condition.wait_for(lambda: self.flushing, timeout=self.interval)
+                batch, self.pending = self.pending, {}
+                self.writing = True
+            try:
+                self.commit(batch)
+            except Exception as e:
+                print(f"\033[31mCheckpoint write failed: {e}\033[0m")
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def commit(self, batch):
+        """
+        Args:
+            batch: key -> export function or (path, data) of a json file
+        """
+        files = dict(write for write in batch.values() if not callable(write))
+        try:
+            for write in batch.values():
+                if callable(write):
+                    write()
+        finally:
+            if files:
+                self.commit_files(files)
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.ckpt_dir)
+
+    def load_manifest(self):
+        if f_exists(self.manifest_path):
+            return load_json(self.manifest_path)
+        return {"generation": 0, "files": {}}
+
+    def commit_files(self, files):
+        with _manifest_lock(self.manifest_path):
+            manifest = self.load_manifest()
+            generation = manifest["generation"] + 1
+            temp_paths = {}
+            for path, data in files.items():
+                text = json.dumps(data)
+                temp_path = f"{path}.{generation}.tmp"
+                with open(temp_path, "w") as fp:
+                    fp.write(text)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                temp_paths[path] = temp_path
+                manifest["files"][self.relpath(path)] = {
+                    "temp": self.relpath(temp_path),
+                    "hash": text_hash(text),
+                }
+            manifest["generation"] = generation
+            # the commit point of the batch
+            atomic_dump_json(manifest, self.manifest_path)
+            for path, temp_path in temp_paths.items():
+                os.replace(temp_path, path)
+
+    def recover(self):
+        """
+        Finish the renames of the last committed batch
+        """
+        with _manifest_lock(self.manifest_path):
+            manifest = self.load_manifest()
+            rolled_forward = []
+            for relpath, entry in manifest["files"].items():
+                temp_path = f_join(self.ckpt_dir, entry["temp"])
+                if os.path.exists(temp_path):
+                    os.replace(temp_path, f_join(self.ckpt_dir, relpath))
+                    rolled_forward.append(relpath)
+        if rolled_forward:
+            print(
+                f"\033[33mCheckpoint generation {manifest['generation']}: "
+                f"restored {', '.join(rolled_forward)}\033[0m"
+            )
+
+    def remove_uncommitted(self, path):
+        """
+        Delete temp files of path left by a batch that was never committed
+        """
+        dir_path = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dir_path):
+            return
+        prefix = f"{os.path.basename(path)}."
+        with _manifest_lock(self.manifest_path):
+            for file in os.listdir(dir_path):
+                if (
+                    file.startswith(prefix)
+                    and file.endswith(".tmp")
+                    and file[len(prefix) : -len(".tmp")].isdigit()
+                ):
+                    os.remove(f_join(dir_path, file))
+
+    def load_json(self, path):
+        """
+        Returns: the content of path as of the last committed batch. Files
+        that are not in the manifest, e.g. written before it existed, are
+        read as they are.
+        """
+        with open(path, "r") as fp:
+            text = fp.read()
+        entry = self.load_manifest()["files"].get(self.relpath(path))
+        if entry is not None and entry["hash"] != text_hash(text):
+            print(
+                f"\033[33m{path} was changed outside of the checkpoint manager\033[0m"
+            )
+        return json.loads(text)
+
+    def flush(self):
+        if not self.background:
+            return
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.pending and not self.writing)
+            self.flushing -= 1
@@ -0,0 +1,106 @@
+"""
+Immutable events.
+
+Events returned by the mineflayer server are decoded once into FrozenDict and
+FrozenList, which are read-only dict and list subclasses. They behave like
+the decoded json everywhere else (json.dumps, repr, equality), can be shared
+between agents and the recorder without copying, and copy.deepcopy returns
+them as is.
+"""
+import json
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} is immutable")
+
+
+class FrozenDict(dict):
+    __slots__ = ()
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def replace(self, **changes):
+        """
+        Returns: a new FrozenDict sharing every value that is not changed
+        """
+        return FrozenDict({**self, **{k: freeze(v) for k, v in changes.items()}})
+
+
+class FrozenList(list):
+    __slots__ = ()
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __iadd__ = _readonly
+    __imul__ = _readonly
+    append = _readonly
+    extend = _readonly
+    insert = _readonly
+    pop = _readonly
+    remove = _readonly
+    clear = _readonly
+    sort = _readonly
+    reverse = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value):
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def _freeze_lists(value):
+    # dicts are already frozen by the object_pairs_hook
+    if isinstance(value, list) and not isinstance(value, FrozenList):
+        return FrozenList(_freeze_lists(v) for v in value)
+    return value
+
+
+def _frozen_pairs(pairs):
+    return FrozenDict((k, _freeze_lists(v)) for k, v in pairs)
+
+
+def loads_frozen(s):
+    """
+    Decode json directly into FrozenDict and FrozenList
+    """
+    return _freeze_lists(json.loads(s, object_pairs_hook=_frozen_pairs))
+
+
+def replace_observation(events, **changes):
+    """
+    Returns: events with fields of the final observe event replaced
+    """
+    event_type, event = events[-1]
+    return FrozenList(
+        list(events[:-1]) + [FrozenList([event_type, event.replace(**changes)])]
+    )
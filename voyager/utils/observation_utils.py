@@ -0,0 +1,357 @@
+"""
+Typed view of the events returned by the mineflayer server.
+
+VoyagerEnv parses every reply once into Events, one slotted Observation per
+event plus the chat, error and damage messages. The raw [event_type, event]
+pairs are not kept: an Observation holds the parsed fields and the status
+fields it does not parse, sharing the decoded values, and rebuilds the event
+for the event log with to_event(). Agents and the recorder read attributes
+instead of walking the nested dicts again. Prompt sections are rendered through Observation.render,
+which caches each text fragment on the observation, so the action, critic and
+curriculum prompts of a step share one rendering.
+"""
+import time
+from collections import namedtuple
+
+from .event_utils import FrozenDict, freeze, loads_frozen
+
+Position = namedtuple("Position", ["x", "y", "z"])
+
+_EMPTY = FrozenDict()
+_EXTRA_KEYS = {}
+# status fields kept as Observation attributes, the others go to status_extra
+_STATUS_FIELDS = {
+    "biome": "biome",
+    "timeOfDay": "time_of_day",
+    "health": "health",
+    "food": "food",
+    "position": "position",
+    "equipment": "equipment",
+    "inventoryUsed": "inventory_used",
+    "entities": "entities",
+    "elapsedTime": "elapsed_time",
+}
+# event fields replaceable through Observation.replace
+_EVENT_FIELDS = {
+    "inventory": "inventory",
+    "voxels": "voxels",
+    "blockRecords": "block_records",
+    "nearbyChests": "nearby_chests",
+}
+
+
+class RenderMetrics:
+    """
+    Time spent rendering prompt sections, and cache hits and misses
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def pop(self):
+        """
+        Returns: metrics since the last pop, as a dict
+        """
+        metrics = {
+            "render_time": self.seconds,
+            "render_hits": self.hits,
+            "render_misses": self.misses,
+        }
+        self.reset()
+        return metrics
+
+
+render_metrics = RenderMetrics()
+
+SECTIONS = {}
+
+
+def section(name):
+    """
+    Register a function (observation, *args) -> str as a prompt section
+    """
+
+    def register(fn):
+        SECTIONS[name] = fn
+        return fn
+
+    return register
+
+
+class Observation:
+    __slots__ = (
+        "event_type",
+        "message",
+        "biome",
+        "time_of_day",
+        "health",
+        "food",
+        "position",
+        "equipment",
+        "inventory_used",
+        "entities",
+        "elapsed_time",
+        "inventory",
+        "voxels",
+        "block_records",
+        "nearby_chests",
+        "extra_keys",
+        "extra_values",
+        "sections",
+    )
+
+    def __init__(self, event_type, event):
+        """
+        Args:
+            event: a frozen event, only its values are kept
+        """
+        status = event["status"]
+        position = status["position"]
+        self.event_type = event_type
+        self.message = event.get(event_type)
+        self.biome = status["biome"]
+        self.time_of_day = status["timeOfDay"]
+        self.health = status["health"]
+        self.food = status["food"]
+        self.position = Position(position["x"], position["y"], position["z"])
+        self.equipment = status["equipment"]
+        self.inventory_used = status["inventoryUsed"]
+        self.entities = status["entities"]
+        self.elapsed_time = status["elapsedTime"]
+        self.inventory = event["inventory"]
+        self.voxels = event["voxels"]
+        self.block_records = event.get("blockRecords", ())
+        self.nearby_chests = event.get("nearbyChests", _EMPTY)
+        # e.g. velocity, yaw and oxygen, only written to the event log. Every
+        # event has the same extra keys, so they are stored once
+        extra = [(k, v) for k, v in status.items() if k not in _STATUS_FIELDS]
+        keys = tuple(k for k, _ in extra)
+        self.extra_keys = _EXTRA_KEYS.setdefault(keys, keys)
+        self.extra_values = tuple(v for _, v in extra)
+        self.sections = None
+
+    def to_event(self):
+        """
+        Returns: the [event_type, event] pair as sent by the mineflayer server
+        """
+        event = {}
+        if self.message is not None:
+            event[self.event_type] = self.message
+        event["voxels"] = self.voxels
+        event["status"] = {
+            **{key: getattr(self, attr) for key, attr in _STATUS_FIELDS.items()},
+            "position": self.position._asdict(),
+            **dict(zip(self.extra_keys, self.extra_values)),
+        }
+        event["inventory"] = self.inventory
+        event["nearbyChests"] = self.nearby_chests
+        event["blockRecords"] = self.block_records
+        return [self.event_type, event]
+
+    def replace(self, **changes):
+        """
+        Returns: a new Observation with event fields replaced, e.g.
+        inventory, sharing everything else
+        """
+        observation = Observation.__new__(Observation)
+        for attr in Observation.__slots__:
+            setattr(observation, attr, getattr(self, attr))
+        for key, value in changes.items():
+            setattr(observation, _EVENT_FIELDS[key], freeze(value))
+        observation.sections = None
+        return observation
+
+    def render(self, name, *args):
+        """
+        Returns: the text of a registered section, rendered once per
+        observation and arguments
+        """
+        key = (name, *args)
+        if self.sections is None:
+            self.sections = {}
+        elif key in self.sections:
+            render_metrics.hits += 1
+            return self.sections[key]
+        start = time.perf_counter()
+        text = SECTIONS[name](self, *args)
+        render_metrics.seconds += time.perf_counter() - start
+        render_metrics.misses += 1
+        self.sections[key] = text
+        return text
+
+    def nearby_entities(self):
+        """
+        Returns: entity names from nearest to farthest
+        """
+        return [k for k, v in sorted(self.entities.items(), key=lambda x: x[1])]
+
+
+SURFACE_BLOCKS = ["dirt", "log", "grass", "sand", "snow"]
+
+
+@section("biome")
+def _render_biome(obs):
+    return f"Biome: {obs.biome}\n\n"
+
+
+@section("surface_biome")
+def _render_surface_biome(obs):
+    # no surface blocks nearby means the bot is underground
+    if any(name in block for block in obs.voxels for name in SURFACE_BLOCKS):
+        return f"Biome: {obs.biome}\n\n"
+    return "Biome: underground\n\n"
+
+
+@section("time")
+def _render_time(obs):
+    return f"Time: {obs.time_of_day}\n\n"
+
+
+def _join_limited(names, limit=None):
+    if limit is not None and len(names) > limit:
+        return ", ".join(names[:limit]) + f" and {len(names) - limit} more"
+    return ", ".join(names)
+
+
+@section("nearby_blocks")
+def _render_nearby_blocks(obs, limit=None):
+    """
+    limit: optional maximum number of blocks listed
+    """
+    nearby_blocks = _join_limited(list(obs.voxels), limit) if obs.voxels else "None"
+    return f"Nearby blocks: {nearby_blocks}\n\n"
+
+
+@section("other_blocks")
+def _render_other_blocks(obs, limit=None):
+    other_blocks = _join_limited(
+        list(
+            set(obs.block_records).difference(
+                set(obs.voxels).union(set(obs.inventory.keys()))
+            )
+        ),
+        limit,
+    )
+    other_blocks = other_blocks if other_blocks else "None"
+    return f"Other blocks that are recently seen: {other_blocks}\n\n"
+
+
+@section("nearby_entities")
+def _render_nearby_entities(obs):
+    nearby_entities = ", ".join(obs.nearby_entities()) if obs.entities else "None"
+    return f"Nearby entities: {nearby_entities}\n\n"
+
+
+@section("nearby_entities_ranked")
+def _render_nearby_entities_ranked(obs):
+    nearby_entities = ", ".join(obs.nearby_entities()) if obs.entities else "None"
+    return f"Nearby entities (nearest to farthest): {nearby_entities}\n\n"
+
+
+@section("health")
+def _render_health(obs):
+    return f"Health: {obs.health:.1f}/20\n\n"
+
+
+@section("hunger")
+def _render_hunger(obs):
+    return f"Hunger: {obs.food:.1f}/20\n\n"
+
+
+@section("position")
+def _render_position(obs):
+    x, y, z = obs.position
+    return f"Position: x={x:.1f}, y={y:.1f}, z={z:.1f}\n\n"
+
+
+@section("equipment")
+def _render_equipment(obs):
+    return f"Equipment: {obs.equipment}\n\n"
+
+
+@section("inventory")
+def _render_inventory(obs, item_filter=None):
+    """
+    item_filter: optional compiled regex, only matching items are shown
+    """
+    inventory = obs.inventory
+    if item_filter is not None:
+        inventory = {k: v for k, v in inventory.items() if item_filter.search(k)}
+    return f"Inventory ({obs.inventory_used}/36): {inventory if inventory else 'Empty'}\n\n"
+
+
+class Events:
+    """
+    The events of one env step
+    """
+
+    __slots__ = ("observations", "chat_messages", "error_messages", "damage_messages")
+
+    def __init__(self, observations):
+        self.chat_messages = []
+        self.error_messages = []
+        self.damage_messages = []
+        self.observations = observations
+        for observation in observations:
+            if observation.event_type == "onChat":
+                self.chat_messages.append(observation.message)
+            elif observation.event_type == "onError":
+                self.error_messages.append(observation.message)
+            elif observation.event_type == "onDamage":
+                self.damage_messages.append(observation.message)
+
+    def __len__(self):
+        return len(self.observations)
+
+    def __eq__(self, other):
+        if isinstance(other, Events):
+            other = other.to_json()
+        return self.to_json() == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return parse_events, (self.to_json(),)
+
+    def to_json(self):
+        """
+        Returns: the events as a list of [event_type, event] pairs
+        """
+        return [observation.to_event() for observation in self.observations]
+
+    @property
+    def observation(self):
+        """
+        The final observe event
+        """
+        assert (
+            self.observations and self.observations[-1].event_type == "observe"
+        ), "Last event must be observe"
+        return self.observations[-1]
+
+    def replace_observation(self, **changes):
+        """
+        Returns: Events with fields of the final observation replaced,
+        sharing everything else
+        """
+        return Events(
+            self.observations[:-1] + [self.observation.replace(**changes)]
+        )
+
+
+def parse_events(events):
+    """
+    Returns: events as Events, parsing them only if they are not yet
+    """
+    if isinstance(events, Events):
+        return events
+    if isinstance(events, (str, bytes)):
+        events = loads_frozen(events)
+    else:
+        events = freeze(events)
+    return Events([Observation(event_type, event) for event_type, event in events])
@@ -0,0 +1,153 @@
+"""
+Packed skill library format.
+
+A packed library is a directory with three files:
+    manifest.json   names, descriptions, item usage and code offsets
+    code.bin        utf-8 skill code, each followed by a blank line
+    embeddings.npy  float32 matrix of L2-normalized description embeddings
+The code blob and the embedding matrix are memory-mapped on open, so opening
+is cheap and concurrent readers share pages through the page cache.
+"""
+import mmap
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from .file_utils import f_join, f_mkdir
+from .json_utils import dump_json, load_json
+
+PACK_FORMAT_VERSION = 2
+# format 1 has no blank lines between the skills in code.bin
+SUPPORTED_PACK_FORMATS = [1, 2]
+
+
+def pack_skill_library(output_dir, skills, embeddings, embedding_model, item_usage):
+    """
+    Args:
+        skills: dict of name -> {"code": str, "description": str}
+        embeddings: dict of name -> embedding vector
+        embedding_model: name of the model the embeddings come from
+        item_usage: dict of name -> {role: [item names]}
+    """
+    f_mkdir(output_dir)
+    names = list(skills.keys())
+    entries = []
+    offset = 0
+    with open(f_join(output_dir, "code.bin"), "wb") as fp:
+        for name in names:
+            code = skills[name]["code"].encode("utf-8")
+            fp.write(code + b"\n\n")
+            entries.append(
+                {
+                    "name": name,
+                    "description": skills[name]["description"],
+                    "offset": offset,
+                    "length": len(code),
+                    "items": {
+                        role: sorted(items)
+                        for role, items in item_usage.get(name, {}).items()
+                    },
+                }
+            )
+            offset += len(code) + 2
+    matrix = np.array([embeddings[name] for name in names], dtype=np.float32)
+    if len(names):
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+    np.save(f_join(output_dir, "embeddings.npy"), matrix)
+    # manifest last, so a library is only readable once it is complete
+    dump_json(
+        {
+            "format": PACK_FORMAT_VERSION,
+            "embedding_model": embedding_model,
+            "skills": entries,
+        },
+        f_join(output_dir, "manifest.json"),
+    )
+
+
+class PackedSkills(Mapping):
+    """
+    Read-only name -> {"code", "description"} mapping over a packed library.
+    Code is decoded from the memory-mapped blob on every access and not
+    kept, so the blob stays shared in the page cache.
+    """
+
+    def __init__(self, library):
+        self.library = library
+
+    def __getitem__(self, name):
+        entry = self.library.entries[self.library.positions[name]]
+        return {
+            "code": self.library.get_code(name),
+            "description": entry["description"],
+        }
+
+    def __iter__(self):
+        return iter(self.library.positions)
+
+    def __len__(self):
+        return len(self.library.positions)
+
+    def __contains__(self, name):
+        return name in self.library.positions
+
+
+class PackedSkillLibrary:
+    def __init__(self, library_dir):
+        manifest = load_json(f_join(library_dir, "manifest.json"))
+        assert (
+            manifest["format"] in SUPPORTED_PACK_FORMATS
+        ), f"Unsupported packed library format {manifest['format']}"
+        self.library_dir = library_dir
+        self.format = manifest["format"]
+        self.embedding_model = manifest["embedding_model"]
+        self.entries = manifest["skills"]
+        self.positions = {entry["name"]: i for i, entry in enumerate(self.entries)}
+        self.embeddings = np.load(f_join(library_dir, "embeddings.npy"), mmap_mode="r")
+        self.code_file = open(f_join(library_dir, "code.bin"), "rb")
+        if os.path.getsize(f_join(library_dir, "code.bin")):
+            self.code = mmap.mmap(self.code_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # empty files cannot be memory-mapped
+            self.code = b""
+        self.skills = PackedSkills(self)
+
+    def get_code(self, name):
+        entry = self.entries[self.positions[name]]
+        start = entry["offset"]
+        return self.code[start : start + entry["length"]].decode("utf-8")
+
+    def programs(self):
+        """
+        Returns: the code of every skill followed by a blank line, decoded
+        from code.bin in one pass
+        """
+        if self.format == 1:
+            return "".join(f"{self.get_code(entry['name'])}\n\n" for entry in self.entries)
+        return self.code[:].decode("utf-8")
+
+    def search(self, query_embedding, k, names=None):
+        """
+        Returns: up to k skill names ranked by cosine similarity
+        """
+        query = np.array(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-8
+        if names is None:
+            rows = np.arange(len(self.entries))
+            matrix = self.embeddings
+        else:
+            rows = np.array([self.positions[name] for name in names], dtype=np.int64)
+            matrix = self.embeddings[rows]
+        if len(rows) == 0:
+            return []
+        scores = matrix @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.entries[rows[i]]["name"] for i in top]
+
+    def close(self):
+        if isinstance(self.code, mmap.mmap):
+            self.code.close()
+        self.code_file.close()
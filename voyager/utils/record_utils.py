@@ -1,7 +1,142 @@
+import gzip
+import json
+import os
 import time
 
 from .file_utils import *
 from .json_utils import *
+from .checkpoint_utils import CheckpointManager
+from .observation_utils import parse_events
+from .trajectory_utils import Trajectory
+
+
+class EventLog:
+    """
+    Append-only log of the events of every iteration.
+    Each record is one gzip member appended to the current segment file
+    events/segment_{i}.jsonl.gz, so a segment is itself a valid gzip file.
+    events/index.jsonl holds one line per iteration with the segment, offset
+    and length of its record, so a single iteration is read with one seek.
+    With read_only=True nothing is written, so a log can be read while the
+    recorder of a live run appends to it.
+    """
+
+    def __init__(self, log_dir, segment_bytes=16 * 1024 * 1024, read_only=False):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.read_only = read_only
+        self.index_path = f_join(log_dir, "index.jsonl")
+        self.entries = []
+        if not read_only:
+            f_mkdir(log_dir)
+        if f_exists(self.index_path):
+            with open(self.index_path, "r") as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write at the end of the index
+                        break
+                    if not self.is_complete(entry):
+                        break
+                    self.entries.append(entry)
+            if not read_only:
+                self.rewrite_index()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def segment_path(self, segment):
+        return f_join(self.log_dir, f"segment_{segment:05d}.jsonl.gz")
+
+    def is_complete(self, entry):
+        path = self.segment_path(entry["segment"])
+        return (
+            os.path.exists(path)
+            and os.path.getsize(path) >= entry["offset"] + entry["length"]
+        )
+
+    def rewrite_index(self):
+        with open(self.index_path, "w") as fp:
+            for entry in self.entries:
+                fp.write(json.dumps(entry) + "\n")
+
+    def append(self, task, events):
+        """
+        Returns: iteration number of the new record, starting from 1
+        """
+        assert not self.read_only, "EventLog is read-only"
+        data = gzip.compress(json.dumps(events).encode("utf-8"))
+        segment, offset = 0, 0
+        if self.entries:
+            last = self.entries[-1]
+            segment, offset = last["segment"], last["offset"] + last["length"]
+            if offset >= self.segment_bytes:
+                segment, offset = segment + 1, 0
+        with open(self.segment_path(segment), "ab") as fp:
+            # drop any partial record left behind by a crash
+            fp.truncate(offset)
+            fp.write(data)
+        entry = {
+            "iteration": len(self.entries) + 1,
+            "task": task,
+            "time": time.time(),
+            "segment": segment,
+            "offset": offset,
+            "length": len(data),
+        }
+        with open(self.index_path, "a") as fp:
+            fp.write(json.dumps(entry) + "\n")
+        self.entries.append(entry)
+        return entry["iteration"]
+
+    def read(self, iteration):
+        entry = self.entries[iteration - 1]
+        with open(self.segment_path(entry["segment"]), "rb") as fp:
+            fp.seek(entry["offset"])
+            data = fp.read(entry["length"])
+        return json.loads(gzip.decompress(data))
+
+    def iter_records(self, start=1, stop=None):
+        """
+        Yields: (index entry, events) for iterations start..stop inclusive,
+        reading each segment sequentially
+        """
+        stop = len(self.entries) if stop is None else min(stop, len(self.entries))
+        fp, segment = None, None
+        try:
+            for entry in self.entries[start - 1 : stop]:
+                if entry["segment"] != segment:
+                    if fp:
+                        fp.close()
+                    segment = entry["segment"]
+                    fp = open(self.segment_path(segment), "rb")
+                fp.seek(entry["offset"])
+                yield entry, json.loads(gzip.decompress(fp.read(entry["length"])))
+        finally:
+            if fp:
+                fp.close()
+
+
+def legacy_event_records(ckpt_dir):
+    """
+    Returns: (task, path) of the per-iteration event files written before
+    the event log existed, oldest first
+    """
+
+    def get_timestamp(string):
+        timestamp = "_".join(string.split("_")[-2:])
+        return time.mktime(time.strptime(timestamp, "%Y%m%d_%H%M%S"))
+
+    records = [
+        record
+        for record in f_listdir(ckpt_dir, "events")
+        if re.search(r"_\d{8}_\d{6}$", record)
+    ]
+    return [
+        (re.sub(r"_\d{8}_\d{6}$", "", record), f_join(ckpt_dir, "events", record))
+        for record in sorted(records, key=get_timestamp)
+    ]
 
 
 class EventRecorder:
@@ -10,74 +145,150 @@ class EventRecorder:
         ckpt_dir="ckpt",
         resume=False,
         init_position=None,
+        checkpoint=None,
+        snapshot_interval=10,
+        trajectory_cell_size=16,
+        trajectory_min_distance=0.0,
     ):
         self.ckpt_dir = ckpt_dir
+        self.checkpoint = checkpoint or CheckpointManager(ckpt_dir, background=False)
+        self.snapshot_interval = snapshot_interval
+        self.trajectory_cell_size = trajectory_cell_size
+        self.trajectory_min_distance = trajectory_min_distance
         self.item_history = set()
         self.item_vs_time = {}
         self.item_vs_iter = {}
         self.biome_history = set()
         self.init_position = init_position
-        self.position_history = [[0, 0]]
+        self.position_history = self.new_trajectory()
         self.elapsed_time = 0
         self.iteration = 0
         f_mkdir(self.ckpt_dir, "events")
+        self.log = EventLog(f_join(self.ckpt_dir, "events"))
+        self.snapshot_path = f_join(self.ckpt_dir, "events", "snapshot.json")
+        self.checkpoint.register("events_snapshot", self.snapshot_path, self.snapshot)
         if resume:
             self.resume()
 
     def record(self, events, task):
-        task = re.sub(r'[\\/:"*?<>| ]', "_", task)
-        task = task.replace(" ", "_") + time.strftime(
-            "_%Y%m%d_%H%M%S", time.localtime()
-        )
+        events = parse_events(events)
         self.iteration += 1
-        if not self.init_position:
-            self.init_position = [
-                events[0][1]["status"]["position"]["x"],
-                events[0][1]["status"]["position"]["z"],
-            ]
-        for event_type, event in events:
-            self.update_items(event)
-            if event_type == "observe":
-                self.update_elapsed_time(event)
+        self.replay(events)
         print(
             f"\033[96m****Recorder message: {self.elapsed_time} ticks have elapsed****\033[0m\n"
             f"\033[96m****Recorder message: {self.iteration} iteration passed****\033[0m"
         )
-        dump_json(events, f_join(self.ckpt_dir, "events", task))
+        self.log.append(task, events.to_json())
+        if self.iteration % self.snapshot_interval == 0:
+            self.checkpoint.mark_dirty("events_snapshot")
 
-    def resume(self, cutoff=None):
+    def replay(self, events):
+        observations = parse_events(events).observations
+        if not self.init_position and observations:
+            self.init_position = [
+                observations[0].position.x,
+                observations[0].position.z,
+            ]
+        for observation in observations:
+            self.update_items(observation)
+            self.update_position(observation)
+            if observation.event_type == "observe":
+                self.update_elapsed_time(observation)
+
+    def snapshot(self):
+        return {
+            "iteration": self.iteration,
+            "init_position": self.init_position,
+            "item_history": sorted(self.item_history),
+            "item_vs_time": [[t, items] for t, items in self.item_vs_time.items()],
+            "item_vs_iter": [[i, items] for i, items in self.item_vs_iter.items()],
+            "biome_history": sorted(self.biome_history),
+            "position_history": self.position_history.to_json(),
+            "elapsed_time": self.elapsed_time,
+        }
+
+    def load_snapshot(self, snapshot):
+        self.iteration = snapshot["iteration"]
+        self.init_position = snapshot["init_position"]
+        self.item_history = set(snapshot["item_history"])
+        self.item_vs_time = {t: items for t, items in snapshot["item_vs_time"]}
+        self.item_vs_iter = {i: items for i, items in snapshot["item_vs_iter"]}
+        self.biome_history = set(snapshot["biome_history"])
+        if isinstance(snapshot["position_history"], list):
+            self.position_history = Trajectory.from_points(
+                snapshot["position_history"],
+                self.trajectory_cell_size,
+                self.trajectory_min_distance,
+            )
+        else:
+            self.position_history = Trajectory.from_json(snapshot["position_history"])
+        self.elapsed_time = snapshot["elapsed_time"]
+
+    def reset(self):
         self.item_history = set()
         self.item_vs_time = {}
         self.item_vs_iter = {}
+        self.biome_history = set()
         self.elapsed_time = 0
-        self.position_history = [[0, 0]]
-
-        def get_timestamp(string):
-            timestamp = "_".join(string.split("_")[-2:])
-            return time.mktime(time.strptime(timestamp, "%Y%m%d_%H%M%S"))
-
-        records = f_listdir(self.ckpt_dir, "events")
-        sorted_records = sorted(records, key=get_timestamp)
-        for record in sorted_records:
-            self.iteration += 1
-            if cutoff and self.iteration > cutoff:
-                break
-            events = load_json(f_join(self.ckpt_dir, "events", record))
-            if not self.init_position:
-                self.init_position = (
-                    events[0][1]["status"]["position"]["x"],
-                    events[0][1]["status"]["position"]["z"],
-                )
-            for event_type, event in events:
-                self.update_items(event)
-                self.update_position(event)
-                if event_type == "observe":
-                    self.update_elapsed_time(event)
-
-    def update_items(self, event):
-        inventory = event["inventory"]
-        elapsed_time = event["status"]["elapsedTime"]
-        biome = event["status"]["biome"]
+        self.position_history = self.new_trajectory()
+        self.iteration = 0
+
+    def new_trajectory(self):
+        trajectory = Trajectory(self.trajectory_cell_size, self.trajectory_min_distance)
+        trajectory.append(0, 0)
+        return trajectory
+
+    def resume(self, cutoff=None):
+        """
+        Restore the aggregate state from the latest snapshot and replay only
+        the iterations recorded after it. Checkpoints written before the
+        event log existed are replayed from their per-iteration json files
+        and migrated into the log.
+        """
+        self.reset()
+        if not len(self.log):
+            self.resume_legacy(cutoff)
+            return
+        snapshot = (
+            self.checkpoint.load_json(self.snapshot_path)
+            if f_exists(self.snapshot_path)
+            else None
+        )
+        if (
+            snapshot
+            and snapshot["iteration"] <= len(self.log)
+            and (not cutoff or snapshot["iteration"] <= cutoff)
+        ):
+            init_position = self.init_position
+            self.load_snapshot(snapshot)
+            self.init_position = self.init_position or init_position
+        for entry, events in self.log.iter_records(self.iteration + 1, cutoff or None):
+            self.iteration = entry["iteration"]
+            self.replay(events)
+
+    def resume_legacy(self, cutoff=None):
+        records = legacy_event_records(self.ckpt_dir)
+        if not records:
+            return
+        print(
+            f"\033[96m****Recorder message: migrating {len(records)} event files to the event log****\033[0m"
+        )
+        iteration = 0
+        for task, path in records:
+            events = load_json(path)
+            self.log.append(task, events)
+            iteration += 1
+            if cutoff and iteration > cutoff:
+                continue
+            self.iteration = iteration
+            self.replay(events)
+        if not cutoff:
+            self.checkpoint.mark_dirty("events_snapshot")
+
+    def update_items(self, observation):
+        inventory = observation.inventory
+        elapsed_time = observation.elapsed_time
+        biome = observation.biome
         items = set(inventory.keys())
         new_items = items - self.item_history
         self.item_history.update(items)
@@ -90,13 +301,19 @@ class EventRecorder:
                 self.item_vs_iter[self.iteration] = []
             self.item_vs_iter[self.iteration].extend(new_items)
 
-    def update_elapsed_time(self, event):
-        self.elapsed_time += event["status"]["elapsedTime"]
+    def update_elapsed_time(self, observation):
+        self.elapsed_time += observation.elapsed_time
+
+    def update_position(self, observation):
+        self.position_history.append(
+            observation.position.x - self.init_position[0],
+            observation.position.z - self.init_position[1],
+        )
 
-    def update_position(self, event):
-        position = [
-            event["status"]["position"]["x"] - self.init_position[0],
-            event["status"]["position"]["z"] - self.init_position[1],
-        ]
-        if self.position_history[-1] != position:
-            self.position_history.append(position)
+    def exploration_metrics(self):
+        return {
+            "distance": self.position_history.distance,
+            "cells_visited": self.position_history.coverage(),
+            "area_visited": self.position_history.coverage_area(),
+            "revisits": self.position_history.revisits(),
+        }
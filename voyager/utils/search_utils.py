@@ -0,0 +1,108 @@
+"""
+Lexical search utils.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_CASE_PATTERN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+_STRING_LITERAL_PATTERN = re.compile(r"[\"'`]([a-z0-9_]+)[\"'`]")
+_MCDATA_NAME_PATTERN = re.compile(r"(?:itemsByName|blocksByName)\.([a-z0-9_]+)")
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search tokens.
+    Identifiers are kept whole and also split on camelCase and snake_case,
+    so "craftIronPickaxe" yields craftironpickaxe, craft, iron, pickaxe and
+    "iron_ingot" yields iron_ingot, iron, ingot.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER_PATTERN.findall(text):
+        parts = []
+        for part in identifier.split("_"):
+            parts.extend(p.lower() for p in _CAMEL_CASE_PATTERN.findall(part))
+        if len(parts) > 1:
+            tokens.append(identifier.lower())
+        tokens.extend(parts)
+    return tokens
+
+
+def extract_item_names(code):
+    """
+    Returns: item-like identifiers in code, i.e. string literals such as
+    "iron_ore" in `mineBlock(bot, "iron_ore", 3)` and mcData lookups such as
+    `mcData.itemsByName.iron_ingot`
+    """
+    return _STRING_LITERAL_PATTERN.findall(code) + _MCDATA_NAME_PATTERN.findall(code)
+
+
+class BM25Index:
+    """
+    Inverted index over short documents with Okapi BM25 scoring.
+    Documents can be added or replaced incrementally.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # token -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.doc_tokens = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __contains__(self, token):
+        return token in self.postings
+
+    def add(self, doc_id, tokens):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokens)
+        for token, tf in counts.items():
+            self.postings[token][doc_id] = tf
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_tokens[doc_id] = set(counts)
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id):
+        if doc_id not in self.doc_lengths:
+            return
+        for token in self.doc_tokens.pop(doc_id):
+            docs = self.postings[token]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, tokens, k=None, doc_ids=None):
+        """
+        Args:
+            doc_ids: optionally restrict the search to these documents
+        Returns: list of (doc_id, score) sorted by descending score
+        """
+        if not self.doc_lengths:
+            return []
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs
+        if doc_ids is not None:
+            doc_ids = set(doc_ids)
+        scores = defaultdict(float)
+        for token in set(tokens):
+            docs = self.postings.get(token)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if doc_ids is not None and doc_id not in doc_ids:
+                    continue
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                )
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:k] if k else ranked
@@ -0,0 +1,243 @@
+"""
+Skill library utils: static analysis of skill code and version bookkeeping.
+"""
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+from .file_utils import f_exists, f_join, f_listdir
+from .json_utils import dump_json, load_json
+
+
+# primitive name -> roles of its literal item arguments, in argument order
+PRIMITIVE_ITEM_ROLES = {
+    "mineBlock": ["produces"],
+    "craftItem": ["produces"],
+    "killMob": ["produces"],
+    "smeltItem": ["consumes", "consumes"],
+    "placeItem": ["consumes"],
+}
+
+ITEM_ROLES = ["produces", "consumes", "uses"]
+
+_PRIMITIVE_CALL_PATTERN = re.compile(
+    r"\b(" + "|".join(PRIMITIVE_ITEM_ROLES) + r")\s*\(\s*bot\s*,([^;]*?)\)"
+)
+_STRING_ARG_PATTERN = re.compile(r"^\s*[\"'`]([a-z0-9_]+)[\"'`]\s*$")
+_MCDATA_NAME_PATTERN = re.compile(r"(?:itemsByName|blocksByName)\.([a-z0-9_]+)")
+
+
+def extract_item_usage(code):
+    """
+    Find literal item names handled by skill code.
+    Items passed to primitives are classified by what the primitive does
+    with them, `mineBlock(bot, "iron_ore", 3)` produces iron_ore and
+    `smeltItem(bot, "raw_iron", "coal")` consumes raw_iron and coal.
+    Items looked up through mcData are recorded as used.
+
+    Returns: dict of role -> set of item names
+    """
+    usage = {role: set() for role in ITEM_ROLES}
+    for primitive, args in _PRIMITIVE_CALL_PATTERN.findall(code):
+        for role, arg in zip(PRIMITIVE_ITEM_ROLES[primitive], args.split(",")):
+            match = _STRING_ARG_PATTERN.match(arg)
+            if match:
+                usage[role].add(match.group(1))
+    usage["uses"].update(_MCDATA_NAME_PATTERN.findall(code))
+    usage["uses"] -= usage["produces"] | usage["consumes"]
+    return usage
+
+
+class ItemCatalogue:
+    """
+    Maps item names to the skills that produce, consume or use them.
+    """
+
+    def __init__(self):
+        self.items = defaultdict(lambda: {role: set() for role in ITEM_ROLES})
+        self.skill_items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def add(self, skill_name, code):
+        self.add_usage(skill_name, extract_item_usage(code))
+
+    def add_usage(self, skill_name, usage):
+        self.remove(skill_name)
+        usage = {role: set(items) for role, items in usage.items()}
+        for role, items in usage.items():
+            for item in items:
+                self.items[item][role].add(skill_name)
+        self.skill_items[skill_name] = usage
+
+    def remove(self, skill_name):
+        usage = self.skill_items.pop(skill_name, None)
+        if usage is None:
+            return
+        for role, items in usage.items():
+            for item in items:
+                self.items[item][role].discard(skill_name)
+                if not any(self.items[item].values()):
+                    del self.items[item]
+
+    def skills_for_items(self, items, roles=None):
+        """
+        Returns: skill names handling any of the items, ordered by
+        how many of the items they handle
+        """
+        roles = roles or ITEM_ROLES
+        counts = defaultdict(int)
+        for item in items:
+            if item not in self.items:
+                continue
+            for role in roles:
+                for skill_name in self.items[item][role]:
+                    counts[skill_name] += 1
+        return sorted(counts, key=lambda name: (-counts[name], name))
+
+    def items_in_text(self, text):
+        """
+        Returns: catalogued item names mentioned in free text, matching both
+        "iron_ingot" and "iron ingot"
+        """
+        words = re.findall(r"[a-z0-9_]+", text.lower())
+        candidates = set(words)
+        candidates.update(f"{a}_{b}" for a, b in zip(words, words[1:]))
+        candidates.update(f"{a}_{b}_{c}" for a, b, c in zip(words, words[1:], words[2:]))
+        # plural forms, e.g. "Mine 3 oak logs"
+        candidates.update(c[:-1] for c in list(candidates) if c.endswith("s"))
+        return sorted(c for c in candidates if c in self.items)
+
+    def to_json(self):
+        return {
+            item: {role: sorted(skills) for role, skills in roles.items()}
+            for item, roles in sorted(self.items.items())
+        }
+
+
+def code_hash(code):
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def normalized_code_hash(code):
+    """
+    Hash of code with comments and whitespace removed, so that skills which
+    only differ in formatting or comments hash the same
+    """
+    code = re.sub(r"/\*.*?\*/", "", code, flags=re.DOTALL)
+    code = re.sub(r"//[^\n]*", "", code)
+    return code_hash("".join(code.split()))
+
+
+class SkillVersionIndex:
+    """
+    Index of every stored version of every skill, persisted as versions.json:
+    {skill_name: [{"file": "craftChest", "hash": ...}, {"file": "craftChestV2", ...}]}
+    The first version is stored under the skill name, later ones get a V{i} suffix.
+    """
+
+    def __init__(self, code_dir, versions=None):
+        """
+        Args:
+            versions: content of versions.json if already loaded
+        """
+        self.code_dir = code_dir
+        self.path = f_join(os.path.dirname(code_dir), "versions.json")
+        if versions is not None:
+            self.versions = versions
+        elif f_exists(self.path):
+            self.versions = load_json(self.path)
+        else:
+            self.versions = self.backfill(code_dir)
+            if self.versions:
+                self.save()
+
+    @staticmethod
+    def backfill(code_dir):
+        """
+        Build the index from an existing code directory with a single scan
+        """
+        files = sorted(f[:-3] for f in f_listdir(code_dir) if f.endswith(".js"))
+        file_set = set(files)
+        versions = defaultdict(list)
+        for file in files:
+            match = re.fullmatch(r"(.+)V(\d+)", file)
+            if match and match.group(1) in file_set:
+                name, version = match.group(1), int(match.group(2))
+            else:
+                name, version = file, 1
+            with open(f_join(code_dir, f"{file}.js"), "r") as fp:
+                versions[name].append((version, file, code_hash(fp.read())))
+        return {
+            name: [{"file": file, "hash": h} for _, file, h in sorted(entries)]
+            for name, entries in versions.items()
+        }
+
+    def __contains__(self, name):
+        return name in self.versions
+
+    def get_versions(self, name):
+        return list(self.versions.get(name, []))
+
+    def latest(self, name):
+        versions = self.versions.get(name)
+        return versions[-1] if versions else None
+
+    def is_latest(self, name, code):
+        latest = self.latest(name)
+        return latest is not None and latest["hash"] == code_hash(code)
+
+    def stored_files(self, name):
+        """
+        Returns: files in the code directory holding versions of the skill,
+        indexed or not, oldest first
+        """
+        versions = []
+        for file in f_listdir(self.code_dir):
+            match = re.fullmatch(re.escape(name) + r"(?:V(\d+))?\.js", file)
+            if match:
+                versions.append((int(match.group(1) or 1), file[:-3]))
+        return [file for _, file in sorted(versions)]
+
+    def allocate(self, name):
+        """
+        Returns: file name for the next version of the skill
+        """
+        if not self.versions.get(name):
+            return name
+        # one past the highest suffix, there may be gaps in the versions
+        version = self.highest_version(name) + 1
+        while f_exists(f_join(self.code_dir, f"{name}V{version}.js")):
+            version += 1
+        return f"{name}V{version}"
+
+    def highest_version(self, name):
+        highest = 1
+        for entry in self.versions.get(name, []):
+            match = re.fullmatch(re.escape(name) + r"V(\d+)", entry["file"])
+            if match:
+                highest = max(highest, int(match.group(1)))
+        return highest
+
+    def has_unindexed(self, name):
+        """
+        Returns: whether a version newer than the indexed ones is stored,
+        e.g. one written before a crash
+        """
+        if not self.versions.get(name):
+            return f_exists(f_join(self.code_dir, f"{name}.js"))
+        version = self.highest_version(name) + 1
+        return f_exists(f_join(self.code_dir, f"{name}V{version}.js"))
+
+    def add(self, name, file, code):
+        self.versions.setdefault(name, []).append(
+            {"file": file, "hash": code_hash(code)}
+        )
+
+    def save(self):
+        dump_json(self.versions, self.path, indent=2)
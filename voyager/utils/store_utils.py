@@ -0,0 +1,135 @@
+"""
+SQLite backed store for curriculum state.
+"""
+import sqlite3
+import threading
+import time
+
+from .checkpoint_utils import atomic_dump_json
+from .file_utils import f_join
+
+
+class CurriculumStore:
+    """
+    Append-only store for the qa cache and the completed / failed task lists.
+    Every update is a single indexed write in WAL mode instead of a rewrite of
+    the whole json file. export_json() writes the json files the older
+    checkpoint layout used.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS qa_cache ("
+                "question TEXT PRIMARY KEY, normalized TEXT, answer TEXT, created REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS qa_cache_normalized ON qa_cache (normalized)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS completed_tasks ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT UNIQUE, created REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS failed_tasks ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT, created REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS failed_tasks_task ON failed_tasks (task)"
+            )
+
+    def is_empty(self):
+        with self.lock:
+            for table in ["qa_cache", "completed_tasks", "failed_tasks"]:
+                if self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return False
+        return True
+
+    def add_qa(self, question, normalized, answer):
+        self.add_qa_many([(question, normalized, answer)])
+
+    def add_qa_many(self, rows):
+        """
+        Args:
+            rows: (question, normalized question, answer) tuples
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO qa_cache VALUES (?, ?, ?, ?)",
+                [(question, normalized, answer, now) for question, normalized, answer in rows],
+            )
+
+    def clear(self):
+        with self.lock, self.conn:
+            for table in ["qa_cache", "completed_tasks", "failed_tasks"]:
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def load_qa_cache(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT question, answer FROM qa_cache ORDER BY rowid"
+            ).fetchall()
+        return dict(rows)
+
+    def add_completed_task(self, task):
+        # a completed task is no longer a failed one
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO completed_tasks (task, created) VALUES (?, ?)",
+                (task, time.time()),
+            )
+            self.conn.execute("DELETE FROM failed_tasks WHERE task = ?", (task,))
+
+    def add_failed_task(self, task):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO failed_tasks (task, created) VALUES (?, ?)",
+                (task, time.time()),
+            )
+
+    def replace_tasks(self, completed_tasks, failed_tasks):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM completed_tasks")
+            self.conn.execute("DELETE FROM failed_tasks")
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO completed_tasks (task, created) VALUES (?, ?)",
+                [(task, now) for task in completed_tasks],
+            )
+            self.conn.executemany(
+                "INSERT INTO failed_tasks (task, created) VALUES (?, ?)",
+                [(task, now) for task in failed_tasks],
+            )
+
+    def load_tasks(self):
+        """
+        Returns: completed tasks and failed tasks, in insertion order
+        """
+        with self.lock:
+            completed = self.conn.execute(
+                "SELECT task FROM completed_tasks ORDER BY seq"
+            ).fetchall()
+            failed = self.conn.execute(
+                "SELECT task FROM failed_tasks ORDER BY seq"
+            ).fetchall()
+        return [row[0] for row in completed], [row[0] for row in failed]
+
+    def export_json(self, output_dir):
+        """
+        Atomically write completed_tasks.json, failed_tasks.json and
+        qa_cache.json, safe to call from another thread
+        """
+        completed_tasks, failed_tasks = self.load_tasks()
+        atomic_dump_json(completed_tasks, f_join(output_dir, "completed_tasks.json"))
+        atomic_dump_json(failed_tasks, f_join(output_dir, "failed_tasks.json"))
+        atomic_dump_json(self.load_qa_cache(), f_join(output_dir, "qa_cache.json"))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,124 @@
+"""
+Array-backed bot trajectory with a sparse grid index of visited cells.
+"""
+import math
+
+import numpy as np
+
+
+class Trajectory:
+    """
+    Positions are kept in a growable float32 [n, 2] array of (x, z).
+    A position is stored when it differs from the last stored one by at
+    least min_distance, so min_distance > 0 downsamples long runs, while
+    distance travelled and the cell index are updated for every position.
+    cells maps (cell_x, cell_z) of cell_size blocks to the number of times
+    the bot entered the cell.
+    """
+
+    def __init__(self, cell_size=16, min_distance=0.0, capacity=1024):
+        self.cell_size = cell_size
+        self.min_distance = min_distance
+        self.points = np.zeros((capacity, 2), dtype=np.float32)
+        self.size = 0
+        self.cells = {}
+        self.last_cell = None
+        self.last_position = None
+        self.distance = 0.0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.array[index].tolist()
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    @property
+    def array(self):
+        return self.points[: self.size]
+
+    def cell(self, x, z):
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def append(self, x, z):
+        if self.last_position is not None:
+            dx, dz = x - self.last_position[0], z - self.last_position[1]
+            if dx == 0 and dz == 0:
+                return
+            self.distance += math.hypot(dx, dz)
+        self.last_position = (x, z)
+        cell = self.cell(x, z)
+        if cell != self.last_cell:
+            self.cells[cell] = self.cells.get(cell, 0) + 1
+            self.last_cell = cell
+        if self.size:
+            last = self.points[self.size - 1]
+            if math.hypot(x - last[0], z - last[1]) < self.min_distance:
+                return
+        if self.size == len(self.points):
+            self.points = np.concatenate([self.points, np.zeros_like(self.points)])
+        self.points[self.size] = (x, z)
+        self.size += 1
+
+    def coverage(self):
+        """
+        Returns: number of distinct cells visited
+        """
+        return len(self.cells)
+
+    def coverage_area(self):
+        return len(self.cells) * self.cell_size**2
+
+    def revisits(self):
+        """
+        Returns: number of times the bot came back to a cell it had left
+        """
+        return sum(self.cells.values()) - len(self.cells)
+
+    def visits(self, x, z):
+        return self.cells.get(self.cell(x, z), 0)
+
+    def is_visited(self, x, z):
+        return self.cell(x, z) in self.cells
+
+    def bounds(self):
+        """
+        Returns: ((min_x, min_z), (max_x, max_z)) of the stored positions
+        """
+        if not self.size:
+            return None
+        return self.array.min(axis=0).tolist(), self.array.max(axis=0).tolist()
+
+    def to_json(self):
+        return {
+            "cell_size": self.cell_size,
+            "min_distance": self.min_distance,
+            "points": self.array.ravel().tolist(),
+            "cells": [[cx, cz, count] for (cx, cz), count in self.cells.items()],
+            "last_cell": self.last_cell,
+            "last_position": self.last_position,
+            "distance": self.distance,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        trajectory = cls(data["cell_size"], data["min_distance"])
+        points = np.array(data["points"], dtype=np.float32).reshape(-1, 2)
+        trajectory.points = np.concatenate([points, np.zeros((1024, 2), dtype=np.float32)])
+        trajectory.size = len(points)
+        trajectory.cells = {(cx, cz): count for cx, cz, count in data["cells"]}
+        trajectory.last_cell = tuple(data["last_cell"]) if data["last_cell"] else None
+        trajectory.last_position = (
+            tuple(data["last_position"]) if data["last_position"] else None
+        )
+        trajectory.distance = data["distance"]
+        return trajectory
+
+    @classmethod
+    def from_points(cls, points, cell_size=16, min_distance=0.0):
+        trajectory = cls(cell_size, min_distance)
+        for x, z in points:
+            trajectory.append(x, z)
+        return trajectory
@@ -1,4 +1,3 @@
-import copy
 import json
 import os
 import time
@@ -11,6 +10,7 @@ from .agents import ActionAgent
 from .agents import CriticAgent
 from .agents import CurriculumAgent
 from .agents import SkillManager
+from .llm import code_block_closed, llm_client, route_metrics, token_metrics
 
 
 # TODO: remove event memory
@@ -30,21 +30,41 @@ class Voyager:
         action_agent_task_max_retries: int = 4,
         action_agent_show_chat_log: bool = True,
         action_agent_show_execution_error: bool = True,
+        action_agent_token_budget: int = None,
+        action_agent_validate_programs: bool = True,
         curriculum_agent_model_name: str = "gpt-4",
         curriculum_agent_temperature: float = 0,
         curriculum_agent_qa_model_name: str = "gpt-3.5-turbo",
         curriculum_agent_qa_temperature: float = 0,
+        curriculum_agent_qa_cache_similarity_threshold: float = 0.05,
         curriculum_agent_warm_up: Dict[str, int] = None,
         curriculum_agent_core_inventory_items: str = r".*_log|.*_planks|stick|crafting_table|furnace"
         r"|cobblestone|dirt|coal|.*_pickaxe|.*_sword|.*_axe",
         curriculum_agent_mode: str = "auto",
+        curriculum_agent_token_budget: int = None,
+        curriculum_agent_samples: int = 1,
+        curriculum_agent_qa_fast_model_name: str = None,
         critic_agent_model_name: str = "gpt-4",
         critic_agent_temperature: float = 0,
         critic_agent_mode: str = "auto",
+        critic_agent_samples: int = 1,
+        critic_agent_fast_model_name: str = None,
+        critic_agent_confidence_threshold: float = 0.8,
         skill_manager_model_name: str = "gpt-3.5-turbo",
         skill_manager_temperature: float = 0,
         skill_manager_retrieval_top_k: int = 5,
+        skill_manager_retrieval_mode: str = "hybrid",
+        skill_manager_item_prefilter: bool = True,
+        skill_manager_background_ingest: bool = True,
+        skill_manager_fast_model_name: str = None,
         openai_api_request_timeout: int = 240,
+        openai_api_streaming: bool = False,
+        openai_api_requests_per_minute: int = None,
+        openai_api_tokens_per_minute: int = None,
+        openai_api_max_concurrency: int = 8,
+        openai_api_hedge: bool = False,
+        openai_api_hedge_percentile: float = 95,
+        openai_api_hedge_budget: float = 0.1,
         ckpt_dir: str = "ckpt",
         skill_library_dir: str = None,
         resume: bool = False,
@@ -67,10 +87,17 @@ class Voyager:
         :param action_agent_model_name: action agent model name
         :param action_agent_temperature: action agent temperature
         :param action_agent_task_max_retries: how many times to retry if failed
+        :param action_agent_token_budget: max prompt tokens of the action agent, above it retrieved
+        skills are dropped from the least relevant one, then the nearby block list is capped.
+        None for no limit
+        :param action_agent_validate_programs: whether to check generated programs for undefined
+        functions and invalid item, block and mob names before running them in the env
         :param curriculum_agent_model_name: curriculum agent model name
         :param curriculum_agent_temperature: curriculum agent temperature
         :param curriculum_agent_qa_model_name: curriculum agent qa model name
         :param curriculum_agent_qa_temperature: curriculum agent qa temperature
+        :param curriculum_agent_qa_cache_similarity_threshold: max embedding distance for a question
+        to be answered from the qa cache
         :param curriculum_agent_warm_up: info will show in curriculum human message
         if completed task larger than the value in dict, available keys are:
         {
@@ -89,15 +116,48 @@ class Voyager:
         :param curriculum_agent_core_inventory_items: only show these items in inventory before optional_inventory_items
         reached in warm up
         :param curriculum_agent_mode: "auto" for automatic curriculum, "manual" for human curriculum
+        :param curriculum_agent_token_budget: max prompt tokens of the curriculum agent, above it
+        the completed and failed task lists are summarized, then the block lists are capped.
+        None for no limit
+        :param curriculum_agent_samples: how many task proposals to sample in one request,
+        the first one that parses is taken, so a bad response costs no extra request
+        :param curriculum_agent_qa_fast_model_name: model that answers qa questions first, the answer is
+        escalated to curriculum_agent_qa_model_name when it is missing or unknown. None to only use the qa model
         :param critic_agent_model_name: critic agent model name
         :param critic_agent_temperature: critic agent temperature
         :param critic_agent_mode: "auto" for automatic critic ,"manual" for human critic
+        :param critic_agent_samples: how many critiques to sample in one request, success is
+        decided by majority vote. Needs a temperature above 0 to differ
+        :param critic_agent_fast_model_name: model that checks task success first, the check is escalated
+        to critic_agent_model_name on parse failure, disagreement between samples or low confidence.
+        None to only use the critic model
+        :param critic_agent_confidence_threshold: confidence below which the fast critic is escalated
         :param skill_manager_model_name: skill manager model name
         :param skill_manager_temperature: skill manager temperature
         :param skill_manager_retrieval_top_k: how many skills to retrieve for each task
+        :param skill_manager_retrieval_mode: "hybrid" to fuse BM25 and vector scores, "vector" for vector only
+        :param skill_manager_item_prefilter: whether to restrict retrieval to skills handling the items
+        in the task and inventory
+        :param skill_manager_background_ingest: whether to describe, embed and persist new skills
+        on a background thread, new skill code is usable immediately either way
+        :param skill_manager_fast_model_name: model that describes skills first, the description is
+        escalated to skill_manager_model_name when it is not a single line. None to only use the skill model
         :param openai_api_request_timeout: how many seconds to wait for openai api
+        :param openai_api_streaming: whether to stream action, critic and curriculum responses and
+        stop generating once the code block, the critic json or the task line is complete
+        :param openai_api_requests_per_minute: requests per minute of all agents together, None for no limit.
+        The limits are shared by every Voyager of the process
+        :param openai_api_tokens_per_minute: prompt and completion tokens per minute of all agents together,
+        None for no limit
+        :param openai_api_max_concurrency: max openai requests in flight, also the connection pool size
+        :param openai_api_hedge: whether to send temperature 0 requests a second time when they are slow,
+        using the first response and cancelling the other
+        :param openai_api_hedge_percentile: percentile of the recent latencies of an agent and model
+        after which a request is sent again
+        :param openai_api_hedge_budget: max duplicate requests, as a fraction of the hedgeable requests
         :param ckpt_dir: checkpoint dir
-        :param skill_library_dir: skill library dir
+        :param skill_library_dir: skill library dir, either a ckpt dir or a packed library
+        written by SkillManager.pack, which is opened read-only
         :param resume: whether to resume from checkpoint
         """
         # init env
@@ -113,6 +173,19 @@ class Voyager:
 
         # set openai api key
         os.environ["OPENAI_API_KEY"] = openai_api_key
+        llm_client.configure(
+            requests_per_minute=openai_api_requests_per_minute,
+            tokens_per_minute=openai_api_tokens_per_minute,
+            max_concurrency=openai_api_max_concurrency,
+        )
+        llm_client.configure_hedging(
+            enabled=openai_api_hedge,
+            percentile=openai_api_hedge_percentile,
+            budget=openai_api_hedge_budget,
+        )
+
+        # all checkpoint files are written behind on a background thread
+        self.checkpoint = U.CheckpointManager(ckpt_dir=ckpt_dir)
 
         # init agents
         self.action_agent = ActionAgent(
@@ -123,6 +196,10 @@ class Voyager:
             resume=resume,
             chat_log=action_agent_show_chat_log,
             execution_error=action_agent_show_execution_error,
+            checkpoint=self.checkpoint,
+            token_budget=action_agent_token_budget,
+            validate_programs=action_agent_validate_programs,
+            streaming=openai_api_streaming,
         )
         self.action_agent_task_max_retries = action_agent_task_max_retries
         self.curriculum_agent = CurriculumAgent(
@@ -130,28 +207,45 @@ class Voyager:
             temperature=curriculum_agent_temperature,
             qa_model_name=curriculum_agent_qa_model_name,
             qa_temperature=curriculum_agent_qa_temperature,
+            qa_cache_similarity_threshold=curriculum_agent_qa_cache_similarity_threshold,
             request_timout=openai_api_request_timeout,
             ckpt_dir=ckpt_dir,
             resume=resume,
             mode=curriculum_agent_mode,
             warm_up=curriculum_agent_warm_up,
             core_inventory_items=curriculum_agent_core_inventory_items,
+            checkpoint=self.checkpoint,
+            token_budget=curriculum_agent_token_budget,
+            streaming=openai_api_streaming,
+            samples=curriculum_agent_samples,
+            qa_fast_model_name=curriculum_agent_qa_fast_model_name,
         )
         self.critic_agent = CriticAgent(
             model_name=critic_agent_model_name,
             temperature=critic_agent_temperature,
             request_timout=openai_api_request_timeout,
             mode=critic_agent_mode,
+            streaming=openai_api_streaming,
+            samples=critic_agent_samples,
+            fast_model_name=critic_agent_fast_model_name,
+            confidence_threshold=critic_agent_confidence_threshold,
         )
         self.skill_manager = SkillManager(
             model_name=skill_manager_model_name,
             temperature=skill_manager_temperature,
             retrieval_top_k=skill_manager_retrieval_top_k,
+            retrieval_mode=skill_manager_retrieval_mode,
             request_timout=openai_api_request_timeout,
             ckpt_dir=skill_library_dir if skill_library_dir else ckpt_dir,
             resume=True if resume or skill_library_dir else False,
+            background_ingest=skill_manager_background_ingest,
+            fast_model_name=skill_manager_fast_model_name,
+            checkpoint=self.checkpoint,
+        )
+        self.skill_manager_item_prefilter = skill_manager_item_prefilter
+        self.recorder = U.EventRecorder(
+            ckpt_dir=ckpt_dir, resume=resume, checkpoint=self.checkpoint
         )
-        self.recorder = U.EventRecorder(ckpt_dir=ckpt_dir, resume=resume)
         self.resume = resume
 
         # init variables for rollout
@@ -182,15 +276,22 @@ class Voyager:
             "bot.chat(`/time set ${getNextTime()}`);\n"
             + f"bot.chat('/difficulty {difficulty}');"
         )
-        skills = self.skill_manager.retrieve_skills(query=self.context)
+        skills = self.skill_manager.retrieve_skills(
+            query=self.context, items=self.retrieval_items(events)
+        )
         print(
             f"\033[33mRender Action Agent system message with {len(skills)} skills\033[0m"
         )
-        system_message = self.action_agent.render_system_message(skills=skills)
-        human_message = self.action_agent.render_human_message(
-            events=events, code="", task=self.task, context=context, critique=""
+        system_message, human_message = self.action_agent.render_messages(
+            skills=skills,
+            events=events,
+            code="",
+            task=self.task,
+            context=context,
+            critique="",
         )
         self.messages = [system_message, human_message]
+        self.last_events = events
         print(
             f"\033[32m****Action Agent human message****\n{human_message.content}\033[0m"
         )
@@ -198,27 +299,69 @@ class Voyager:
         self.conversations = []
         return self.messages
 
+    def token_usage(self):
+        """
+        Returns: calls, prompt and completion tokens and compactions per agent
+        over the whole run
+        """
+        return token_metrics.totals
+
+    def flush(self):
+        """
+        Wait for pending skills and checkpoint writes to reach the disk
+        """
+        self.skill_manager.flush()
+        self.curriculum_agent.save()
+        self.checkpoint.flush()
+
     def close(self):
+        self.flush()
         self.env.close()
 
+    def retrieval_items(self, events):
+        if not self.skill_manager_item_prefilter:
+            return None
+        items = self.skill_manager.items_in_text(f"{self.task}\n{self.context}")
+        items += list(U.parse_events(events).observation.inventory.keys())
+        return items
+
     def step(self):
         if self.action_agent_rollout_num_iter < 0:
             raise ValueError("Agent must be reset before stepping")
-        ai_message = self.action_agent.llm(self.messages)
+        ai_message = self.action_agent.llm(self.messages, stop_when=code_block_closed)
         print(f"\033[34m****Action Agent ai message****\n{ai_message.content}\033[0m")
         self.conversations.append(
             (self.messages[0].content, self.messages[1].content, ai_message.content)
         )
         parsed_result = self.action_agent.process_ai_message(message=ai_message)
         success = False
+        validation_critique = None
         if isinstance(parsed_result, dict):
+            validation_critique = self.action_agent.validate_program(
+                parsed_result, self.skill_manager.skill_names()
+            )
+        if validation_critique:
+            # feed the errors back without spending an env step and a critic
+            # call. Like an unparsable response below, it is recorded as an
+            # empty iteration, so max_iterations still bounds the attempts
+            self.recorder.record([], self.task)
+            print(f"\033[34m{validation_critique}\033[0m")
+            human_message = self.action_agent.render_human_message(
+                events=self.last_events,
+                code=parsed_result["program_code"],
+                task=self.task,
+                context=self.context,
+                critique=validation_critique,
+            )
+            self.messages = [self.messages[0], human_message]
+        elif isinstance(parsed_result, dict):
             code = parsed_result["program_code"] + "\n" + parsed_result["exec_code"]
             events = self.env.step(
                 code,
                 programs=self.skill_manager.programs,
             )
             self.recorder.record(events, self.task)
-            self.action_agent.update_chest_memory(events[-1][1]["nearbyChests"])
+            self.action_agent.update_chest_memory(events.observation.nearby_chests)
             success, critique = self.critic_agent.check_task_success(
                 events=events,
                 task=self.task,
@@ -231,32 +374,36 @@ class Voyager:
                 # revert all the placing event in the last step
                 blocks = []
                 positions = []
-                for event_type, event in events:
-                    if event_type == "onSave" and event["onSave"].endswith("_placed"):
-                        block = event["onSave"].split("_placed")[0]
-                        position = event["status"]["position"]
+                for observation in events.observations:
+                    if observation.event_type == "onSave" and observation.message.endswith(
+                        "_placed"
+                    ):
+                        block = observation.message.split("_placed")[0]
                         blocks.append(block)
-                        positions.append(position)
+                        positions.append(observation.position._asdict())
                 new_events = self.env.step(
                     f"await givePlacedItemBack(bot, {U.json_dumps(blocks)}, {U.json_dumps(positions)})",
                     programs=self.skill_manager.programs,
                 )
-                events[-1][1]["inventory"] = new_events[-1][1]["inventory"]
-                events[-1][1]["voxels"] = new_events[-1][1]["voxels"]
+                events = events.replace_observation(
+                    inventory=new_events.observation.inventory,
+                    voxels=new_events.observation.voxels,
+                )
             new_skills = self.skill_manager.retrieve_skills(
                 query=self.context
                 + "\n\n"
-                + self.action_agent.summarize_chatlog(events)
+                + self.action_agent.summarize_chatlog(events),
+                items=self.retrieval_items(events),
             )
-            system_message = self.action_agent.render_system_message(skills=new_skills)
-            human_message = self.action_agent.render_human_message(
+            system_message, human_message = self.action_agent.render_messages(
+                skills=new_skills,
                 events=events,
                 code=parsed_result["program_code"],
                 task=self.task,
                 context=self.context,
                 critique=critique,
             )
-            self.last_events = copy.deepcopy(events)
+            self.last_events = events
             self.messages = [system_message, human_message]
         else:
             assert isinstance(parsed_result, str)
@@ -272,6 +419,18 @@ class Voyager:
             "task": self.task,
             "success": success,
             "conversations": self.conversations,
+            # prompt rendering, llm tokens, llm requests and model routing
+            # since the previous step
+            "metrics": {
+                **U.render_metrics.pop(),
+                "tokens": token_metrics.pop(),
+                "lanes": llm_client.metrics.pop(),
+                "routing": route_metrics.pop(),
+                # programs that did not reach the env, unparsable or invalid
+                "rejected_programs": int(
+                    not isinstance(parsed_result, dict) or bool(validation_critique)
+                ),
+            },
         }
         if success:
             assert (
@@ -342,9 +501,9 @@ class Voyager:
                     options={
                         "mode": "hard",
                         "wait_ticks": self.env_wait_ticks,
-                        "inventory": self.last_events[-1][1]["inventory"],
-                        "equipment": self.last_events[-1][1]["status"]["equipment"],
-                        "position": self.last_events[-1][1]["status"]["position"],
+                        "inventory": self.last_events.observation.inventory,
+                        "equipment": self.last_events.observation.equipment,
+                        "position": self.last_events.observation.position._asdict(),
                     }
                 )
                 # use red color background to print the error
@@ -362,6 +521,7 @@ class Voyager:
                 f"\033[35mFailed tasks: {', '.join(self.curriculum_agent.failed_tasks)}\033[0m"
             )
 
+        self.flush()
         return {
             "completed_tasks": self.curriculum_agent.completed_tasks,
             "failed_tasks": self.curriculum_agent.failed_tasks,
@@ -391,6 +551,7 @@ class Voyager:
         )
         self.curriculum_agent.completed_tasks = []
         self.curriculum_agent.failed_tasks = []
+        self.curriculum_agent.clean_up_tasks()
         self.last_events = self.env.step("")
         while self.curriculum_agent.progress < len(sub_goals):
             next_task = sub_goals[self.curriculum_agent.progress]